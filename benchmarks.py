@@ -0,0 +1,511 @@
+"""
+==========
+Benchmarks
+==========
+
+Timings of the metadata build, metadata queries, data file parsing and
+figure construction, run against the bundled `data/` directory and against
+synthetically scaled copies of it.
+
+The benchmarks follow the conventions of airspeed velocity (asv): each class
+groups the `time_*` methods that are timed, `setup()` prepares their inputs
+outside of the timing, and `params` lists the parameter values that every
+method is timed with. `timeraw_*` methods return code that is timed in a new
+interpreter, such as imports. A `setup()` that raises NotImplementedError
+skips that combination of parameters. They may be run with asv, or
+directly::
+
+    python benchmarks.py --output benchmark-results.json
+
+which writes the timings, and the versions they were measured with, as JSON
+for trend tracking.
+
+Scaled inputs are made by repeating every assay of the metadata `scale`
+times, each with its own sample names and dataFile ids, and by repeating the
+rows of the RDF files. Synthetic data files of any size are written by
+`gen_scaled_ISA`.
+"""
+
+import argparse
+import copy
+import datetime
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import platform
+import runpy
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import shared_store
+from md_cache import load_compiled_metadata
+from md_query import Match
+from pdcsvref import maxime_rdf_csv, maxime_pws_csv, read_hash_header
+from utils import md_reader, fetch_dataframe_field_vals
+
+
+# The path of this directory, which holds `main.py`.
+APP_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# The number of times the bundled metadata is repeated in scaled inputs.
+SCALES = [1, 10, 100]
+
+# The number of times the rows of the bundled RDF files are repeated.
+ROW_SCALES = [1, 10, 100]
+
+# The number of rows of the synthetic data files.
+SYNTHETIC_ROWS = [200, 8000, 100000]
+
+# The searches passed to `md_reader`, from one that matches a single field
+# value to ones that match several, or nothing. A search dictionary only
+# matches single values, any one of several is matched by a query.
+SEARCH_DICTS = {
+    "rdf": {"annotationValue": "Simulated RDF"},
+    "raman": {"annotationValue": "cm-1"},
+    "species": {"termSource": "Aluminate Species"},
+    "multi": Match("annotationValue", ["Simulated RDF", "ppm", "cm-1"]),
+    "none": {"annotationValue": "Not present"},
+}
+
+# The fields found with `fetch_dataframe_field_vals`.
+FETCHED_FIELDS = ["annotationValue", "name", "dataFiles"]
+
+# The number of samples selected when the figure is built.
+SELECTION_SIZES = [1, 4, 16, 64]
+
+# The prefixes of the benchmark methods. `time_` methods are timed, while
+# `timeraw_` methods return code that is timed in a new interpreter.
+BENCHMARK_PREFIXES = ("time_", "timeraw_")
+
+_METADATA = None
+
+
+def bundled_metadata():
+    """Returns the compiled metadata of the bundled data directory."""
+    global _METADATA
+    if _METADATA is None:
+        _METADATA = load_compiled_metadata(shared_store.DATA_PATH)
+    return _METADATA
+
+
+def scale_metadata(metadata, scale):
+    """
+    Returns a copy of `metadata` in which every assay is repeated `scale`
+    times. The sample names and dataFile ids of each repeat are made unique,
+    while the dataFiles still name the same files.
+
+    :param metadata: An ISA metadata dictionary.
+    :param scale: The number of copies of each assay.
+    """
+    scaled = copy.deepcopy(metadata)
+    for study in scaled["studies"]:
+        assays = list()
+        for assay in study["assays"]:
+            for repeat in range(scale):
+                new_assay = copy.deepcopy(assay)
+                if repeat:
+                    suffix = " #{}".format(repeat)
+                    for sample in new_assay["materials"]["samples"]:
+                        sample["name"] += suffix
+                    for data_file in new_assay["dataFiles"]:
+                        data_file["@id"] += suffix
+                assays.append(new_assay)
+        study["assays"] = assays
+    return scaled
+
+
+def all_assays(metadata):
+    """Returns a list of every assay of `metadata`."""
+    return [assay for study in metadata["studies"]
+            for assay in study["assays"]]
+
+
+def write_scaled_rdf(path, out_path, scale):
+    """
+    Writes the RDF file at `path` to `out_path` with its rows repeated
+    `scale` times. The `r` column of each repeat continues from the last.
+
+    :returns: `out_path`.
+    """
+    df = maxime_rdf_csv(path)
+    step = df["r"].iloc[-1] - df["r"].iloc[0] + df["r"].diff().median()
+    scaled = pd.concat(
+        [df.assign(r=df["r"] + repeat * step) for repeat in range(scale)])
+    with open(out_path, "w") as out_file:
+        out_file.write("# " + " ".join(read_hash_header(path)) + "\n")
+        scaled.to_csv(out_file, sep=" ", header=False, index=False,
+                      float_format="%.4f")
+    return out_path
+
+
+def require_isatools():
+    """Raises NotImplementedError, which skips the benchmark, if isatools is
+    not installed."""
+    try:
+        import isatools  # noqa: F401
+    except ImportError:
+        raise NotImplementedError("isatools is not installed.")
+
+
+def bundled_rdf_files():
+    """Returns the names of the RDF files of the bundled data directory."""
+    return sorted(name for name in os.listdir(shared_store.DATA_PATH)
+                  if name.endswith(".RDF"))
+
+
+class ImportTime(object):
+    """The time taken to import the serving modules in a new interpreter.
+    Serving from compiled metadata should not import isatools."""
+
+    def timeraw_import_shared_store(self):
+        return "import shared_store"
+
+
+class ImportGenerateISA(object):
+    """The time taken to import `generateISA`, and isatools, in a new
+    interpreter."""
+
+    def setup(self):
+        require_isatools()
+
+    def timeraw_import_generateISA(self):
+        return "import generateISA"
+
+
+class CreateMetadata(object):
+    """The build of the ISA metadata of the bundled data directory."""
+
+    def setup(self):
+        require_isatools()
+        from generateISA import create_metadata
+        self.create_metadata = create_metadata
+
+    def time_create_metadata(self):
+        self.create_metadata(shared_store.DATA_PATH)
+
+
+class LoadMetadata(object):
+    """The parse of the metadata JSON document."""
+
+    params = [SCALES]
+    param_names = ["scale"]
+
+    def setup(self, scale):
+        self.text = json.dumps(scale_metadata(bundled_metadata(), scale))
+
+    def time_json_loads(self, scale):
+        json.loads(self.text)
+
+
+class ReadMetadata(object):
+    """The search of the metadata for the dataFiles of matching assays."""
+
+    params = [SCALES, list(SEARCH_DICTS)]
+    param_names = ["scale", "search"]
+
+    def setup(self, scale, search):
+        self.metadata = scale_metadata(bundled_metadata(), scale)
+        self.search_dict = SEARCH_DICTS[search]
+        # Build the index, which is then reused, outside of the timing.
+        md_reader(self.metadata, self.search_dict)
+
+    def time_md_reader(self, scale, search):
+        md_reader(self.metadata, self.search_dict)
+
+    def time_md_reader_scan(self, scale, search):
+        md_reader(self.metadata, self.search_dict, use_index=False)
+
+
+class FetchFieldValues(object):
+    """The recursive search of every assay for the values of a field."""
+
+    params = [SCALES, FETCHED_FIELDS]
+    param_names = ["scale", "field"]
+
+    def setup(self, scale, field):
+        self.assays = all_assays(
+            scale_metadata(bundled_metadata(), scale))
+
+    def time_fetch_dataframe_field_vals(self, scale, field):
+        for assay in self.assays:
+            fetch_dataframe_field_vals(assay, field)
+
+
+class ReadRDF(object):
+    """The parse of a single RDF file."""
+
+    params = [bundled_rdf_files(), ROW_SCALES]
+    param_names = ["file", "row_scale"]
+
+    def setup(self, file, row_scale):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = write_scaled_rdf(
+            os.path.join(shared_store.DATA_PATH, file),
+            os.path.join(self.temp_dir, file),
+            row_scale)
+
+    def teardown(self, file, row_scale):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def time_maxime_rdf_csv(self, file, row_scale):
+        maxime_rdf_csv(self.path)
+
+
+class ReadSyntheticFiles(object):
+    """The parse of synthetic RDF and power spectrum files, written by
+    `gen_scaled_ISA`, of growing numbers of rows."""
+
+    params = [SYNTHETIC_ROWS, ["RDF", "PWS"]]
+    param_names = ["rows", "kind"]
+
+    def setup(self, rows, kind):
+        import gen_scaled_ISA
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "synthetic." + kind)
+        rng = np.random.default_rng(0)
+        bonds = gen_scaled_ISA.bond_names(2)
+        if kind == "RDF":
+            gen_scaled_ISA.write_rdf_file(self.path, rows, bonds, rng)
+            self.reader = maxime_rdf_csv
+        else:
+            gen_scaled_ISA.write_pws_file(
+                self.path, rows, [bond + "_stretch" for bond in bonds], rng)
+            self.reader = functools.partial(maxime_pws_csv, sidecar=False)
+
+    def teardown(self, rows, kind):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def time_read(self, rows, kind):
+        self.reader(self.path)
+
+
+class BuildFigure(object):
+    """
+    The creation of the figure of a session and its renderers for a
+    selection of samples and every one of their bonds, with and without the
+    view of the selection memoized by an earlier session.
+    """
+
+    params = [SELECTION_SIZES, ["per-sample", "batched"]]
+    param_names = ["samples", "render_mode"]
+
+    def setup(self, samples, render_mode):
+        scale = -(-samples // 4)
+        metadata = scale_metadata(bundled_metadata(), scale)
+        self.previous_store = shared_store._STORE
+        self.previous_mode = os.environ.get("ALBOKEH_RENDER_MODE")
+        store = shared_store.init_store(metadata=metadata)
+        if len(store.samples) < samples:
+            self.teardown(samples, render_mode)
+            raise NotImplementedError(
+                "Only {} samples are available.".format(len(store.samples)))
+
+        os.environ["ALBOKEH_RENDER_MODE"] = render_mode
+        self.app = run_app()
+        self.selection = list(store.samples[:samples])
+        # Load the frames outside of the timing.
+        for sample in self.selection:
+            store.frame(sample)
+        self.bonds = store.available_bonds(self.selection)
+        self.build()
+
+    def teardown(self, samples, render_mode):
+        # Restore the store and the render mode of the process.
+        with shared_store._STORE_LOCK:
+            shared_store._STORE = self.previous_store
+        if self.previous_mode is None:
+            os.environ.pop("ALBOKEH_RENDER_MODE", None)
+        else:
+            os.environ["ALBOKEH_RENDER_MODE"] = self.previous_mode
+
+    def build(self):
+        """Builds the figure of a new session for the selection."""
+        app = self.app
+        for held in ("FIGURE_SOURCES", "FIGURE_RENDERERS", "BATCHED_SAMPLES",
+                     "FIGURE_LOD", "LOD_SENT_INDICES"):
+            app[held].clear()
+        app["FIGURE"] = app["create_figure"]()
+        app["DATAFRAME_SEL"].value = self.selection
+        app["BOND_SEL"].value = self.bonds
+        app["update_figure"]()
+
+    def time_create_figure(self, samples, render_mode):
+        self.app["SELECTION_CACHE"].clear()
+        self.build()
+
+    def time_create_figure_memoized(self, samples, render_mode):
+        # The view of the selection is held from an earlier session.
+        self.build()
+
+
+def run_app():
+    """Executes `main.py` for a new document and returns its namespace."""
+    from bokeh.document import Document
+    from bokeh.io.state import curstate
+
+    curstate().document = Document()
+    if APP_PATH not in sys.path:
+        sys.path.insert(0, APP_PATH)
+    namespace = runpy.run_path(
+        os.path.join(APP_PATH, "main.py"), run_name="benchmark")
+    # run_path returns a copy of the globals, the functions of the app use
+    # the originals.
+    return inspect.unwrap(namespace["create_figure"]).__globals__
+
+
+def benchmark_classes():
+    """Returns the benchmark classes of this module, in definition order."""
+    module = sys.modules[__name__]
+    return [value for value in vars(module).values()
+            if isinstance(value, type)
+            and any(name.startswith(BENCHMARK_PREFIXES)
+                    for name in vars(value))]
+
+
+def _statistics(rounds, number):
+    """Returns a dictionary of the statistics of the times of `rounds`."""
+    return dict(
+        number=number,
+        rounds=len(rounds),
+        min=min(rounds),
+        median=statistics.median(rounds),
+        mean=statistics.mean(rounds),
+        stdev=statistics.stdev(rounds) if len(rounds) > 1 else 0.0)
+
+
+def time_raw(code, repeat=5):
+    """
+    Times `code` once in each of `repeat` new interpreters, started within
+    this directory, so that imports are not already cached.
+
+    :returns: A dictionary of the statistics of the time taken.
+    """
+    script = ("import time\n"
+              "start = time.perf_counter()\n"
+              "exec({!r})\n"
+              "print(time.perf_counter() - start)\n").format(code)
+    rounds = [float(subprocess.check_output(
+        [sys.executable, "-c", script], cwd=APP_PATH).decode().split()[-1])
+        for _ in range(repeat)]
+    return _statistics(rounds, 1)
+
+
+def time_call(func, repeat=5, min_time=0.2):
+    """
+    Times `func`, calling it enough times per round to take `min_time`
+    seconds, for `repeat` rounds.
+
+    :returns: A dictionary of the statistics of the time per call.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    rounds = [seconds / number for seconds in timer.repeat(repeat, number)]
+    return _statistics(rounds, number)
+
+
+def run_benchmarks(pattern=None, repeat=5, min_time=0.2):
+    """
+    Runs every benchmark, or those whose name contains `pattern`.
+
+    :returns: A list of result dictionaries, one per benchmark and
+        combination of parameters.
+    """
+    results = list()
+    for cls in benchmark_classes():
+        params = getattr(cls, "params", [])
+        param_names = getattr(cls, "param_names", [])
+        methods = sorted(name for name in vars(cls)
+                         if name.startswith(BENCHMARK_PREFIXES))
+
+        for values in itertools.product(*params):
+            for method in methods:
+                name = "{}.{}".format(cls.__name__, method)
+                if pattern and pattern not in name:
+                    continue
+                result = dict(name=name,
+                              params=dict(zip(param_names, values)))
+                instance = cls()
+                try:
+                    if hasattr(instance, "setup"):
+                        instance.setup(*values)
+                except NotImplementedError as err:
+                    result["skipped"] = str(err)
+                    results.append(result)
+                    continue
+                try:
+                    bound = getattr(instance, method)
+                    if method.startswith("timeraw_"):
+                        result.update(time_raw(bound(*values), repeat))
+                    else:
+                        result.update(time_call(
+                            lambda: bound(*values), repeat, min_time))
+                finally:
+                    if hasattr(instance, "teardown"):
+                        instance.teardown(*values)
+                logging.info("%s %s: %.6f s", name, result["params"],
+                             result["median"])
+                results.append(result)
+    return results
+
+
+def environment():
+    """Returns a description of the environment the timings were made in."""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=APP_PATH,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import bokeh
+    return dict(
+        created=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        commit=commit,
+        machine=platform.node(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        pandas=pd.__version__,
+        bokeh=bokeh.__version__)
+
+
+def main():
+    """Runs the benchmarks and writes their results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--output", default="-",
+                        help="The JSON file to write, or - for stdout.")
+    parser.add_argument("--filter", default=None,
+                        help="Only run benchmarks whose name contains this.")
+    parser.add_argument("--scale", type=int, action="append",
+                        help="A metadata scale, may be given more than once.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.scale:
+        for cls in (LoadMetadata, ReadMetadata, FetchFieldValues):
+            cls.params = [args.scale] + cls.params[1:]
+
+    report = dict(environment=environment(),
+                  results=run_benchmarks(args.filter, args.repeat,
+                                         args.min_time))
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as out_file:
+            out_file.write(text)
+
+
+if __name__ == '__main__':
+    main()
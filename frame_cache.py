@@ -0,0 +1,195 @@
+"""
+========================
+Columnar Dataframe Cache
+========================
+
+A binary, columnar on-disk cache of the dataframes parsed from the data
+files registered in the ISA document. Each parsed frame is stored as one
+`.npy` file per column, together with a small `meta.json` describing the
+columns, so that later loads only have to map the columns back into memory:
+
+- Numeric columns are memory-mapped, no data is read or copied until used,
+  and the pages are shared by every process loading the same file.
+- String columns are stored as fixed width unicode arrays.
+- Categorical columns are stored as their codes, with the categories kept in
+  `meta.json`.
+
+An entry is keyed by the absolute path, size and mtime of the source file,
+along with the ISA type and settings of the reader that parsed it. A change
+to any of these gives a new key, so the file is parsed again and the stale
+entry for that path is removed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from md_cache import cache_dir
+
+
+# Increment to invalidate every existing entry when the layout changes.
+CACHE_FORMAT_VERSION = 1
+
+# The name of the sub-directory of the cache directory that holds frames.
+FRAME_CACHE_DIRNAME = "frames"
+
+
+def frame_cache_dir(path):
+    """
+    Returns the directory in which the frame parsed from `path` is cached.
+
+    :param path: The path of the source data file.
+    """
+    data_path = os.path.dirname(os.path.abspath(path))
+    return os.path.join(cache_dir(data_path), FRAME_CACHE_DIRNAME)
+
+
+def frame_cache_key(path, reader_type, reader_key=None):
+    """
+    Returns the name of the cache entry of `path` as parsed by the reader of
+    `reader_type`. The name starts with a digest of the path alone, which is
+    shared by every version of that file's entry.
+
+    :param path: The path of the source data file.
+    :param reader_type: The ISA dataFile type of the reader.
+    :param reader_key: A string describing the reader's settings, such as
+        its declared dtypes, so that changing them invalidates the entry.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key_src = json.dumps([path, stat.st_size, stat.st_mtime_ns,
+                          reader_type, reader_key, CACHE_FORMAT_VERSION])
+    return "{}-{}".format(
+        hashlib.sha1(path.encode("utf-8")).hexdigest()[:16],
+        hashlib.sha1(key_src.encode("utf-8")).hexdigest()[:16])
+
+
+def _is_string_column(series):
+    """Returns True if `series` is stored as a column of strings."""
+    return (not isinstance(series.dtype, pd.CategoricalDtype)
+            and series.dtype.kind not in "biufcmM")
+
+
+def _is_cacheable(df):
+    """Only frames with a default index, unique string column names and no
+    missing strings can be stored."""
+    return (isinstance(df.index, pd.RangeIndex)
+            and df.index.start == 0 and df.index.step == 1
+            and df.columns.is_unique
+            and all(isinstance(name, str) for name in df.columns)
+            and not any(df[name].isna().any() for name in df.columns
+                        if _is_string_column(df[name])))
+
+
+def _write_entry(entry_path, df):
+    """Writes the columns of `df` and their description to `entry_path`."""
+    columns = list()
+    for idx, name in enumerate(df.columns):
+        series = df[name]
+        file_name = "c{}.npy".format(idx)
+        column = dict(name=name, file=file_name)
+
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            column["kind"] = "category"
+            column["categories"] = [str(x) for x in series.cat.categories]
+            values = series.cat.codes.to_numpy()
+        elif _is_string_column(series):
+            column["kind"] = "string"
+            column["dtype"] = str(series.dtype)
+            values = series.to_numpy(dtype=str)
+        else:
+            column["kind"] = "numeric"
+            values = series.to_numpy()
+
+        np.save(os.path.join(entry_path, file_name), values,
+                allow_pickle=False)
+        columns.append(column)
+
+    with open(os.path.join(entry_path, "meta.json"), "w") as meta_file:
+        json.dump(dict(columns=columns, length=len(df)), meta_file)
+
+
+def _read_entry(entry_path):
+    """Maps the columns stored in `entry_path` back into a dataframe."""
+    with open(os.path.join(entry_path, "meta.json"), "r") as meta_file:
+        meta = json.load(meta_file)
+
+    data = dict()
+    for column in meta["columns"]:
+        file_path = os.path.join(entry_path, column["file"])
+        if column["kind"] == "numeric":
+            data[column["name"]] = np.load(file_path, mmap_mode='r')
+        elif column["kind"] == "category":
+            data[column["name"]] = pd.Categorical.from_codes(
+                np.load(file_path), categories=column["categories"])
+        else:
+            # A Series keeps the stored dtype, where a bare array of objects
+            # would be inferred as strings by newer versions of pandas.
+            data[column["name"]] = pd.Series(
+                np.load(file_path).astype(object), dtype=column["dtype"])
+
+    return pd.DataFrame(data, columns=[c["name"] for c in meta["columns"]],
+                        copy=False)
+
+
+def _remove_stale(directory, key):
+    """Removes older entries that share the path digest of `key`."""
+    prefix = key.split("-")[0] + "-"
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name != key:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def cached_frame(path, reader_type, reader, reader_key=None):
+    """
+    Returns the dataframe of `path`, read from the cache if a current entry
+    exists, otherwise parsed by `reader` and stored in the cache. Failing to
+    read or write the cache is logged, and the parsed frame is returned.
+
+    :param path: The path of the source data file.
+    :param reader_type: The ISA dataFile type, which identifies `reader`.
+    :param reader: A function that takes `path=` and returns a dataframe.
+    :param reader_key: A string describing the reader's settings, see
+        `frame_cache_key()`.
+    """
+    try:
+        key = frame_cache_key(path, reader_type, reader_key)
+    except OSError:
+        # Let the reader raise the appropriate error for a missing file.
+        return reader(path=path)
+
+    directory = frame_cache_dir(path)
+    entry_path = os.path.join(directory, key)
+
+    if os.path.isdir(entry_path):
+        try:
+            return _read_entry(entry_path)
+        except (OSError, ValueError, KeyError) as err:
+            logging.warning("Discarding the cache entry %s: %s",
+                            entry_path, err)
+            shutil.rmtree(entry_path, ignore_errors=True)
+
+    df = reader(path=path)
+    if not _is_cacheable(df):
+        return df
+
+    tmp_path = "{}.{}.tmp".format(entry_path, os.getpid())
+    try:
+        os.makedirs(tmp_path, exist_ok=True)
+        _write_entry(tmp_path, df)
+        os.rename(tmp_path, entry_path)
+        _remove_stale(directory, key)
+    except OSError as err:
+        # Another process may have written the same entry first.
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(entry_path):
+            logging.warning("Unable to write the cache entry %s: %s",
+                            entry_path, err)
+        return df
+
+    return _read_entry(entry_path)
@@ -0,0 +1,156 @@
+"""
+=====================
+Bounded Frame Storage
+=====================
+
+A least recently used store of loaded dataframes. Frames are loaded the first
+time they are requested, and the least recently used frames are evicted once
+either the number of frames or their total size exceeds its bound.
+
+The hit, miss and eviction counts are kept so that the bounds can be tuned.
+"""
+
+import collections
+import threading
+
+
+def frame_nbytes(df):
+    """
+    Returns the size of a dataframe in bytes, including the contents of any
+    string columns.
+
+    :param df: A pandas dataframe.
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class LRUFrameStore(object):
+    """
+    A size-bounded least recently used store of dataframes.
+
+    :param loader: A function that takes a key and returns its dataframe,
+        or None if a loader is given to each call of `get()`.
+    :param max_items: The maximum number of frames to hold, or None.
+    :param max_bytes: The maximum total size of the held frames, or None.
+        The most recently used frame is always held, even if it alone is
+        larger than this bound.
+    :param sizeof: A function that returns the size of a frame in bytes.
+    """
+
+    def __init__(self, loader, max_items=None, max_bytes=None,
+                 sizeof=frame_nbytes):
+        self.loader = loader
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._frames = collections.OrderedDict()
+        self._sizes = dict()
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames)
+
+    def keys(self):
+        """Returns a list of the keys held, least recently used first."""
+        with self._lock:
+            return list(self._frames)
+
+    def get(self, key, loader=None):
+        """
+        Returns the frame of `key`, loading it if it is not held. The loader
+        is called without the store locked, so the same frame may be loaded
+        twice by concurrent callers, in which case the first one is kept.
+
+        :param key: The key passed to the loader.
+        :param loader: The loader of this frame, instead of the loader of the
+            store.
+        """
+        with self._lock:
+            if key in self._frames:
+                self.hits += 1
+                self._frames.move_to_end(key)
+                return self._frames[key]
+            self.misses += 1
+
+        frame = (self.loader if loader is None else loader)(key)
+
+        with self._lock:
+            if key in self._frames:
+                return self._frames[key]
+            self._insert(key, frame)
+        return frame
+
+    def put(self, key, frame):
+        """
+        Holds `frame` as the value of `key`, replacing any held frame.
+
+        :param key: The key of the frame.
+        :param frame: A pandas dataframe.
+        """
+        with self._lock:
+            self._discard(key)
+            self._insert(key, frame)
+
+    def invalidate(self, key):
+        """
+        Stops holding the frame of `key`, so that it is loaded again when it
+        is next requested.
+
+        :returns: True if a frame was held.
+        """
+        with self._lock:
+            return self._discard(key)
+
+    def clear(self):
+        """Stops holding every frame. The counters are kept."""
+        with self._lock:
+            self._frames.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        """Returns a dictionary of the counters and the current usage."""
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                items=len(self._frames),
+                bytes=self._total_bytes)
+
+    def _insert(self, key, frame):
+        """Adds a frame and evicts others until the bounds are met."""
+        size = self.sizeof(frame)
+        self._frames[key] = frame
+        self._sizes[key] = size
+        self._total_bytes += size
+
+        while len(self._frames) > 1 and self._over_bounds():
+            oldest = next(iter(self._frames))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def _over_bounds(self):
+        if self.max_items is not None and len(self._frames) > self.max_items:
+            return True
+        if self.max_bytes is not None and self._total_bytes > self.max_bytes:
+            return True
+        return False
+
+    def _discard(self, key):
+        if key not in self._frames:
+            return False
+        del self._frames[key]
+        self._total_bytes -= self._sizes.pop(key)
+        return True
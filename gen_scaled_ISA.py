@@ -0,0 +1,316 @@
+"""
+=====================
+Scaled ISA Generation
+=====================
+
+Generates synthetic ISA documents, and the data files they describe, of any
+size for load testing. The documents have the layout of those built by
+`generateISA.create_metadata`:
+
+- Each study holds a number of simulated RDF assays, each with its samples,
+  its bonds as "Inter-atom distances" characteristic categories and one
+  `*.RDF` data file.
+- Each study also holds a vibrational spectrum assay, with one `*.PWS` data
+  file per RDF assay.
+
+The data files are written in the on-disk formats of the real simulation
+output, so they are read by the same readers in `pdcsvref`. Their values are
+smooth random curves, seeded so that the same arguments give the same files.
+
+For example, to generate ten times the bundled RDF data::
+
+    python gen_scaled_ISA.py --studies 1 --assays 40 scaled_data
+
+The document is written to `scaled_data/metadata.json`, and may be served by
+pointing the `ALBOKEH_METADATA_PATH` and `ALBOKEH_DATA_PATH` environment
+variables at it and its directory.
+
+isatools is only imported to build the document, so the data files can be
+written without it.
+"""
+
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+
+# The spacing of the `r` column of the real RDF files, in angstroms.
+RDF_STEP = 0.02
+
+# The range of the `wavenb` column of the real power spectra, in cm-1.
+PWS_MAX_WAVENUMBER = 4500.0
+
+
+def bond_names(n_bonds):
+    """
+    Returns `n_bonds` bond names, starting with those of the real data.
+
+    :param n_bonds: The number of bonds.
+    """
+    names = ["Al-Ob", "Al-Oh"]
+    names += ["Al-O{}".format(idx) for idx in range(len(names), n_bonds)]
+    return names[:n_bonds]
+
+
+def _fortran_exponent_format(values):
+    """Formats values as Fortran does, with a mantissa below one, such as
+    `0.340497548E-05`."""
+    values = np.asarray(values, dtype=np.float64)
+    exponents = np.where(
+        values == 0, 0,
+        np.floor(np.log10(np.abs(np.where(values == 0, 1, values)))) + 1)
+    mantissas = values / 10.0 ** exponents
+    return ["{:.9f}E{:+03d}".format(mantissa, int(exponent))
+            for mantissa, exponent in zip(mantissas, exponents)]
+
+
+def synthetic_rdf(n_rows, n_bonds, rng):
+    """
+    Returns the `r` values and the RDF and running coordination number
+    (RCN) curves of `n_bonds` bonds. Each RDF is zero at short range, has
+    two peaks and tends to one.
+
+    :param n_rows: The number of `r` values.
+    :param n_bonds: The number of bonds.
+    :param rng: A numpy random generator.
+    """
+    r = np.arange(n_rows) * RDF_STEP
+    rdfs, rcns = list(), list()
+    for _ in range(n_bonds):
+        first = rng.uniform(1.7, 2.1)
+        second = first + rng.uniform(1.0, 1.6)
+        rdf = (rng.uniform(5, 15) * np.exp(-((r - first) / 0.06) ** 2)
+               + rng.uniform(1, 3) * np.exp(-((r - second) / 0.2) ** 2)
+               + 1 / (1 + np.exp(-(r - second) / 0.15)))
+        rdf[r < first - 0.4] = 0
+        # The running coordination number integrates 4 pi r^2 rho g(r).
+        density = rng.uniform(0.02, 0.05)
+        shell = 4 * np.pi * density * r ** 2 * rdf
+        rcn = np.concatenate(
+            [[0], np.cumsum((shell[1:] + shell[:-1]) / 2 * RDF_STEP)])
+        rdfs.append(rdf)
+        rcns.append(rcn)
+    return r, rdfs, rcns
+
+
+def write_rdf_file(path, n_rows, bonds, rng):
+    """
+    Writes a synthetic RDF file in the format of Maxime's `d*.RDF` files.
+
+    :param path: The path of the file to write.
+    :param n_rows: The number of rows.
+    :param bonds: The names of the bonds.
+    :param rng: A numpy random generator.
+    """
+    r, rdfs, rcns = synthetic_rdf(n_rows, len(bonds), rng)
+    header = ["r"] + ["RDF_" + bond for bond in bonds] \
+        + ["RCN_" + bond for bond in bonds]
+    table = np.column_stack([r] + rdfs + rcns)
+    with open(path, "w") as out_file:
+        out_file.write("# " + "   ".join(header) + "\n")
+        np.savetxt(out_file, table,
+                   fmt=["%8.4f"] + ["%12.4f"] * (table.shape[1] - 1))
+
+
+def write_pws_file(path, n_rows, modes, rng):
+    """
+    Writes a synthetic power spectrum in the format of Maxime's `d*.PWS`
+    files, with Fortran formatted exponents.
+
+    :param path: The path of the file to write.
+    :param n_rows: The number of rows.
+    :param modes: The names of the spectra, such as "Al-Ob_stretch".
+    :param rng: A numpy random generator.
+    """
+    wavenumbers = np.linspace(0, PWS_MAX_WAVENUMBER, n_rows)
+    spectra = list()
+    for _ in modes:
+        spectrum = np.full(n_rows, rng.uniform(1e-6, 5e-6))
+        for center in rng.uniform(100, PWS_MAX_WAVENUMBER - 100, 6):
+            width = rng.uniform(10, 60)
+            spectrum += rng.uniform(1e-6, 2e-5) / (
+                1 + ((wavenumbers - center) / width) ** 2)
+        spectra.append(_fortran_exponent_format(spectrum))
+
+    with open(path, "w") as out_file:
+        out_file.write("#   wavenb" + "".join(
+            "{:>22}".format(mode) for mode in modes) + "\n")
+        for idx, wavenumber in enumerate(wavenumbers):
+            out_file.write("{:10.4f}".format(wavenumber) + "".join(
+                "{:>22}".format(spectrum[idx]) for spectrum in spectra)
+                + "\n")
+
+
+def create_scaled_metadata(data_path, studies=1, assays=4, samples=1,
+                           categories=2, rdf_rows=200, pws_rows=8000,
+                           write_files=True, seed=0):
+    """
+    Returns a synthetic ISA-JSON document, and writes the data files it
+    describes to `data_path`.
+
+    :param data_path: The directory the data files are written to.
+    :param studies: The number of studies.
+    :param assays: The number of RDF assays of each study.
+    :param samples: The number of samples of each RDF assay.
+    :param categories: The number of bonds, and so characteristic
+        categories, of each RDF assay.
+    :param rdf_rows: The number of rows of each `*.RDF` file.
+    :param pws_rows: The number of rows of each `*.PWS` file, or 0 for none.
+    :param write_files: If False only the document is generated.
+    :param seed: The seed of the random data.
+    """
+    from isatools.model import Assay, Investigation, OntologyAnnotation, \
+        OntologySource, Sample, Source, Study
+    from isatools.isajson import ISAJSONEncoder
+    from generateISA import MaximeRDF, MaximeVib
+
+    def join_path(filename):
+        file_path = os.path.join(data_path, filename)
+        return file_path
+
+    rng = np.random.default_rng(seed)
+    if write_files:
+        os.makedirs(data_path, exist_ok=True)
+
+    """
+    Ontology Sources
+    """
+    raman = OntologySource(name='Raman Spectroscopy')
+    simulation = OntologySource(name="Simulated Data")
+    aluminate = OntologySource(name="Aluminate Species")
+    inter_atom_distance = OntologySource(name="Inter-atom distances")
+
+    """
+    Ontology Annotations
+    """
+    raman_peak = OntologyAnnotation(term='cm-1', term_source=raman)
+    raman_spectra = OntologyAnnotation(term='raman spectra', term_source=raman)
+    simulated_rdf = OntologyAnnotation(
+        term='Simulated RDF', term_source=simulation)
+    angstrom_interatom = OntologyAnnotation(
+        term='Angstroms',
+        term_source=inter_atom_distance)
+
+    bonds = bond_names(categories)
+    distances = [OntologyAnnotation(term=bond,
+                                    term_source=inter_atom_distance)
+                 for bond in bonds]
+    modes = [bond + "_stretch" for bond in bonds]
+
+    all_studies = list()
+    for study_idx in range(studies):
+        simulated_source = Source(name="Simulated Material")
+        rdf_assays = list()
+        pws_files = list()
+
+        for assay_idx in range(assays):
+            stem = "s{}a{}".format(study_idx, assay_idx)
+            assay_samples = [
+                Sample(name="Synthetic species {}-{}".format(stem, idx))
+                for idx in range(samples)]
+            species = OntologyAnnotation(
+                term=assay_samples[0].name,
+                term_source=aluminate)
+
+            rdf_path = join_path(stem + ".RDF")
+            if write_files:
+                write_rdf_file(rdf_path, rdf_rows, bonds, rng)
+
+            rdf_assays.append(Assay(
+                measurement_type=simulated_rdf,
+                technology_type=simulated_rdf,
+                technology_platform='Synthetic',
+                units=[angstrom_interatom],
+                characteristic_categories=[species, simulated_rdf]
+                + distances,
+                data_files=[MaximeRDF(filename=rdf_path)],
+                samples=assay_samples,
+            ))
+
+            if pws_rows:
+                pws_path = join_path(stem + ".PWS")
+                if write_files:
+                    write_pws_file(pws_path, pws_rows, modes, rng)
+                pws_files.append(MaximeVib(filename=pws_path))
+
+        study_assays = list(rdf_assays)
+        if pws_files:
+            study_assays.append(Assay(
+                measurement_type=raman_peak,
+                technology_type=raman_spectra,
+                technology_platform='Synthetic',
+                units=[raman_peak],
+                data_files=pws_files,
+            ))
+
+        all_studies.append(Study(
+            identifier="synthetic_study_{}".format(study_idx),
+            title="Synthetic study {}".format(study_idx),
+            description="Synthetic RDFs and power spectra for load testing.",
+            sources=[simulated_source],
+            assays=study_assays,
+        ))
+
+    inv = Investigation(
+        identifier='synthetic_investigation',
+        title='Synthetic Aluminate Investigation',
+        description='A synthetic investigation for load testing.',
+        ontology_source_references=[
+            raman, simulation, aluminate, inter_atom_distance],
+        studies=all_studies,
+    )
+
+    metadata_json = json.dumps(
+        inv,
+        cls=ISAJSONEncoder,
+        sort_keys=True,
+        indent=4,
+        separators=(',', ':')
+    )
+
+    return metadata_json
+
+
+def main():
+    """Writes a synthetic document and its data files to a directory."""
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic ISA document and data files.")
+    parser.add_argument("data_path",
+                        help="The directory to write the data files to.")
+    parser.add_argument("--metadata", default=None,
+                        help="The document path, defaults to "
+                             "<data_path>/metadata.json.")
+    parser.add_argument("--studies", type=int, default=1)
+    parser.add_argument("--assays", type=int, default=4,
+                        help="The number of RDF assays of each study.")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="The number of samples of each assay.")
+    parser.add_argument("--categories", type=int, default=2,
+                        help="The number of bonds of each assay.")
+    parser.add_argument("--rdf-rows", type=int, default=200)
+    parser.add_argument("--pws-rows", type=int, default=8000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data_path = os.path.abspath(args.data_path)
+    metadata = create_scaled_metadata(
+        data_path,
+        studies=args.studies,
+        assays=args.assays,
+        samples=args.samples,
+        categories=args.categories,
+        rdf_rows=args.rdf_rows,
+        pws_rows=args.pws_rows,
+        seed=args.seed)
+
+    path = args.metadata or os.path.join(data_path, 'metadata.json')
+    with open(path, 'w') as f:
+        f.write(metadata)
+    logging.info("Wrote %s", path)
+
+
+if __name__ == '__main__':
+    main()
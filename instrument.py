@@ -0,0 +1,215 @@
+"""
+======================
+Timing Instrumentation
+======================
+
+Opt-in timing spans around the data pipeline and the Bokeh callbacks, to
+find where the time of a slow "Build Plot" goes.
+
+Timing is enabled by setting the `ALBOKEH_TIMING` environment variable to 1.
+Each span is then logged as a JSON object by the `instrument` logger, and
+its recent durations and payload sizes are kept for `summary()`. Setting
+`ALBOKEH_DIAGNOSTICS` to 1 also enables timing, and adds a panel of the
+summary to the app.
+
+When timing is disabled `timed()` returns the function it decorates
+unchanged and `span()` returns a shared no-op span, so the instrumented code
+runs as it would without them.
+"""
+
+import collections
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# Whether the diagnostics panel is shown, which requires timing.
+DIAGNOSTICS = os.environ.get("ALBOKEH_DIAGNOSTICS", "0") != "0"
+
+# Whether spans are timed at all.
+ENABLED = os.environ.get("ALBOKEH_TIMING", "0") != "0" or DIAGNOSTICS
+
+# The number of recent spans of each name kept for the summary.
+HISTORY_SIZE = 256
+
+LOGGER = logging.getLogger(__name__)
+
+_HISTORY = collections.defaultdict(
+    lambda: collections.deque(maxlen=HISTORY_SIZE))
+_PAYLOADS = dict()
+_LOCK = threading.Lock()
+
+
+class Span(object):
+    """
+    A timed block of code, used as a context manager.
+
+    :param name: The name the span is logged and summarised under.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.nbytes = None
+        self.start = None
+
+    def set_payload(self, nbytes):
+        """
+        Records the size of the data the span produced or sent.
+
+        :param nbytes: The size in bytes, or a function returning it, which
+            is only called when timing is enabled.
+        """
+        self.nbytes = nbytes() if callable(nbytes) else nbytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, time.perf_counter() - self.start, self.nbytes,
+               failed=exc_type is not None)
+        return False
+
+
+class _NullSpan(object):
+    """The span used when timing is disabled, which does nothing."""
+
+    def set_payload(self, nbytes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """
+    Returns a context manager that times the block it wraps as `name`.
+
+    :param name: The name of the span.
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return Span(name)
+
+
+def timed(name=None, payload=None):
+    """
+    A decorator that times every call of a function. When timing is disabled
+    the function is returned unchanged.
+
+    :param name: The name of the span, defaults to the function's name.
+    :param payload: A function of the return value that returns its size in
+        bytes, or None.
+    """
+
+    def decorator(func):
+        if not ENABLED:
+            return func
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(span_name) as current:
+                result = func(*args, **kwargs)
+                if payload is not None:
+                    current.set_payload(payload(result))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def record(name, seconds, nbytes=None, failed=False):
+    """
+    Logs a span and keeps its duration and payload size for the summary.
+
+    :param name: The name of the span.
+    :param seconds: Its duration.
+    :param nbytes: The size of its payload in bytes, or None.
+    :param failed: True if the span raised an exception.
+    """
+    with _LOCK:
+        _HISTORY[name].append(seconds)
+        if nbytes is not None:
+            _PAYLOADS[name] = nbytes
+
+    entry = dict(span=name, seconds=round(seconds, 6),
+                 thread=threading.current_thread().name)
+    if nbytes is not None:
+        entry["bytes"] = int(nbytes)
+    if failed:
+        entry["failed"] = True
+    LOGGER.info(json.dumps(entry))
+
+
+def summary():
+    """
+    Returns a dictionary of span name to the count, median (p50), 95th
+    percentile (p95) and maximum of its recent durations in seconds, and
+    the size of its last payload.
+    """
+    with _LOCK:
+        history = {name: np.array(durations)
+                   for name, durations in _HISTORY.items()}
+        payloads = dict(_PAYLOADS)
+
+    result = dict()
+    for name, durations in sorted(history.items()):
+        result[name] = dict(
+            count=len(durations),
+            p50=float(np.percentile(durations, 50)),
+            p95=float(np.percentile(durations, 95)),
+            max=float(durations.max()),
+            bytes=payloads.get(name))
+    return result
+
+
+def reset():
+    """Forgets every recorded span."""
+    with _LOCK:
+        _HISTORY.clear()
+        _PAYLOADS.clear()
+
+
+def column_data_nbytes(data):
+    """
+    Returns the approximate size in bytes of the columns of a
+    ColumnDataSource, counting eight bytes for each item of a list.
+
+    :param data: A dictionary of column name to array or list.
+    """
+    nbytes = 0
+    for column in data.values():
+        if isinstance(column, np.ndarray):
+            nbytes += column.nbytes
+        else:
+            for item in column:
+                nbytes += item.nbytes if isinstance(item, np.ndarray) else 8
+    return nbytes
+
+
+def summary_html():
+    """Returns the summary as an HTML table, for the diagnostics panel."""
+    rows = ["<tr><th>Span</th><th>Count</th><th>p50 (ms)</th>"
+            "<th>p95 (ms)</th><th>Payload (kB)</th></tr>"]
+    for name, stats in summary().items():
+        payload = "" if stats["bytes"] is None \
+            else "{:.1f}".format(stats["bytes"] / 1024)
+        rows.append(
+            "<tr><td>{}</td><td>{}</td><td>{:.1f}</td><td>{:.1f}</td>"
+            "<td>{}</td></tr>".format(
+                name, stats["count"], stats["p50"] * 1000,
+                stats["p95"] * 1000, payload))
+    return "<table>{}</table>".format("".join(rows))
@@ -0,0 +1,406 @@
+"""
+========================
+Incremental Registration
+========================
+
+Registers new and changed data files in a persisted ISA-JSON document,
+without building the whole investigation again with `generateISA`.
+
+The data directory is scanned for files of the known patterns, and each is
+compared with the fingerprint (size and modification time) recorded for it
+when the document was last registered:
+
+- A new `*.RDF` file is appended as a simulated RDF assay, with a sample
+  named after the file and a characteristic category for each bond of its
+  header.
+- A new `*.PWS` file is appended to the vibrational spectrum assay.
+- A new `*.csv` file is appended to the last assay of plot extracts.
+- A changed `*.RDF` file has the bonds of its assay patched to match its
+  header. Other changed files only have their fingerprint updated, as
+  their contents are not described by the document.
+- A removed file is dropped from its assay, and an RDF assay left without
+  data files is dropped with it.
+
+Only the affected assays are touched. Every `@id` already in the document is
+kept, and the `@id`s of new entries are derived from the file names, so
+caches and indexes keyed on assay identity stay valid.
+
+The fingerprints, the directory they were scanned from, and the version of
+the generator that wrote the document are kept in a comment of the
+investigation. A document without them, such as one written by
+`generateISA`, is only seeded: the fingerprints of every file found are
+recorded, but no file is added, so the files a curated document leaves out
+stay out. Files are matched by name, so the references of a document
+written from another copy of the directory are moved to this one.
+
+For example, to register the new files of the bundled data::
+
+    python isa_registrar.py data --metadata metadata.json
+"""
+
+import argparse
+import collections
+import copy
+import fnmatch
+import json
+import logging
+import os
+import re
+
+from pdcsvref import read_hash_header
+
+
+# The data file type registered for each file name pattern.
+DATA_FILE_TYPES = collections.OrderedDict([
+    ("*.RDF", "Maxime-RDF"),
+    ("*.PWS", "Maxime Vibrational Spectrum"),
+    ("*.csv", "Plot-csv-extract"),
+])
+
+# The name of the investigation comment holding the file fingerprints.
+REGISTRY_COMMENT = "Registered data files"
+
+# The term sources of the annotations of a registered RDF assay.
+RDF_TERM_SOURCE = "Simulated Data"
+SPECIES_TERM_SOURCE = "Aluminate Species"
+BOND_TERM_SOURCE = "Inter-atom distances"
+
+REGISTERED_RDF_STUDY = "registered_rdf_study"
+REGISTERED_VIB_STUDY = "registered_vibrational_study"
+REGISTERED_EXTRACT_STUDY = "registered_extract_study"
+
+
+def slugify(text):
+    """Returns `text` in lower case, with runs of other characters than
+    letters, digits and dots replaced by a hyphen."""
+    return re.sub(r"[^a-z0-9.]+", "-", text.lower()).strip("-")
+
+
+def file_fingerprint(path):
+    """Returns the `[size, mtime_ns]` fingerprint of a file."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def scan_data_files(data_path):
+    """
+    Finds the files of `data_path` matching DATA_FILE_TYPES.
+
+    :param data_path: The path to the data directory.
+
+    :returns: An ordered dictionary of file name to `(type, fingerprint)`,
+        sorted by name.
+    """
+    found = dict()
+    for entry in os.scandir(data_path):
+        if entry.name.startswith(".") or not entry.is_file():
+            continue
+        for pattern, file_type in DATA_FILE_TYPES.items():
+            if fnmatch.fnmatchcase(entry.name, pattern):
+                found[entry.name] = (file_type, file_fingerprint(entry.path))
+                break
+    return collections.OrderedDict(sorted(found.items()))
+
+
+def rdf_bonds(path):
+    """Returns the bonds of the `RDF_<bond>` columns of an RDF file."""
+    return [name[len("RDF_"):] for name in read_hash_header(path)
+            if name.startswith("RDF_")]
+
+
+def read_registry(metadata):
+    """
+    Returns the registration recorded in `metadata`, a dictionary of the
+    "data_path" that was scanned, the fingerprints of its "files" by name,
+    and the version of the "generator" of the document, or None if it was
+    never registered.
+    """
+    for comment in metadata.get("comments", list()):
+        if comment.get("name") == REGISTRY_COMMENT:
+            return json.loads(comment["value"])
+    return None
+
+
+def write_registry(metadata, data_path, generator=None):
+    """
+    Records the fingerprints of the files of `data_path` in `metadata`, in
+    place.
+
+    :param generator: The version of the generator that wrote `metadata`,
+        or None if it is not known.
+    """
+    files = {name: fingerprint
+             for name, (_, fingerprint) in scan_data_files(data_path).items()}
+    comments = metadata.setdefault("comments", list())
+    comments[:] = [comment for comment in comments
+                   if comment.get("name") != REGISTRY_COMMENT]
+    comments.append(dict(name=REGISTRY_COMMENT, value=json.dumps(
+        dict(data_path=os.path.abspath(data_path), files=files,
+             generator=generator),
+        sort_keys=True)))
+    return metadata
+
+
+def _iter_data_files(metadata):
+    """Yields (study, assay, dataFile) for every data file of `metadata`."""
+    for study in metadata.get("studies", list()):
+        for assay in study.get("assays", list()):
+            for data_file in assay.get("dataFiles", list()):
+                yield study, assay, data_file
+
+
+def _iter_annotations(value):
+    """Yields every ontology annotation dictionary found within `value`."""
+    if isinstance(value, dict):
+        if "annotationValue" in value and "@id" in value:
+            yield value
+        for item in value.values():
+            yield from _iter_annotations(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _iter_annotations(item)
+
+
+class _Registrar(object):
+    """Patches an ISA document, held as a dictionary, in place."""
+
+    def __init__(self, metadata, data_path):
+        self.metadata = metadata
+        self.data_path = os.path.abspath(data_path)
+        self.annotations = dict()
+        for annotation in _iter_annotations(metadata):
+            key = (annotation["annotationValue"],
+                   annotation.get("termSource", ""))
+            self.annotations.setdefault(key, annotation)
+
+    def annotation(self, value, term_source):
+        """Returns a copy of the annotation of `value`, reusing the `@id` of
+        one already in the document."""
+        key = (value, term_source)
+        if key not in self.annotations:
+            self.annotations[key] = {
+                "@id": "#annotation/" + slugify(term_source + "-" + value),
+                "annotationValue": value,
+                "termAccession": "",
+                "termSource": term_source,
+            }
+        return dict(self.annotations[key])
+
+    def category(self, value, term_source):
+        """Returns a characteristic category of `value`."""
+        annotation = self.annotation(value, term_source)
+        return {"@id": annotation["@id"], "characteristicType": annotation}
+
+    def data_file(self, name, file_type):
+        """Returns a data file entry, with an `@id` of its file name."""
+        return {
+            "@id": "#data/{}-{}".format(slugify(file_type), slugify(name)),
+            "comments": [],
+            "name": os.path.join(self.data_path, name),
+            "type": file_type,
+        }
+
+    def study(self, file_type, identifier, title):
+        """Returns the last study holding a data file of `file_type`, or a
+        new study `identifier` if there is none."""
+        for study in reversed(self.metadata.setdefault("studies", list())):
+            if any(data_file.get("type") == file_type
+                   for assay in study.get("assays", list())
+                   for data_file in assay.get("dataFiles", list())):
+                return study
+        for study in self.metadata["studies"]:
+            if study.get("identifier") == identifier:
+                return study
+        study = dict(identifier=identifier, title=title, description="",
+                     assays=list(), comments=list(), filename="",
+                     materials=dict(sources=list(), samples=list(),
+                                    otherMaterials=list()))
+        self.metadata["studies"].append(study)
+        return study
+
+    def assay_of_type(self, study, file_type):
+        """Returns the last assay of `study` holding a data file of
+        `file_type`, or None."""
+        for assay in reversed(study.get("assays", list())):
+            if any(data_file.get("type") == file_type
+                   for data_file in assay.get("dataFiles", list())):
+                return assay
+        return None
+
+    def new_assay(self, measurement_type, technology_type, units):
+        """Returns an empty assay."""
+        return dict(
+            characteristicCategories=list(), comments=list(),
+            dataFiles=list(), filename="",
+            materials=dict(samples=list(), otherMaterials=list()),
+            measurementType=measurement_type,
+            processSequence=list(),
+            technologyPlatform="To be filled out.",
+            technologyType=technology_type,
+            unitCategories=units)
+
+    def sample_name(self, name):
+        """Returns a sample name for the RDF file `name` that no other
+        sample of the document has."""
+        taken = {sample.get("name")
+                 for study in self.metadata.get("studies", list())
+                 for assay in study.get("assays", list())
+                 for sample in assay.get("materials", dict()).get(
+                     "samples", list())}
+        stem = os.path.splitext(name)[0]
+        return stem if stem not in taken else name
+
+    def bond_categories(self, name):
+        """Returns the characteristic categories of the bonds of the RDF
+        file `name`."""
+        return [self.category(bond, BOND_TERM_SOURCE)
+                for bond in rdf_bonds(os.path.join(self.data_path, name))]
+
+    def add_rdf(self, name):
+        """Appends an assay for the new RDF file `name`."""
+        study = self.study("Maxime-RDF", REGISTERED_RDF_STUDY,
+                           "Registered simulated RDFs")
+        template = self.assay_of_type(study, "Maxime-RDF")
+        simulated_rdf = self.annotation("Simulated RDF", RDF_TERM_SOURCE)
+        if template is not None:
+            assay = self.new_assay(
+                copy.deepcopy(template["measurementType"]),
+                copy.deepcopy(template["technologyType"]),
+                copy.deepcopy(template.get("unitCategories", list())))
+        else:
+            assay = self.new_assay(
+                simulated_rdf, dict(simulated_rdf),
+                [self.annotation("Angstroms", BOND_TERM_SOURCE)])
+
+        sample = self.sample_name(name)
+        assay["materials"]["samples"].append({
+            "@id": "#sample/" + slugify(sample),
+            "characteristics": [],
+            "factorValues": [],
+            "name": sample,
+        })
+        assay["characteristicCategories"] = [
+            self.category(sample, SPECIES_TERM_SOURCE),
+            self.category("Simulated RDF", RDF_TERM_SOURCE),
+        ] + self.bond_categories(name)
+        assay["dataFiles"].append(self.data_file(name, "Maxime-RDF"))
+        study["assays"].append(assay)
+
+    def add_to_assay(self, name, file_type, identifier, title):
+        """Appends the new file `name` to the last assay holding files of
+        `file_type`, creating one if there is none."""
+        study = self.study(file_type, identifier, title)
+        assay = self.assay_of_type(study, file_type)
+        if assay is None:
+            assay = self.new_assay(dict(), dict(), list())
+            study["assays"].append(assay)
+        assay["dataFiles"].append(self.data_file(name, file_type))
+
+    def add(self, name, file_type):
+        """Registers the new file `name`."""
+        if file_type == "Maxime-RDF":
+            self.add_rdf(name)
+        elif file_type == "Maxime Vibrational Spectrum":
+            self.add_to_assay(name, file_type, REGISTERED_VIB_STUDY,
+                              "Registered vibrational spectra")
+        else:
+            self.add_to_assay(name, file_type, REGISTERED_EXTRACT_STUDY,
+                              "Registered plot extracts")
+
+    def patch(self, assay, name, file_type):
+        """Patches the assay of the changed file `name`."""
+        if file_type != "Maxime-RDF":
+            return
+        categories = assay.get("characteristicCategories", list())
+        kept = [category for category in categories
+                if category["characteristicType"].get("termSource")
+                != BOND_TERM_SOURCE]
+        patched = kept + self.bond_categories(name)
+        if [category["characteristicType"]["annotationValue"]
+                for category in patched] \
+                != [category["characteristicType"]["annotationValue"]
+                    for category in categories]:
+            assay["characteristicCategories"] = patched
+
+    def remove(self, study, assay, data_file):
+        """Drops the removed `data_file` from its assay."""
+        assay["dataFiles"].remove(data_file)
+        if not assay["dataFiles"] and data_file.get("type") == "Maxime-RDF":
+            study["assays"].remove(assay)
+
+
+def register_data_files(metadata, data_path):
+    """
+    Registers the new, changed and removed files of `data_path` in a copy of
+    `metadata`. A document that was never registered is seeded instead: the
+    files it references are kept, and moved into `data_path`, and no file is
+    added.
+
+    :param metadata: An ISA metadata dictionary. It is not modified.
+    :param data_path: The path to the data directory.
+
+    :returns: A tuple of the registered metadata and a dictionary of the
+        file names that were "added", "changed" and "removed".
+    """
+    metadata = copy.deepcopy(metadata)
+    registrar = _Registrar(metadata, data_path)
+    registry = read_registry(metadata)
+    seeding = registry is None
+    generator = None if seeding else registry.get("generator")
+    registry = dict() if seeding else registry["files"]
+    found = scan_data_files(registrar.data_path)
+    changes = dict(added=list(), changed=list(), removed=list())
+
+    referenced = dict()
+    for study, assay, data_file in list(_iter_data_files(metadata)):
+        name = os.path.basename(data_file.get("name", ""))
+        if name not in found:
+            registrar.remove(study, assay, data_file)
+            changes["removed"].append(name)
+            continue
+        referenced[name] = assay
+        path = os.path.join(registrar.data_path, name)
+        if data_file["name"] != path:
+            # The document was written from another copy of the directory.
+            data_file["name"] = path
+            changes["changed"].append(name)
+        elif not seeding and registry.get(name) != found[name][1]:
+            registrar.patch(assay, name, found[name][0])
+            changes["changed"].append(name)
+
+    for name, (file_type, fingerprint) in found.items():
+        if not seeding and name not in referenced and name not in registry:
+            registrar.add(name, file_type)
+            changes["added"].append(name)
+
+    write_registry(metadata, registrar.data_path, generator)
+    for change, names in changes.items():
+        if names:
+            logging.info("Registered %s data files: %s", change,
+                         ", ".join(sorted(names)))
+    return metadata, changes
+
+
+def main():
+    """Registers the new and changed data files in a metadata document."""
+    parser = argparse.ArgumentParser(
+        description="Register new and changed data files in an ISA-JSON "
+                    "document.")
+    parser.add_argument("data_path", help="The data directory to scan.")
+    parser.add_argument("--metadata", default="metadata.json",
+                        help="The document to update in place.")
+    args = parser.parse_args()
+
+    with open(args.metadata, "r") as md_file:
+        metadata = json.load(md_file)
+    metadata, changes = register_data_files(
+        metadata, os.path.abspath(args.data_path))
+
+    with open(args.metadata, "w") as md_file:
+        json.dump(metadata, md_file, sort_keys=True, indent=4,
+                  separators=(',', ':'))
+    logging.info("Registered %s", json.dumps(changes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+================
+Live Data Reload
+================
+
+Watches the data files served by the shared store, so that a simulation
+that overwrites a `d*.RDF` file is shown by the open sessions without the
+server being restarted or the page reloaded.
+
+`FileWatcher` polls the size and modification time of every watched file
+from a background thread. A file is reported once it has changed and then
+kept the same fingerprint for a whole interval, so that a file still being
+written is not read half way through. Polling a few stat calls a second is
+cheap, and works the same on every platform and file system.
+
+Only the changed columns of a source are sent to the browser. The old and
+new data of a source are compared by `column_changes()`:
+
+- Rows appended to every column are streamed.
+- A few changed values are patched.
+- Columns with many changed values are replaced on their own.
+- A change in the columns or a shorter source replaces the whole data.
+"""
+
+import logging
+import os
+import threading
+
+import numpy as np
+
+
+# The largest number of values patched, beyond which the changed columns are
+# replaced instead.
+MAX_PATCHED_VALUES = 256
+
+
+def file_fingerprint(path):
+    """Returns the `(size, mtime_ns)` fingerprint of a file, or None if it
+    does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class FileWatcher(object):
+    """
+    Polls files for changes from a background thread.
+
+    :param paths: A dictionary of the path of each watched file to the key
+        it is reported by.
+    :param on_change: A function called with the key of a changed file. It
+        is called from the watching thread.
+    :param interval: The time between polls in seconds.
+    """
+
+    def __init__(self, paths, on_change, interval=1.0):
+        self.paths = dict(paths)
+        self.on_change = on_change
+        self.interval = interval
+
+        self._reported = {path: file_fingerprint(path) for path in self.paths}
+        self._pending = dict()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts polling in a daemon thread."""
+        self._thread = threading.Thread(
+            target=self._run, name="albokeh-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops polling, and waits for the thread to finish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def poll(self):
+        """
+        Checks every file once, and reports those that have changed and
+        have since kept the same fingerprint.
+
+        :returns: The list of keys reported.
+        """
+        reported = list()
+        for path, key in self.paths.items():
+            fingerprint = file_fingerprint(path)
+            if fingerprint == self._reported[path]:
+                self._pending.pop(path, None)
+                continue
+            if fingerprint is None or self._pending.get(path) != fingerprint:
+                # Removed, or still being written.
+                self._pending[path] = fingerprint
+                continue
+
+            self._reported[path] = fingerprint
+            del self._pending[path]
+            reported.append(key)
+            try:
+                self.on_change(key)
+            except Exception:
+                logging.exception("Failed to reload %s", path)
+        return reported
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+
+def _unchanged(old, new):
+    """Returns a boolean array of the equal values of two arrays, counting
+    NaN as equal to NaN."""
+    equal = old == new
+    if old.dtype.kind == "f" and new.dtype.kind == "f":
+        equal |= np.isnan(old) & np.isnan(new)
+    return equal
+
+
+def _same_items(old, new):
+    """Returns True if two lists, such as the curves of a multi_line, hold
+    equal items."""
+    if len(old) != len(new):
+        return False
+    for old_item, new_item in zip(old, new):
+        old_item, new_item = np.asarray(old_item), np.asarray(new_item)
+        if old_item.shape != new_item.shape \
+                or not _unchanged(old_item, new_item).all():
+            return False
+    return True
+
+
+def column_changes(old, new, max_patched=MAX_PATCHED_VALUES):
+    """
+    Compares the old and new data of a ColumnDataSource.
+
+    :param old: A dictionary of column name to array or list.
+    :param new: A dictionary of column name to array, of equal lengths.
+        Columns that are lists, such as the curves of a multi_line, are
+        only ever replaced.
+    :param max_patched: The largest number of values to patch.
+
+    :returns: A tuple of how the source is updated and what with, one of:
+
+        - ("stream", the appended rows)
+        - ("patch", a dictionary of column to (index, value) patches)
+        - ("columns", a dictionary of the changed columns)
+        - ("replace", `new`)
+        - (None, None) if nothing changed.
+    """
+    if set(old) != set(new):
+        return "replace", new
+
+    if not all(isinstance(values, np.ndarray) for values in new.values()):
+        changed = {column: values for column, values in new.items()
+                   if not _same_items(old[column], values)}
+        return ("columns", changed) if changed else (None, None)
+
+    old = {column: np.asarray(values) for column, values in old.items()}
+    old_length = len(next(iter(old.values()), ()))
+    new_length = len(next(iter(new.values()), ()))
+    if new_length < old_length:
+        return "replace", new
+
+    changed = {column: np.flatnonzero(~_unchanged(
+        old[column], np.asarray(new[column][:old_length])))
+        for column in new}
+
+    if new_length > old_length:
+        if any(len(indices) for indices in changed.values()):
+            return "replace", new
+        return "stream", {column: values[old_length:]
+                          for column, values in new.items()}
+
+    changed = {column: indices for column, indices in changed.items()
+               if len(indices)}
+    if not changed:
+        return None, None
+    if sum(len(indices) for indices in changed.values()) <= max_patched:
+        return "patch", {
+            column: [(int(idx), new[column][idx].item()) for idx in indices]
+            for column, indices in changed.items()}
+    return "columns", {column: new[column] for column in changed}
+
+
+def apply_column_changes(source, data):
+    """
+    Updates a ColumnDataSource to hold `data`, sending only what changed.
+
+    :param source: A bokeh ColumnDataSource.
+    :param data: The new data of the source.
+
+    :returns: How the source was updated, see `column_changes()`.
+    """
+    kind, change = column_changes(source.data, data)
+    if kind == "stream":
+        source.stream(change)
+    elif kind == "patch":
+        # Patches are applied in place to the arrays held by the source,
+        # which may be shared with the frames and other sessions, so each
+        # patched column is first swapped for a private copy. The copy holds
+        # the values the browser already has, so there is nothing to send:
+        # it is set on the dict underneath the source's data, as bokeh's own
+        # `stream` sets its appended arrays, which skips the notification
+        # that would resend the whole source. The patch then sends only the
+        # changed values.
+        for column in change:
+            dict.__setitem__(
+                source.data, column, np.array(source.data[column]))
+        source.patch(change)
+    elif kind == "columns":
+        source.data.update(change)
+    elif kind == "replace":
+        source.data = change
+    return kind
@@ -0,0 +1,162 @@
+"""
+=====================
+Level of Detail Views
+=====================
+
+Server-side downsampling of dense curves, such as the RDFs of long
+simulations or the 8,000 point vibrational power spectra, so that only about
+as many points as there are screen pixels are sent to the browser.
+
+An `LODPyramid` precomputes, for bins of 2, 4, 8, ... points, the indices of
+the minimum and maximum of every y column within each bin. The union of these
+indices over all columns is kept for each level, so a single set of indices
+can be applied to every column of a source sharing the same x values. Peaks
+and troughs are therefore always kept, whatever the level.
+
+A view of the visible x-range is built from two parts:
+
+- An overview of the whole curve at about one min/max pair per pixel, so
+  that the data range (and the reset tool) still covers the whole curve.
+- The visible window at the finest level that does not exceed one min/max
+  pair per pixel.
+
+The largest-triangle-three-buckets (LTTB) algorithm is also available, for
+single curves that are to be downsampled to a fixed number of points.
+"""
+
+import numpy as np
+
+
+def minmax_indices(ys, bin_size):
+    """
+    Returns the sorted indices of the minimum and maximum values of each
+    bin of `bin_size` points, over every column of `ys`. The first and last
+    indices are always included.
+
+    :param ys: A list of equal length one dimensional arrays.
+    :param bin_size: The number of points in each bin.
+    """
+    length = len(ys[0])
+    n_bins = -(-length // bin_size)
+    pad = n_bins * bin_size - length
+    offsets = np.arange(n_bins) * bin_size
+
+    found = [np.array([0, length - 1])]
+    for y in ys:
+        y = np.asarray(y, dtype=np.float64)
+        missing = np.isnan(y)
+        # Pad the last bin, and replace missing values, with values that are
+        # never selected.
+        low = np.concatenate(
+            [np.where(missing, np.inf, y), np.full(pad, np.inf)])
+        high = np.concatenate(
+            [np.where(missing, -np.inf, y), np.full(pad, -np.inf)])
+        found.append(offsets + np.argmin(low.reshape(n_bins, -1), axis=1))
+        found.append(offsets + np.argmax(high.reshape(n_bins, -1), axis=1))
+
+    return np.unique(np.concatenate(found)).astype(np.int32)
+
+
+class LODPyramid(object):
+    """
+    Precomputed min/max levels of detail of one or more curves that share
+    the same, sorted, x values.
+
+    :param x: A one dimensional array of sorted x values.
+    :param ys: A list of one dimensional arrays of the same length as `x`.
+    :param min_points: Levels are built until they hold fewer points than
+        this.
+    """
+
+    def __init__(self, x, ys, min_points=256):
+        self.x = np.asarray(x)
+        self.length = len(self.x)
+        # levels[k] holds the indices kept with bins of 2**k points, the
+        # first level keeps every point and is not stored.
+        self.levels = [None]
+
+        bin_size = 2
+        while self.length // bin_size >= min_points // 2:
+            self.levels.append(minmax_indices(ys, bin_size))
+            bin_size *= 2
+
+    def level_indices(self, level, start=0, stop=None):
+        """Returns the indices of `level` within `[start, stop)`."""
+        stop = self.length if stop is None else stop
+        if level == 0:
+            return np.arange(start, stop, dtype=np.int32)
+        indices = self.levels[level]
+        lo, hi = np.searchsorted(indices, [start, stop])
+        return indices[lo:hi]
+
+    def _level_for(self, n_points, n_pixels):
+        """Returns the finest level with no more than one min/max pair of
+        points per pixel."""
+        # Bins of `bin_size` points give at most one pair per pixel.
+        bin_size = -(-n_points // max(1, n_pixels))
+        level = int(np.ceil(np.log2(max(1, bin_size))))
+        return min(level, len(self.levels) - 1)
+
+    def select(self, x_start, x_end, n_pixels):
+        """
+        Returns the indices to be sent for a view of `[x_start, x_end]` that
+        is `n_pixels` wide.
+
+        :param x_start: The start of the visible x-range, or None.
+        :param x_end: The end of the visible x-range, or None.
+        :param n_pixels: The width of the plot in pixels.
+        """
+        overview = self.level_indices(self._level_for(self.length, n_pixels))
+        if x_start is None or x_end is None:
+            return overview
+
+        x_start, x_end = min(x_start, x_end), max(x_start, x_end)
+        start, stop = np.searchsorted(self.x, [x_start, x_end])
+        # Keep a point beyond each edge, so the curve reaches the edges.
+        start = max(0, start - 1)
+        stop = min(self.length, stop + 1)
+
+        window = self.level_indices(
+            self._level_for(stop - start, n_pixels), start, stop)
+        return np.union1d(overview, window).astype(np.int32)
+
+
+def lttb(x, y, n_out):
+    """
+    Downsamples a curve to `n_out` points with the largest-triangle-three-
+    buckets algorithm, which keeps the points that most affect its shape.
+
+    :param x: A one dimensional array of sorted x values.
+    :param y: A one dimensional array of y values.
+    :param n_out: The number of points to keep, at least 3.
+
+    :returns: The indices of the kept points.
+    """
+    length = len(x)
+    if n_out >= length or n_out < 3:
+        return np.arange(length, dtype=np.int32)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # The first and last points are kept, the rest are split into buckets.
+    edges = np.linspace(1, length - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int32)
+    kept[0] = 0
+    kept[-1] = length - 1
+
+    for idx in range(n_out - 2):
+        start, stop = edges[idx], edges[idx + 1]
+        next_start = stop
+        next_stop = edges[idx + 2] if idx + 2 < len(edges) else length
+        # The average of the next bucket is the third triangle point.
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+
+        prev_x, prev_y = x[kept[idx]], y[kept[idx]]
+        areas = np.abs(
+            (prev_x - avg_x) * (y[start:stop] - prev_y)
+            - (prev_x - x[start:stop]) * (avg_y - prev_y))
+        kept[idx + 1] = start + np.argmax(areas)
+
+    return kept
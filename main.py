@@ -21,26 +21,38 @@ Boiler Plat Visualization Application
 import os
 import sys
 import collections
-import itertools
-import json
+import functools
+import logging
+import time
+import numpy as np
 # Bokeh imports
 from bokeh import events
 from bokeh.plotting import figure
 from bokeh.layouts import layout, widgetbox, row, column
-from bokeh.models import ColumnDataSource, HoverTool
-from bokeh.models.widgets import MultiSelect, Div, Paragraph, Button
+from bokeh.models import ColumnDataSource, HoverTool, Legend, LegendItem,\
+    LinearColorMapper, GlyphRenderer
+from bokeh.models.glyphs import Line, Circle
+from bokeh.models.widgets import MultiSelect, Div, Paragraph, Button,\
+    DataTable, TableColumn, NumberFormatter
 from bokeh.palettes import linear_palette, viridis
 from bokeh.io import curdoc
 # Local, relative module imports
 sys.path.append(os.getcwd())
-from utils import read_metadata, md_reader, create_pandas_dataframe,\
-    get_sample_names, retr_termSource_values
-from generateISA import create_metadata, main
-
-
-# Build the metadata with system appropriate filepaths
-# os.path.abspath('data')
-METADATA = json.loads(create_metadata(os.path.abspath('albokeh/data')))
+from shared_store import get_store, get_build_executor
+from lod import LODPyramid
+from rdf_analysis import analyze_samples, RESULT_COLUMNS
+from live_reload import apply_column_changes
+from selection_cache import SELECTION_CACHE, normalize_selection,\
+    sample_columns, renderer_specs, bond_data, pack_points,\
+    invalidate_sample
+import instrument
+from instrument import timed
+
+
+# The metadata, samples and dataframes are held in a store shared by every
+# session of this server process. Sessions only hold references to them,
+# which must not be modified.
+STORE = get_store()
 
 # Create the title HTML Div.
 title_div = Div(
@@ -50,46 +62,71 @@ title_div = Div(
         "rdf_title.html")).read(), width=800
 )
 
-# Source the metadata
-# METADATA = read_metadata("albokeh/metadata.json")
-# Create the search dictionary for retr_dataframe
-SEARCH_DICT = {'annotationValue': 'Simulated RDF'}
-
-# Source the desired dataframes.
-# This returns a list of dictionaries with the following fields:
-#   dataFile - the datafile dictionary
-#   assay_md - the assay metadata dictionary
-DFMD = md_reader(METADATA, SEARCH_DICT)
-
 # Placeholder for available compounds found in the retrieved data.
 AVAIL_CMPDS = collections.defaultdict(list)
 
-# Create dataframes with the desired metadata attached as either
-# objects of as columns.
-# For now just create a list of the desired dataframes
-ALL_LOADED_DATAFRAMES = dict()
-ALL_LOADED_SAMPLES = list()
-
-for data_dict in DFMD:
-    # Construct a dataframe:
-    new_df = create_pandas_dataframe(data_dict.get("dataFile"))
-    # Find the sample that this dataframe represents:
-    # TODO: Fix list parsing hack
-    new_sample = get_sample_names(data_dict.get("assay_md"))[0]
-    ALL_LOADED_SAMPLES.append(new_sample)
-    # Add a new column that contains the compound
-    new_df['sample'] = new_sample
-    # Build the dict
-    ALL_LOADED_DATAFRAMES[new_sample] = dict(
-        dataframe=new_df,
-        assay_md=data_dict.get("assay_md"),
-        assay_bonds=[retr_termSource_values(
-            data_dict.get("assay_md"), "Inter-atom distances")]
-    )
-
-# Create SOURCES that will dynamically update themselves.
-ACTIVE_DATAFRAMES = ColumnDataSource()
-AVAIL_BONDS = ColumnDataSource()
+ALL_LOADED_SAMPLES = list(STORE.samples)
+FRAME_STORE = STORE.frames
+
+# Figure builds load frames and assemble source data on a shared worker
+# thread, and then apply the result to the document on its next tick. Set
+# ALBOKEH_ASYNC_BUILDS to 0 to build on the document thread instead.
+ASYNC_BUILDS = os.environ.get("ALBOKEH_ASYNC_BUILDS", "1") != "0"
+BUILD_EXECUTOR = get_build_executor()
+DOCUMENT = curdoc()
+BUILD_LABEL = "Build Plot"
+BUILDING_LABEL = "Building\u2026"
+
+# The generation of the latest build request, and its pending future. A
+# build whose generation is no longer the latest has been superseded.
+BUILD_STATE = dict(generation=0, future=None)
+
+# The figure rendering mode. 'per-sample' draws a line and a circle renderer
+# for every selected (sample, bond) pair. 'batched' draws one multi_line and
+# one circle renderer for each selected bond, which hold every sample.
+RENDER_MODE = os.environ.get("ALBOKEH_RENDER_MODE", "per-sample")
+
+# The sources and renderers of this session's figure. In 'per-sample' mode
+# they are keyed by sample and by (sample, bond) respectively, in 'batched'
+# mode both are keyed by bond. They are kept when deselected, and reused
+# when selected again. The renderers are ordered from least to most recently
+# shown.
+FIGURE_SOURCES = dict()
+FIGURE_RENDERERS = collections.OrderedDict()
+
+# The number of deselected legend items whose renderers are kept hidden in
+# the figure. The least recently shown beyond this are removed, with the
+# sources only they draw, so a long session does not grow without bound.
+MAX_HIDDEN_RENDERERS = int(os.environ.get(
+    "ALBOKEH_MAX_HIDDEN_RENDERERS", 64))
+
+# The samples held by the sources of each bond in 'batched' mode.
+BATCHED_SAMPLES = dict()
+
+# The color the plotting helpers give a glyph when none is set.
+GLYPH_COLOR = "#1f77b4"
+
+# Curves with more points than this are downsampled to the visible x-range
+# and the plot width before being sent, see the lod module. It defaults to
+# the width of the plot, below which every point would be sent anyway.
+LOD_THRESHOLD = int(os.environ.get("ALBOKEH_LOD_THRESHOLD", 800))
+
+# The level of detail pyramids of the downsampled curves, and the indices of
+# the points last sent for each. Keyed by sample in 'per-sample' mode, and by
+# (sample, bond) in 'batched' mode.
+FIGURE_LOD = dict()
+LOD_SENT_INDICES = dict()
+
+# Each sample has a fixed color. Batched renderers carry the index of the
+# sample of each line or point, its row in the store, which is mapped to its
+# color in the browser.
+_BASE_PALETTE = viridis(max(1, min(len(ALL_LOADED_SAMPLES), 256)))
+SAMPLE_COLOR_MAPPER = LinearColorMapper(
+    palette=[_BASE_PALETTE[idx % len(_BASE_PALETTE)]
+             for idx in range(max(1, len(ALL_LOADED_SAMPLES)))],
+    # Center each index within its palette bin.
+    low=-0.5,
+    high=max(1, len(ALL_LOADED_SAMPLES)) - 0.5)
 
 # Define active dataframes/compounds/aluminum dimers
 DATAFRAME_SEL = MultiSelect(
@@ -100,101 +137,650 @@ BOND_SEL = MultiSelect(
     title="Bond Selector")
 
 
+@timed()
 def update_dataframe_selector(attr, old, new):
-    """The updater function for the dataframe selector."""
-    sel_datasets = [ALL_LOADED_DATAFRAMES[x] for x in DATAFRAME_SEL.value]
-    avail_bonds = list()
+    """The updater function for the dataframe selector. The available bonds
+    are an OR over the precomputed bond mask rows of the selected samples.
+    The frames of the selected samples are loaded in the background."""
+    generation = cancel_build()
+    samples = tuple(DATAFRAME_SEL.value)
+    if ASYNC_BUILDS:
+        BUILD_EXECUTOR.submit(prefetch_frames, samples, generation)
+    else:
+        prefetch_frames(samples, generation)
+
+    avail_bonds = STORE.available_bonds(samples)
+    if BOND_SEL.options != avail_bonds:
+        BOND_SEL.options = avail_bonds
+    # DEBUGGING PRINT CALLS:
+    # print(FRAME_STORE.stats())
+    # print(avail_bonds)
 
-    for x in DATAFRAME_SEL.value:
-        avail_bonds.extend(
-            [y for y in ALL_LOADED_DATAFRAMES[x]["assay_bonds"]])
 
-    avail_bonds_set = set([x for x in itertools.chain(*avail_bonds)])
+def prefetch_frames(samples, generation):
+    """Loads the data of `samples`, stopping early if a newer request has
+    been made."""
+    for sample in samples:
+        if build_superseded(generation):
+            return
+        STORE.frame(sample)
 
-    ACTIVE_DATAFRAMES.data = dict(user_sel_df=sel_datasets)
-    AVAIL_BONDS.data = dict(avail_bonds=list(avail_bonds_set))
-    BOND_SEL.options = AVAIL_BONDS.data['avail_bonds']
-    # DEBUGGING PRINT CALLS:
-    # print(ACTIVE_DATAFRAMES.data)
-    # print(AVAIL_BONDS.data)
+
+def cancel_build():
+    """Supersedes any pending figure build, and returns the generation of
+    the next request."""
+    BUILD_STATE["generation"] += 1
+    future, BUILD_STATE["future"] = BUILD_STATE["future"], None
+    if future is not None:
+        future.cancel()
+        MAKE_PLOT_BUTTON.label = BUILD_LABEL
+    return BUILD_STATE["generation"]
+
+
+def build_superseded(generation):
+    """Returns True if a build request newer than `generation` was made."""
+    return generation != BUILD_STATE["generation"]
 
 
+@timed()
 def create_figure():
-    """Create the figure."""
+    """Create the figure. It is created once per session, its renderers are
+    then added and toggled by update_figure()."""
 
     fig = figure(
         name="primary_figure",
         width=800,
         tools="pan,wheel_zoom,box_zoom,reset,tap"
     )
+    fig.add_layout(Legend(items=[]))
+
+    # The sample is not sent per point. In 'per-sample' mode it is the name
+    # of the hovered renderer, in 'batched' mode it is held once per line.
+    if RENDER_MODE == "batched":
+        sample_tooltip = ("sample", "@sample")
+    else:
+        sample_tooltip = ("sample", "$name")
+    fig.add_tools(HoverTool(
+        tooltips=[sample_tooltip, ("r", "$x"), ("RDF", "$y")],
+        renderers=[]))
+
+    return fig
+
 
-    sel_dataframes = [ALL_LOADED_DATAFRAMES[x]["dataframe"]
-                      for x in DATAFRAME_SEL.value]
+def figure_hover_tool():
+    """Returns the hover tool of the figure. The tools are searched rather
+    than every model of the figure."""
+    return next(tool for tool in FIGURE.tools if isinstance(tool, HoverTool))
 
-    metadata_list = [ALL_LOADED_DATAFRAMES[x]["assay_md"]
-                     for x in DATAFRAME_SEL.value]
 
-    sel_bonds = BOND_SEL.value
+def add_hover_renderer(renderer):
+    """Shows the tooltips of the figure's hover tool for `renderer`."""
+    hover = figure_hover_tool()
+    hover.renderers = hover.renderers + [renderer]
 
-    # enumerate through the data frames to be used and the index value.
-    # enumerate() is used as zip() failes when there is only one item.
-    for idx, df in enumerate(sel_dataframes):
 
+def get_figure_source(sample, data=None):
+    """Returns the ColumnDataSource of a sample. Sources are created on first
+    use and then reused, so their data is only sent to the browser once.
+    Only the `r` and `RDF_*` columns are sent. The data of a new source may
+    be given, if it was prepared in the background."""
+    fig_source = FIGURE_SOURCES.get(sample)
+
+    if fig_source is None:
+        if data is None:
+            data = sample_source_data(sample)
         # Declare the source for the current frame:
-        fig_source = ColumnDataSource(df)
+        fig_source = ColumnDataSource(data=data)
 
         # Add the callback event. In this case I call a function that takess
         # the associated metadata as an argument, and returns a callback
         # function. This is to workaroudn callback functions only allowing
         # one argument.
-        # fig.on_event(events.SelectionGeometry,
-                     # generate_selection_callback(metadata=metadata_list[idx]))
-        fig_source.callback = generate_selection_callback(metadata=metadata_list[idx])
-
-        # Iterate over the bonds selected.
-        for idxx, bond in enumerate(sel_bonds):
-
+        fig_source.on_change(
+            'selected',
+            generate_selection_callback(sample))
+
+        FIGURE_SOURCES[sample] = fig_source
+
+    return fig_source
+
+
+def sample_source_data(sample, x_range=None, lod=None):
+    """
+    Returns the `r` and `RDF_*` columns of a sample, downsampled to the
+    visible x-range if the sample has more than LOD_THRESHOLD points.
+
+    :param x_range: The x-range to downsample to, see figure_x_range().
+        Defaults to the current x-range of the figure.
+    :param lod: A dictionary the downsampled curve is written to, see
+        lod_indices(). If None it is stored for this session, which must
+        then be done on the document thread.
+    """
+    session_lod = lod is None
+    lod = dict() if session_lod else lod
+    data = sample_columns(STORE, sample)
+
+    indices = lod_indices(
+        sample, data['r'], [v for k, v in data.items() if k != 'r'],
+        figure_x_range() if x_range is None else x_range, lod)
+    if indices is not None:
+        data = {col: values[indices] for col, values in data.items()}
+
+    if session_lod:
+        store_lod(lod)
+    return data
+
+
+def figure_x_range():
+    """Returns the visible x-range of the figure and its width in pixels,
+    as passed to LODPyramid.select()."""
+    return FIGURE.x_range.start, FIGURE.x_range.end, FIGURE.plot_width
+
+
+def lod_indices(key, x, ys, x_range, lod):
+    """
+    Returns the indices of the points of a curve to send for `x_range`, or
+    None if the curve is sent whole. The pyramid of a curve is built the
+    first time it is needed.
+
+    Nothing of the session is modified, so this may run on a worker thread.
+    The pyramid and the indices are written to `lod`, and are stored in
+    FIGURE_LOD and LOD_SENT_INDICES by store_lod().
+
+    :param key: The key of the curve in FIGURE_LOD.
+    :param x: The x values of the curve.
+    :param ys: The y columns of the curve.
+    :param x_range: The x-range to downsample to, see figure_x_range().
+    :param lod: A dictionary of key to `(pyramid, indices)`.
+    """
+    if len(x) <= LOD_THRESHOLD:
+        return None
+
+    pyramid = FIGURE_LOD.get(key)
+    if pyramid is None:
+        pyramid = LODPyramid(x, ys)
+
+    indices = pyramid.select(*x_range)
+    lod[key] = (pyramid, indices)
+    return indices
+
+
+def store_lod(lod):
+    """Stores the pyramids and the sent indices of downsampled curves, as
+    written by lod_indices(), for this session."""
+    for key, (pyramid, indices) in lod.items():
+        FIGURE_LOD[key] = pyramid
+        LOD_SENT_INDICES[key] = indices
+
+
+def lod_is_stale(key):
+    """Returns True if the points sent for a downsampled curve differ from
+    those needed for the current x-range."""
+    pyramid = FIGURE_LOD.get(key)
+    if pyramid is None:
+        return False
+    indices = pyramid.select(*figure_x_range())
+    return not np.array_equal(indices, LOD_SENT_INDICES.get(key))
+
+
+def refresh_lod():
+    """Resends the downsampled curves of the shown renderers whose points
+    have changed with the x-range. The samples are those the sources were
+    built with, which may since have been deselected without building."""
+    if not FIGURE_LOD:
+        return
+
+    shown = [key for key, legend_item in FIGURE_RENDERERS.items()
+             if legend_item.renderers[0].visible]
+
+    if RENDER_MODE == "batched":
+        for bond in shown:
+            samples = BATCHED_SAMPLES.get(bond)
+            if samples is None:
+                continue
+            if any(lod_is_stale((sample, bond)) for sample in samples):
+                lines_source, points_source = FIGURE_SOURCES[bond]
+                lines_source.data, points_source.data = batched_bond_data(
+                    samples, bond)
+        return
+
+    for sample in collections.OrderedDict.fromkeys(
+            sample for sample, bond in shown):
+        if lod_is_stale(sample):
+            FIGURE_SOURCES[sample].data = sample_source_data(sample)
+
+
+def on_x_range_change(attr, old, new):
+    """Sends the points needed for the new x-range of downsampled curves."""
+    refresh_lod()
+
+
+def get_figure_renderers(specs):
+    """
+    Returns the legend items of the (sample, bond, label) specs of a
+    selection, each holding the line and circle renderers of its pair. They
+    are created on first use and then reused.
+
+    The renderers are made without the plotting helpers, which search every
+    model of the figure for each glyph, and the new ones are added to the
+    figure and its hover tool in one change each.
+    """
+    legend_items, new_renderers, hovered = list(), list(), list()
+
+    for sample, bond, label in specs:
+        legend_item = FIGURE_RENDERERS.get((sample, bond))
+
+        if legend_item is None:
+            fig_source = get_figure_source(sample)
             active_bond = 'RDF_' + bond
-
-            fig.line(  # Draw a line plot
-                source=fig_source,
-                x='r',
-                y=active_bond,
-                legend='sample',
-                # color=bond_color,
-                line_width=1.5,
+            # The label is held by the renderers, which the legend and the
+            # hover tool read, so it is not repeated in the source.
+            line = GlyphRenderer(  # Draw a line plot
+                data_source=fig_source,
+                glyph=Line(x='r', y=active_bond, line_width=1.5,
+                           line_color=GLYPH_COLOR),
+                nonselection_glyph=Line(x='r', y=active_bond, line_width=1.5,
+                                        line_color=GLYPH_COLOR,
+                                        line_alpha=0.1),
+                name=label,
             )
 
-            fig.circle(  # Draw a circle/dot plot
-                source=fig_source,
-                x='r',
-                y=active_bond,
-                legend='sample',
-                # color=bond_color,
+            circle = GlyphRenderer(  # Draw a circle/dot plot
+                data_source=fig_source,
+                glyph=Circle(x='r', y=active_bond, line_color=GLYPH_COLOR,
+                             fill_color=GLYPH_COLOR),
+                nonselection_glyph=Circle(x='r', y=active_bond,
+                                          line_color=GLYPH_COLOR,
+                                          fill_color=GLYPH_COLOR,
+                                          line_alpha=0.1, fill_alpha=0.1),
+                name=label,
             )
 
-    return fig
+            legend_item = LegendItem(label=label, renderers=[line, circle])
+            FIGURE_RENDERERS[(sample, bond)] = legend_item
+            new_renderers.extend([line, circle])
+            hovered.append(circle)
+
+        legend_items.append(legend_item)
+
+    if new_renderers:
+        FIGURE.renderers = FIGURE.renderers + new_renderers
+        hover = figure_hover_tool()
+        hover.renderers = hover.renderers + hovered
+
+    return legend_items
+
+
+def get_batched_renderers(bond):
+    """Returns the legend item of a bond in 'batched' mode, which holds the
+    multi_line and circle renderers of every selected sample. They are
+    created on first use and then reused."""
+    legend_item = FIGURE_RENDERERS.get(bond)
+
+    if legend_item is None:
+        # One item per sample: its curve and its sample.
+        lines_source = ColumnDataSource(
+            data=dict(xs=[], ys=[], sample=[], sample_idx=[]))
+        # One item per point, only the index of the sample is repeated.
+        points_source = ColumnDataSource(
+            data=dict(x=[], y=[], sample_idx=[]))
+        points_source.on_change(
+            'selected', generate_batched_selection_callback(points_source))
+
+        sample_color = dict(field='sample_idx', transform=SAMPLE_COLOR_MAPPER)
+
+        lines = FIGURE.multi_line(  # Draw every line of the bond
+            source=lines_source,
+            xs='xs',
+            ys='ys',
+            line_color=sample_color,
+            line_width=1.5,
+        )
+
+        points = FIGURE.circle(  # Draw every point of the bond
+            source=points_source,
+            x='x',
+            y='y',
+            color=sample_color,
+        )
+
+        add_hover_renderer(lines)
+
+        legend_item = LegendItem(label=bond, renderers=[lines, points])
+        FIGURE_RENDERERS[bond] = legend_item
+        FIGURE_SOURCES[bond] = (lines_source, points_source)
+
+    return legend_item
+
+
+def batched_bond_data(samples, bond, x_range=None, lod=None):
+    """
+    Returns the data of the multi_line and circle sources of a bond, the
+    `r` and `RDF_<bond>` columns of every sample packed together. Samples
+    without the bond are skipped. The whole curves are memoized for every
+    session, and long curves are downsampled from them to the visible
+    x-range.
+
+    :param samples: A normalized tuple of sample names.
+    :param x_range: The x-range to downsample to, see sample_source_data().
+    :param lod: A dictionary the downsampled curves are written to, see
+        sample_source_data().
+
+    :returns: A tuple of the lines and points data dictionaries.
+    """
+    session_lod = lod is None
+    lod = dict() if session_lod else lod
+    x_range = figure_x_range() if x_range is None else x_range
+    lines, points = bond_data(STORE, samples, bond)
+
+    downsampled = False
+    for idx, sample in enumerate(lines['sample']):
+        kept = lod_indices((sample, bond), lines['xs'][idx],
+                           [lines['ys'][idx]], x_range, lod)
+        if kept is not None:
+            lines['xs'][idx] = lines['xs'][idx][kept]
+            lines['ys'][idx] = lines['ys'][idx][kept]
+            downsampled = True
+
+    if session_lod:
+        store_lod(lod)
+
+    if downsampled:
+        points = pack_points(lines['xs'], lines['ys'], lines['sample_idx'])
+    return lines, points
+
+
+def show_legend_items(legend_items):
+    """Shows the renderers of `legend_items` and hides every other renderer
+    of the figure. Only properties that change are set."""
+    shown = set(id(legend_item) for legend_item in legend_items)
+
+    for key, legend_item in list(FIGURE_RENDERERS.items()):
+        visible = id(legend_item) in shown
+        for renderer in legend_item.renderers:
+            if renderer.visible != visible:
+                renderer.visible = visible
+        if visible:
+            FIGURE_RENDERERS.move_to_end(key)
+
+    legend = FIGURE.legend[0]
+    if legend.items != legend_items:
+        legend.items = legend_items
+
+    prune_renderers()
+
+
+def prune_renderers():
+    """Removes the least recently shown hidden legend items beyond
+    MAX_HIDDEN_RENDERERS from the figure, with the sources and downsampled
+    curves only they draw."""
+    hidden = [key for key, legend_item in FIGURE_RENDERERS.items()
+              if not legend_item.renderers[0].visible]
+    pruned = hidden[:max(0, len(hidden) - MAX_HIDDEN_RENDERERS)]
+    if not pruned:
+        return
+
+    removed = set()
+    for key in pruned:
+        removed.update(id(renderer)
+                       for renderer in FIGURE_RENDERERS.pop(key).renderers)
+    FIGURE.renderers = [renderer for renderer in FIGURE.renderers
+                        if id(renderer) not in removed]
+    hover = figure_hover_tool()
+    hover.renderers = [renderer for renderer in hover.renderers
+                       if id(renderer) not in removed]
+
+    if RENDER_MODE == "batched":
+        for bond in pruned:
+            FIGURE_SOURCES.pop(bond, None)
+            BATCHED_SAMPLES.pop(bond, None)
+            for key in [key for key in FIGURE_LOD if key[1] == bond]:
+                FIGURE_LOD.pop(key)
+                LOD_SENT_INDICES.pop(key, None)
+        return
+
+    drawn = set(sample for sample, bond in FIGURE_RENDERERS)
+    for sample, bond in pruned:
+        if sample not in drawn:
+            FIGURE_SOURCES.pop(sample, None)
+            FIGURE_LOD.pop(sample, None)
+            LOD_SENT_INDICES.pop(sample, None)
+
+
+def prepare_figure_data(samples, bonds, x_range, generation=None):
+    """
+    Assembles the source data of the normalized `samples` and `bonds` that
+    this session does not hold yet, and the shell analysis of the samples.
+    Nothing of the session is modified, so this may run on a worker thread,
+    and the result is applied by update_figure().
+
+    :param x_range: The x-range to downsample to, see figure_x_range().
+    :param generation: The generation of the build, the assembly stops early
+        and None is returned if it has been superseded.
+
+    :returns: A tuple of the source data by sample ('per-sample' mode) or by
+        bond ('batched' mode), the downsampled curves to store with
+        store_lod(), and the analysis. Or None if superseded.
+    """
+    prepared, lod = dict(), dict()
+
+    if RENDER_MODE == "batched":
+        for bond in bonds:
+            if generation is not None and build_superseded(generation):
+                return None
+            if BATCHED_SAMPLES.get(bond) != samples:
+                prepared[bond] = batched_bond_data(
+                    samples, bond, x_range, lod)
+    else:
+        for sample in samples:
+            if generation is not None and build_superseded(generation):
+                return None
+            if sample not in FIGURE_SOURCES:
+                prepared[sample] = sample_source_data(sample, x_range, lod)
+        # The specs are memoized, so they are not assembled again when the
+        # figure is updated.
+        renderer_specs(STORE, samples, bonds)
+
+    return prepared, lod, analyze_samples(STORE, samples)
+
+
+def update_figure(samples=None, bonds=None, prepared=None):
+    """
+    Updates the figure to show the selected samples and bonds. The selection
+    is diffed against the renderers already in the figure: new selections
+    get renderers, deselected ones are hidden, and reselected ones are shown
+    again. Only these changes are sent to the browser.
+
+    :param samples: The samples to show, defaults to those selected.
+    :param bonds: The bonds to show, defaults to those selected.
+    :param prepared: The data of the normalized samples and bonds, as
+        returned by prepare_figure_data(), or None to prepare it here.
+    """
+    samples, bonds = normalize_selection(
+        STORE,
+        DATAFRAME_SEL.value if samples is None else samples,
+        BOND_SEL.value if bonds is None else bonds)
+    if prepared is None:
+        prepared = prepare_figure_data(samples, bonds, figure_x_range())
+    data, lod, analysis = prepared
+    store_lod(lod)
+    update_analysis_table(samples, bonds, analysis)
+
+    if RENDER_MODE == "batched":
+        update_batched_figure(samples, bonds, data)
+        return
+
+    for sample in samples:
+        get_figure_source(sample, data.get(sample))
+
+    show_legend_items(get_figure_renderers(
+        renderer_specs(STORE, samples, bonds)))
+    refresh_lod()
+
+
+def update_batched_figure(samples, bonds, data):
+    """The 'batched' mode of update_figure(). The sources of a bond are only
+    replaced when the samples selected have changed."""
+    legend_items = list()
+
+    for bond in bonds:
+        legend_items.append(get_batched_renderers(bond))
+
+        if BATCHED_SAMPLES.get(bond) != samples:
+            lines_source, points_source = FIGURE_SOURCES[bond]
+            lines_source.data, points_source.data = (
+                data[bond] if bond in data
+                else batched_bond_data(samples, bond))
+            BATCHED_SAMPLES[bond] = samples
+
+    show_legend_items(legend_items)
+    refresh_lod()
+
+
+def apply_figure_build(samples, bonds, generation, started, future):
+    """Applies a background build to the figure. This is run as a next tick
+    callback, so it holds the document lock."""
+    if build_superseded(generation) or future.cancelled():
+        return
+    BUILD_STATE["future"] = None
+    MAKE_PLOT_BUTTON.label = BUILD_LABEL
+
+    try:
+        result = future.result()
+    except Exception:
+        logging.exception("Failed to build the figure of %s", samples)
+        return
+    if result is None:
+        return
+
+    update_figure(samples, bonds, result)
+    if instrument.ENABLED:
+        instrument.record("build_fig_callback",
+                          time.perf_counter() - started,
+                          figure_payload_nbytes())
+
+
+def update_analysis_table(samples, bonds, analysis=None):
+    """Shows the shell analysis of the selected samples and bonds."""
+    if analysis is None:
+        analysis = analyze_samples(STORE, samples)
+    rows = analysis[analysis["bond"].isin(bonds)]
+    data = {name: rows[name].to_numpy() for name in RESULT_COLUMNS}
+    if any(len(ANALYSIS_SOURCE.data[name]) or len(data[name])
+           for name in RESULT_COLUMNS):
+        ANALYSIS_SOURCE.data = data
 
 
 def build_fig_callback():
     """This is the callback function that will update the figure curdoc
-    model."""
-    mainLayout.children[1].children[1] = create_figure()
+    model. The frames are loaded and the data assembled in the background,
+    any earlier build that is still pending is cancelled."""
+    if not ASYNC_BUILDS:
+        with instrument.span("build_fig_callback") as current:
+            update_figure()
+            current.set_payload(figure_payload_nbytes)
+        return
+
+    samples, bonds = normalize_selection(
+        STORE, DATAFRAME_SEL.value, BOND_SEL.value)
+    generation = cancel_build()
+    started = time.perf_counter()
+
+    MAKE_PLOT_BUTTON.label = BUILDING_LABEL
+    future = BUILD_EXECUTOR.submit(
+        prepare_figure_data, samples, bonds, figure_x_range(), generation)
+    BUILD_STATE["future"] = future
+    future.add_done_callback(
+        lambda done: DOCUMENT.add_next_tick_callback(functools.partial(
+            apply_figure_build, samples, bonds, generation, started, done)))
+
+
+def on_selection_change(attr, old, new):
+    """Cancels a pending build when the bond selection changes."""
+    cancel_build()
+
+
+def on_data_changed(sample):
+    """Called by the store, from its watching thread, when the data file of
+    `sample` has been reloaded. The change is applied on the next tick."""
+    DOCUMENT.add_next_tick_callback(
+        functools.partial(apply_data_change, sample))
+
+
+def apply_data_change(sample):
+    """Sends the reloaded data of `sample` to the sources that hold it. Only
+    the changed rows or columns are sent, the figure is not rebuilt."""
+    if RENDER_MODE == "batched":
+        for bond, shown in list(BATCHED_SAMPLES.items()):
+            if sample not in shown:
+                continue
+            FIGURE_LOD.pop((sample, bond), None)
+            lines_source, points_source = FIGURE_SOURCES[bond]
+            lines, points = batched_bond_data(shown, bond)
+            apply_column_changes(lines_source, lines)
+            apply_column_changes(points_source, points)
+    elif sample in FIGURE_SOURCES:
+        FIGURE_LOD.pop(sample, None)
+        apply_column_changes(FIGURE_SOURCES[sample],
+                             sample_source_data(sample))
+
+    if sample in DATAFRAME_SEL.value:
+        update_analysis_table(tuple(DATAFRAME_SEL.value),
+                              tuple(BOND_SEL.value))
+
+
+def figure_payload_nbytes():
+    """Returns the approximate size of the data held by the figure's sources,
+    which is sent to the browser when it changes."""
+    nbytes = 0
+    for sources in FIGURE_SOURCES.values():
+        if not isinstance(sources, tuple):
+            sources = (sources,)
+        for source in sources:
+            nbytes += instrument.column_data_nbytes(source.data)
+    return nbytes
+
+
+def update_diagnostics():
+    """Shows the recent timings in the diagnostics panel."""
+    DIAGNOSTICS_DIV.text = instrument.summary_html()
+
+
+def generate_selection_callback(sample):
+    """Generates and returns a callback function that updates a div element
+    with the assay metadata of `sample`."""
+    def generated_callback(attr, old, new):
+        """The new callback function to be assigned."""
+        METADATA_PARAGRAPH.text = str(STORE.assay_details(sample))
+
+    return generated_callback
 
 
-def generate_selection_callback(metadata):
-    """Generates and returns a callback function that updates a div element."""
-    def generated_callback(event):
+def generate_batched_selection_callback(points_source):
+    """Generates a callback that shows the metadata of the sample of the
+    first point selected in a batched points source."""
+    def generated_callback(attr, old, new):
         """The new callback function to be assigned."""
-        print(event)
-        mainLayout.children[2] = Paragraph(text=str(metadata))
+        indices = new['1d']['indices']
+        if not indices:
+            return
+        sample_idx = points_source.data['sample_idx'][indices[0]]
+        sample = ALL_LOADED_SAMPLES[sample_idx]
+        METADATA_PARAGRAPH.text = str(STORE.assay_details(sample))
 
     return generated_callback
 
 
 DATAFRAME_SEL.on_change('value', update_dataframe_selector)
 
-MAKE_PLOT_BUTTON = Button(label="Build Plot")
+# The sources of this session are updated in place when a data file changes,
+# and the memoized selections holding its sample are dropped.
+STORE.add_listener(invalidate_sample)
+STORE.add_listener(on_data_changed)
+
+BOND_SEL.on_change('value', on_selection_change)
+
+MAKE_PLOT_BUTTON = Button(label=BUILD_LABEL)
 MAKE_PLOT_BUTTON.on_click(build_fig_callback)
 
 p = Paragraph(text="""The dataframe selector represents the selection
@@ -202,12 +788,49 @@ p = Paragraph(text="""The dataframe selector represents the selection
 
 controls = widgetbox(DATAFRAME_SEL, BOND_SEL, MAKE_PLOT_BUTTON, p)
 
-mainLayout = layout(
-    children=[
-        [title_div],
-        [controls, create_figure()],
-        Paragraph()
+FIGURE = create_figure()
+
+# The first shell of each selected sample and bond.
+ANALYSIS_SOURCE = ColumnDataSource(
+    data={name: [] for name in RESULT_COLUMNS})
+_SHELL_FORMAT = NumberFormatter(format="0.000")
+ANALYSIS_TABLE = DataTable(
+    source=ANALYSIS_SOURCE,
+    columns=[
+        TableColumn(field="sample", title="Sample"),
+        TableColumn(field="bond", title="Bond"),
+        TableColumn(field="peak_r", title="Peak r",
+                    formatter=_SHELL_FORMAT),
+        TableColumn(field="peak_g", title="Peak g(r)",
+                    formatter=_SHELL_FORMAT),
+        TableColumn(field="min_r", title="Minimum r",
+                    formatter=_SHELL_FORMAT),
+        TableColumn(field="second_peak_r", title="Second peak r",
+                    formatter=_SHELL_FORMAT),
+        TableColumn(field="rcn_min", title="RCN at minimum",
+                    formatter=_SHELL_FORMAT),
     ],
+    width=600,
+    height=280,
+)
+FIGURE.x_range.on_change('start', on_x_range_change)
+FIGURE.x_range.on_change('end', on_x_range_change)
+METADATA_PARAGRAPH = Paragraph()
+
+layout_children = [
+    [title_div],
+    [controls, FIGURE, widgetbox(ANALYSIS_TABLE, width=600)],
+    METADATA_PARAGRAPH
+]
+
+# The recent timings of the instrumented callbacks, when enabled.
+if instrument.DIAGNOSTICS:
+    DIAGNOSTICS_DIV = Div(width=600)
+    layout_children.append(DIAGNOSTICS_DIV)
+    curdoc().add_periodic_callback(update_diagnostics, 2000)
+
+mainLayout = layout(
+    children=layout_children,
     sizing_mode='fixed'
 )
 
@@ -0,0 +1,301 @@
+"""
+=======================
+Compiled Metadata Cache
+=======================
+
+Building the ISA investigation with `generateISA.create_metadata()` creates
+the whole isatools object graph and serializes it to a string, which then
+has to be parsed back into a dictionary. This module keeps the compiled
+result both on disk and in process so that the cost is only paid when the
+contents of the data directory actually change.
+
+The cache key is built from the data directory path and the name, mtime and
+size of every file within it. A changed, added or removed file gives a new
+key. The names of the compiled files also start with a digest of the data
+directory path, so that directories sharing a cache directory, through
+`ALBOKEH_CACHE_DIR`, only ever replace their own files. The last compiled metadata then has only the affected assays patched
+by `isa_registrar`, which keeps their `@id`s. The investigation is built in
+full when nothing has been compiled before, when the last compiled metadata
+was not registered from this directory, or when `generateISA.py` itself has
+changed since.
+
+The returned metadata dictionary is shared between every caller in the
+process, and must be treated as read-only.
+
+`generateISA`, and with it isatools, is only imported when the investigation
+has to be rebuilt, so serving from the cache does not pay for the import.
+With `allow_stale` the last compiled metadata is served even if the data
+directory has since changed, so that a server can start without isatools.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from isa_registrar import read_registry, register_data_files, write_registry
+
+
+# The environment variable that can be used to relocate the on-disk cache.
+CACHE_DIR_ENV = "ALBOKEH_CACHE_DIR"
+
+# The name of the cache directory created within the data directory when
+# no other location is given.
+DEFAULT_CACHE_DIRNAME = ".albokeh_cache"
+
+# The module that builds the metadata. A change to it rebuilds the compiled
+# metadata, rather than registering the changed files in it.
+GENERATOR_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "generateISA.py")
+
+_MEMORY_CACHE = dict()
+_CACHE_LOCK = threading.Lock()
+
+
+def cache_dir(data_path):
+    """
+    Returns the directory used to store cached files for `data_path`. This
+    is the value of the `ALBOKEH_CACHE_DIR` environment variable if it is
+    set, otherwise a hidden directory within `data_path`.
+
+    :param data_path: The path to the data directory.
+
+    :returns: The path to the cache directory. It is not created here.
+    """
+    return os.environ.get(
+        CACHE_DIR_ENV, os.path.join(data_path, DEFAULT_CACHE_DIRNAME))
+
+
+def data_dir_signature(data_path):
+    """
+    Creates a signature of the contents of a data directory. Hidden entries,
+    such as the cache directory itself, are ignored.
+
+    :param data_path: The path to the data directory.
+
+    :returns: A sorted list of `[name, mtime_ns, size]` entries, one for
+        each file in `data_path`.
+    """
+    signature = list()
+    for entry in os.scandir(data_path):
+        if entry.name.startswith(".") or not entry.is_file():
+            continue
+        stat = entry.stat()
+        signature.append([entry.name, stat.st_mtime_ns, stat.st_size])
+    return sorted(signature)
+
+
+def metadata_cache_key(data_path):
+    """
+    Returns a hex digest that identifies the current contents of
+    `data_path`. The absolute path is part of the key, as the compiled
+    metadata stores absolute file paths.
+
+    :param data_path: The path to the data directory.
+    """
+    data_path = os.path.abspath(data_path)
+    key_src = json.dumps([data_path, data_dir_signature(data_path)])
+    return hashlib.sha1(key_src.encode("utf-8")).hexdigest()
+
+
+def compiled_prefix(data_path):
+    """
+    Returns the start of the names of the compiled metadata files of
+    `data_path`. It holds a digest of the path, so that data directories
+    sharing a cache directory keep their files apart.
+
+    :param data_path: The absolute path to the data directory.
+    """
+    return "metadata-{}-".format(
+        hashlib.sha1(data_path.encode("utf-8")).hexdigest()[:16])
+
+
+def _write_atomic(path, text):
+    """Writes `text` to `path` through a temporary file so that concurrent
+    readers never see a partially written file."""
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "w") as tmp_file:
+        tmp_file.write(text)
+    os.replace(tmp_path, path)
+
+
+def _prune_stale(directory, prefix, keep):
+    """Removes the cached metadata files starting with `prefix` other than
+    `keep` from `directory`."""
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name != keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def create_metadata(data_path):
+    """
+    Builds the ISA metadata of `data_path` with `generateISA`, which is
+    imported on first use. The time taken by the import is logged.
+
+    :returns: The metadata as an ISA-JSON string.
+    """
+    start = time.perf_counter()
+    # Bokeh only adds the app directory to sys.path while it runs the app's
+    # modules, so it is added again for this deferred import.
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    if app_dir not in sys.path:
+        sys.path.append(app_dir)
+    import generateISA
+    logging.info("Imported generateISA in %.3f s",
+                 time.perf_counter() - start)
+    return generateISA.create_metadata(data_path)
+
+
+def _latest_compiled(directory, prefix):
+    """Returns the path of the most recently written compiled metadata in
+    `directory` whose name starts with `prefix`, or None. Other data
+    directories may share the cache directory, and their files are never
+    returned."""
+    paths = glob.glob(os.path.join(
+        directory, glob.escape(prefix) + "*.json"))
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def generator_version():
+    """Returns a digest of the source of `generateISA`, which describes the
+    investigation and so changes the compiled metadata of every directory."""
+    with open(GENERATOR_PATH, "rb") as source_file:
+        return hashlib.sha1(source_file.read()).hexdigest()
+
+
+def _registered_metadata(path, data_path):
+    """Returns the compiled metadata at `path` if it was registered from
+    `data_path` and written by the current `generateISA`, so that its
+    changes can be registered, otherwise None."""
+    if path is None:
+        return None
+    with open(path, "r") as md_file:
+        metadata = json.load(md_file)
+    registry = read_registry(metadata)
+    if registry is None or registry["data_path"] != data_path \
+            or registry.get("generator") != generator_version():
+        return None
+    return metadata
+
+
+def _build_metadata(data_path, previous_path):
+    """
+    Builds the compiled metadata of `data_path`, registering its changed
+    files in the compiled metadata at `previous_path` if that was registered
+    from `data_path` by the current generator, otherwise with
+    `create_metadata()`.
+    """
+    previous = _registered_metadata(previous_path, data_path)
+    if previous is not None:
+        metadata, _ = register_data_files(previous, data_path)
+        return metadata
+    return write_registry(json.loads(create_metadata(data_path)), data_path,
+                          generator_version())
+
+
+def _compiled_entry(data_path, key, allow_stale):
+    """
+    Finds the on-disk compiled metadata of `data_path` for the contents
+    identified by `key`, or builds and writes it. Must be called with
+    _CACHE_LOCK held.
+
+    :returns: A tuple of the path of the compiled metadata, or None if it
+        could not be written, and the metadata if it was built here,
+        otherwise None.
+    """
+    directory = cache_dir(data_path)
+    prefix = compiled_prefix(data_path)
+    cache_name = "{}{}.json".format(prefix, key)
+    cache_path = os.path.join(directory, cache_name)
+    if os.path.isfile(cache_path):
+        return cache_path, None
+
+    previous_path = _latest_compiled(directory, prefix)
+    if previous_path is not None and allow_stale:
+        logging.warning(
+            "Serving the stale compiled metadata %s, the data directory "
+            "%s has changed since.", previous_path, data_path)
+        return previous_path, None
+
+    metadata = _build_metadata(data_path, previous_path)
+    metadata_json = json.dumps(
+        metadata, sort_keys=True, indent=4, separators=(',', ':'))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _write_atomic(cache_path, metadata_json)
+        _prune_stale(directory, prefix, keep=cache_name)
+    except OSError as err:
+        logging.warning(
+            "Unable to write the metadata cache %s: %s", cache_path, err)
+        return None, metadata
+    return cache_path, metadata
+
+
+def compiled_metadata_path(data_path, allow_stale=False):
+    """
+    Returns the path of the on-disk compiled ISA metadata of `data_path`,
+    building and writing it, as `load_compiled_metadata()` does, if there is
+    no entry for the current directory contents. The document is not loaded,
+    so that it can be streamed into a `md_stream.MetadataIndex`.
+
+    :param data_path: The path to the data directory.
+    :param allow_stale: See `load_compiled_metadata()`.
+
+    :returns: The path, or None if the cache could not be written. The
+        metadata that was built is then held by the in-process cache.
+    """
+    data_path = os.path.abspath(data_path)
+    key = metadata_cache_key(data_path)
+
+    with _CACHE_LOCK:
+        path, metadata = _compiled_entry(data_path, key, allow_stale)
+        if path is None:
+            _MEMORY_CACHE[data_path] = (key, metadata)
+    return path
+
+
+def load_compiled_metadata(data_path, use_disk=True, allow_stale=False):
+    """
+    Returns the compiled ISA metadata dictionary for `data_path`, building
+    it only if neither the in-process nor the on-disk cache hold an entry
+    for the current directory contents. The last compiled metadata on disk
+    has the changed files registered in it, and is only built again with
+    `create_metadata()` if there is none.
+
+    :param data_path: The path to the data directory.
+    :param use_disk: Whether the on-disk cache should be read and written.
+        Failing to write the cache is logged and otherwise ignored.
+    :param allow_stale: If True, and there is no entry for the current
+        contents, the last compiled metadata on disk is used as it is,
+        without registering the changed files.
+
+    :returns: The metadata as a python dictionary. This dictionary is shared
+        and must not be modified.
+    """
+    data_path = os.path.abspath(data_path)
+    key = metadata_cache_key(data_path)
+
+    with _CACHE_LOCK:
+        cached_key, metadata = _MEMORY_CACHE.get(data_path, (None, None))
+        if cached_key == key:
+            return metadata
+
+        if use_disk:
+            path, metadata = _compiled_entry(data_path, key, allow_stale)
+            if metadata is None:
+                with open(path, "r") as md_file:
+                    metadata = json.load(md_file)
+        else:
+            metadata = _build_metadata(data_path, None)
+
+        # Only the current version of each directory is held in memory.
+        _MEMORY_CACHE[data_path] = (key, metadata)
+
+    return metadata
@@ -0,0 +1,146 @@
+"""
+===============
+ISA Assay Index
+===============
+
+An inverted index over the assays of an ISA metadata dictionary. Rather than
+crawling every assay with `utils.fetch_dataframe_field_vals` for each search
+key, the assays are crawled once and every `(field, value)` pair found is
+mapped to the positions of the assays that contain it. A lookup such as
+`('annotationValue', 'Simulated RDF')` is then a single dictionary access.
+
+The crawl follows the same rules as `fetch_dataframe_field_vals`, so that the
+index gives the same matches:
+
+- Lists are crawled into, but only their dictionary items are examined.
+- Once a field is matched, the value below it is not searched again for that
+  same field name.
+
+Values that cannot be hashed (dictionaries and lists) are kept apart, and are
+compared one by one when they are searched for.
+"""
+
+import collections
+import threading
+
+
+# The number of metadata versions for which an index is kept in memory.
+INDEX_CACHE_SIZE = 4
+
+_INDEX_CACHE = collections.OrderedDict()
+_INDEX_LOCK = threading.Lock()
+
+
+class AssayIndex(object):
+    """
+    An inverted `(field, value)` index over the assays of an ISA metadata
+    dictionary.
+
+    :param metadata_dict: A python dictionary of the ISA metadata.
+
+    The indexed assays are available, in document order, as `assays`. The
+    positions returned by `lookup()` refer to this list.
+    """
+
+    def __init__(self, metadata_dict):
+        self.assays = list()
+        self._postings = dict()
+        self._complex = collections.defaultdict(list)
+
+        for study in metadata_dict['studies']:
+            for assay in study['assays']:
+                position = len(self.assays)
+                self.assays.append(assay)
+                self._index_node(position, assay, frozenset())
+
+    def _index_node(self, position, node, hidden):
+        """
+        Records every field and value of the dictionary `node` for the assay
+        at `position`. Field names in `hidden` have been matched by an
+        ancestor and are not recorded again.
+        """
+        for key, value in node.items():
+
+            if key not in hidden:
+                self._record(position, key, value)
+
+            if isinstance(value, dict):
+                self._index_node(position, value, hidden | {key})
+
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        self._index_node(position, item, hidden | {key})
+
+    def _record(self, position, field, value):
+        """Adds `position` to the posting list of `(field, value)`."""
+        if isinstance(value, (dict, list)):
+            self._complex[field].append((position, value))
+            return
+
+        posting = self._postings.setdefault((field, value), list())
+        # Assays are indexed in order, so a posting list only needs to be
+        # checked against its last entry to remain sorted and unique.
+        if not posting or posting[-1] != position:
+            posting.append(position)
+
+    def lookup(self, field, value):
+        """
+        Returns the sorted positions of the assays in which `field` holds
+        `value`.
+
+        :param field: The field to be matched.
+        :param value: The value to be matched.
+
+        :returns: A list of positions into `assays`.
+        """
+        try:
+            return list(self._postings.get((field, value), ()))
+        except TypeError:
+            # The searched value is unhashable, compare it with the
+            # dictionaries and lists found in this field.
+            return sorted(set(
+                position for position, found in self._complex[field]
+                if found == value))
+
+    def data_files(self, field, value):
+        """
+        Returns the dataFile and assay dictionaries for the assays in which
+        `field` holds `value`, in the format returned by `utils.md_reader`.
+
+        :param field: The field to be matched.
+        :param value: The value to be matched.
+        """
+        found_dict_l = list()
+        for position in self.lookup(field, value):
+            assay = self.assays[position]
+            for datafile in assay['dataFiles']:
+                found_dict_l.append(dict(dataFile=datafile, assay_md=assay))
+        return found_dict_l
+
+
+def get_assay_index(metadata_dict):
+    """
+    Returns the `AssayIndex` of `metadata_dict`, building it only the first
+    time a given metadata dictionary is seen. Metadata dictionaries are
+    identified by object identity, so a modified dictionary must be copied
+    to be indexed again.
+
+    :param metadata_dict: A python dictionary of the ISA metadata.
+    """
+    key = id(metadata_dict)
+
+    with _INDEX_LOCK:
+        cached = _INDEX_CACHE.get(key)
+        # The metadata is held with its index, so its id cannot be reused by
+        # another dictionary while the entry exists.
+        if cached is not None and cached[0] is metadata_dict:
+            _INDEX_CACHE.move_to_end(key)
+            return cached[1]
+
+        index = AssayIndex(metadata_dict)
+        _INDEX_CACHE[key] = (metadata_dict, index)
+        while len(_INDEX_CACHE) > INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+
+    return index
@@ -0,0 +1,218 @@
+"""
+================
+ISA Query Engine
+================
+
+Compound queries over the assays of an ISA metadata dictionary. A query is
+built from `Match` terms combined with `And`, `Or` and `Not` (or with the
+`&`, `|` and `~` operators):
+
+.. code-block:: python
+
+    query = (
+        Match('measurementType.annotationValue', 'Simulated RDF')
+        & Match('characteristicType.annotationValue', {'Al-Ob', 'Al-Oh'})
+        & ~Match('technologyPlatform', 'Unknown'))
+
+    found = run_query(metadata, query)
+
+The field of a `Match` is either a plain field name, which matches that field
+anywhere within an assay, or a dot separated path of field names, which must
+be the trailing part of the path to the value. Lists are transparent in
+paths, so `characteristicCategories.characteristicType.termSource` finds the
+term source of every characteristic category. The value of a `Match` is a
+single value or a set of values, any of which may match.
+
+Every field used by a query is collected from an assay in a single traversal,
+after which the query is evaluated with short-circuiting. Each assay is
+returned at most once, no matter how many terms it matched.
+"""
+
+
+class Query(object):
+    """The base class of all query terms."""
+
+    def fields(self):
+        """Returns the set of field paths, as tuples, used by the query."""
+        raise NotImplementedError
+
+    def evaluate(self, found):
+        """
+        Evaluates the query against the values found in an assay.
+
+        :param found: A dictionary of field path tuples to the set of
+            values found at that path.
+
+        :returns: True if the assay matches the query.
+        """
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Match(Query):
+    """
+    Matches assays in which `field` holds `value`.
+
+    :param field: A field name, or a dot separated path of field names.
+    :param value: A value, or a set, list or tuple of values of which any
+        one must be found.
+    """
+
+    def __init__(self, field, value):
+        self.path = tuple(field.split('.'))
+        if isinstance(value, (set, frozenset, list, tuple)):
+            self.values = frozenset(value)
+        else:
+            self.values = frozenset([value])
+
+    def fields(self):
+        return {self.path}
+
+    def evaluate(self, found):
+        return not self.values.isdisjoint(found.get(self.path, ()))
+
+    def __repr__(self):
+        return "Match({!r}, {!r})".format(
+            '.'.join(self.path), set(self.values))
+
+
+class And(Query):
+    """Matches assays that match every one of `clauses`."""
+
+    def __init__(self, *clauses):
+        self.clauses = clauses
+
+    def fields(self):
+        return set().union(*(clause.fields() for clause in self.clauses))
+
+    def evaluate(self, found):
+        return all(clause.evaluate(found) for clause in self.clauses)
+
+    def __repr__(self):
+        return "And{!r}".format(self.clauses)
+
+
+class Or(Query):
+    """Matches assays that match any one of `clauses`."""
+
+    def __init__(self, *clauses):
+        self.clauses = clauses
+
+    def fields(self):
+        return set().union(*(clause.fields() for clause in self.clauses))
+
+    def evaluate(self, found):
+        return any(clause.evaluate(found) for clause in self.clauses)
+
+    def __repr__(self):
+        return "Or{!r}".format(self.clauses)
+
+
+class Not(Query):
+    """Matches assays that do not match `clause`."""
+
+    def __init__(self, clause):
+        self.clause = clause
+
+    def fields(self):
+        return self.clause.fields()
+
+    def evaluate(self, found):
+        return not self.clause.evaluate(found)
+
+    def __repr__(self):
+        return "Not({!r})".format(self.clause)
+
+
+def query_from_dict(search_dict, combine=Or):
+    """
+    Creates a query from a `md_reader` style search dictionary.
+
+    :param search_dict: A dictionary of field (or field path) to value, or
+        to a set of values.
+    :param combine: The query class used to join the terms, `Or` by default
+        to match the behaviour of `md_reader`.
+    """
+    return combine(*(Match(field, value)
+                     for field, value in search_dict.items()))
+
+
+def collect_field_values(assay, paths):
+    """
+    Collects the values of every field path in `paths` from `assay` in a
+    single traversal.
+
+    :param assay: An individual assay dictionary.
+    :param paths: A collection of field path tuples.
+
+    :returns: A dictionary of each path to the set of values found there.
+        Only hashable values are collected.
+    """
+    # Group the paths by their last field, the only one that needs to be
+    # compared with a key before the rest of the path is checked.
+    by_last_field = dict()
+    for path in paths:
+        by_last_field.setdefault(path[-1], list()).append(path)
+
+    found = dict()
+
+    def crawl(node, key_path):
+        for key, value in node.items():
+            current_path = key_path + (key,)
+
+            for path in by_last_field.get(key, ()):
+                if current_path[-len(path):] == path:
+                    try:
+                        found.setdefault(path, set()).add(value)
+                    except TypeError:
+                        pass
+
+            if isinstance(value, dict):
+                crawl(value, current_path)
+
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        crawl(item, current_path)
+
+    crawl(assay, ())
+    return found
+
+
+def run_query(metadata_dict, query):
+    """
+    Returns the dataFiles of the assays that match `query`.
+
+    :param metadata_dict: A python dictionary of the metadata to be searched.
+    :param query: A `Query`.
+
+    :returns: A list of dictionaries with the datafile and the assay
+        metadata, as returned by `utils.md_reader`. A dataFile is only
+        returned once, even if it is listed by more than one assay.
+    """
+    paths = query.fields()
+    seen_files = set()
+    found_dict_l = list()
+
+    for study in metadata_dict['studies']:
+        for assay in study['assays']:
+
+            if not query.evaluate(collect_field_values(assay, paths)):
+                continue
+
+            for datafile in assay['dataFiles']:
+                file_key = datafile.get('@id') or datafile.get('name')
+                if file_key in seen_files:
+                    continue
+                seen_files.add(file_key)
+                found_dict_l.append(dict(dataFile=datafile, assay_md=assay))
+
+    return found_dict_l
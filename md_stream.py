@@ -0,0 +1,186 @@
+"""
+========================
+Streaming Metadata Index
+========================
+
+Reads large ISA-JSON documents without holding them in memory. The document
+is streamed with the incremental parser of `ijson`, one assay of
+`studies[].assays[]` at a time, and only the fields needed for searching and
+display are kept:
+
+- `dataFiles`
+- the `@id` and `name` of each of `materials.samples`
+- `measurementType`, `technologyType` and `technologyPlatform`
+- `characteristicCategories` and `unitCategories`
+
+`to_metadata()` gives a skeleton document of these summaries, laid out as
+the full assays are, which `utils.md_reader` and the shared store search as
+they would the full document for any of these fields. The other fields of
+an assay, such as its `processSequence`, `comments`, `filename`, other
+materials and the characteristics of its samples, are not in the skeleton
+and are never matched there. The full details of an assay are streamed again
+from the file when they are requested, and the most recent are kept.
+
+`ijson` (`pip install ijson`) is an optional dependency. Without it the
+document is parsed whole with the `json` module, and the full assays are
+served from it.
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+# The fields kept in an assay summary.
+SUMMARY_FIELDS = ("dataFiles", "measurementType", "technologyType",
+                  "technologyPlatform", "characteristicCategories",
+                  "unitCategories")
+
+# The fields kept for each sample of an assay summary.
+SAMPLE_FIELDS = ("@id", "name")
+
+# The number of full assays held after they are fetched.
+DETAILS_CACHE_SIZE = 16
+
+_ASSAY_PREFIX = "studies.item.assays.item"
+_STUDY_PREFIX = "studies.item"
+
+
+def summarize_assay(assay):
+    """
+    Returns the summary of a full assay dictionary, holding only the fields
+    used for searching and display.
+
+    :param assay: An ISA assay dictionary.
+    """
+    summary = {field: assay[field] for field in SUMMARY_FIELDS
+               if field in assay}
+    samples = assay.get("materials", dict()).get("samples", list())
+    summary["materials"] = dict(samples=[
+        {field: sample[field] for field in SAMPLE_FIELDS if field in sample}
+        for sample in samples])
+    return summary
+
+
+def iter_assays(md_file, positions=None):
+    """
+    Streams the assays of an ISA-JSON document.
+
+    :param md_file: The document, opened in binary mode.
+    :param positions: A set of (study, assay) positions to build, or None to
+        build every assay. Other assays are skipped without being built.
+
+    :returns: An iterator of ((study, assay), assay dictionary) tuples.
+    """
+    study_idx, assay_idx = -1, -1
+    builder = None
+
+    for prefix, event, value in ijson.parse(md_file, use_float=True):
+        if builder is not None:
+            if prefix == _ASSAY_PREFIX and event == "end_map":
+                yield (study_idx, assay_idx), builder.value
+                builder = None
+            else:
+                builder.event(event, value)
+            continue
+
+        if prefix == _STUDY_PREFIX and event == "start_map":
+            study_idx, assay_idx = study_idx + 1, -1
+        elif prefix == _ASSAY_PREFIX and event == "start_map":
+            assay_idx += 1
+            if positions is None or (study_idx, assay_idx) in positions:
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+
+
+class MetadataIndex(object):
+    """
+    A compact index of the assays of an ISA-JSON document.
+
+    :param path: The path of the document.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.summaries = list()
+        self.positions = list()
+        self._position_of = dict()
+        self._document = None
+        self._details = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        if ijson is None:
+            logging.info("ijson is not installed, parsing %s whole.",
+                         self.path)
+            with open(self.path, "r") as md_file:
+                self._document = json.load(md_file)
+            assays = (
+                ((study_idx, assay_idx), assay)
+                for study_idx, study in enumerate(
+                    self._document.get("studies", list()))
+                for assay_idx, assay in enumerate(study.get("assays", list())))
+        else:
+            md_file = open(self.path, "rb")
+            assays = iter_assays(md_file)
+
+        try:
+            for position, assay in assays:
+                summary = summarize_assay(assay)
+                self._position_of[id(summary)] = len(self.positions)
+                self.summaries.append(summary)
+                self.positions.append(position)
+        finally:
+            if ijson is not None:
+                md_file.close()
+
+    def __len__(self):
+        return len(self.summaries)
+
+    def to_metadata(self):
+        """
+        Returns a skeleton ISA document of the assay summaries, with the
+        studies and assays in the order of the original document. Studies
+        without assays are left out.
+        """
+        studies = collections.OrderedDict()
+        for (study_idx, _), summary in zip(self.positions, self.summaries):
+            studies.setdefault(study_idx, list()).append(summary)
+        return dict(studies=[dict(assays=assays)
+                             for assays in studies.values()])
+
+    def fetch_assay(self, summary):
+        """
+        Returns the full assay dictionary of an assay summary, streaming it
+        from the document if it is not held.
+
+        :param summary: An assay summary of this index.
+        """
+        position = self.positions[self._position_of[id(summary)]]
+        if self._document is not None:
+            study_idx, assay_idx = position
+            return self._document["studies"][study_idx]["assays"][assay_idx]
+
+        with self._lock:
+            if position in self._details:
+                self._details.move_to_end(position)
+                return self._details[position]
+
+        with open(self.path, "rb") as md_file:
+            for _, assay in iter_assays(md_file, positions={position}):
+                break
+            else:
+                raise KeyError("No assay at {} in {}.".format(
+                    position, self.path))
+
+        with self._lock:
+            self._details[position] = assay
+            while len(self._details) > DETAILS_CACHE_SIZE:
+                self._details.popitem(last=False)
+        return assay
@@ -0,0 +1,118 @@
+"""
+=========================
+Parallel Data File Loader
+=========================
+
+Loads the dataframes of many ISA dataFiles at once with a pool of threads or
+processes, so that the time taken is no longer the sum of every file's parse
+time.
+
+The pandas C parser releases the GIL for most of its work, so threads are
+usually enough. A process pool avoids the GIL entirely, but every frame must
+then be pickled back to the parent, and memory-mapped cache columns are
+copied in the process.
+
+Errors are collected per file rather than raised, so a single bad file does
+not abort the whole load.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import os
+import time
+
+from utils import create_pandas_dataframe
+
+
+# The executor used when none is given: 'thread', 'process' or 'serial'.
+DEFAULT_EXECUTOR = os.environ.get("ALBOKEH_LOAD_EXECUTOR", "thread")
+
+# The number of workers used when none is given. None lets the executor
+# choose from the number of processors.
+DEFAULT_WORKERS = os.environ.get("ALBOKEH_LOAD_WORKERS")
+
+LoadResult = collections.namedtuple(
+    "LoadResult", ["data_file", "dataframe", "error", "seconds"])
+LoadResult.__doc__ = """
+The outcome of loading one dataFile. Exactly one of `dataframe` and `error`
+is None. `seconds` is the time spent loading the file in its worker.
+"""
+
+
+def _timed_load(loader, data_file):
+    """Loads one dataFile, returning the frame or error and the time taken.
+    This runs within a worker, so it must not raise."""
+    start = time.perf_counter()
+    try:
+        dataframe, error = loader(data_file), None
+    except Exception as err:
+        dataframe, error = None, err
+    return dataframe, error, time.perf_counter() - start
+
+
+def _future_outcome(future):
+    """Returns the outcome of a load, or the error that stopped the pool from
+    returning it, such as a crashed worker or an unpicklable frame."""
+    try:
+        return future.result()
+    except Exception as err:
+        return None, err, float("nan")
+
+
+def _create_executor(executor, max_workers):
+    """Returns a concurrent.futures executor, or None for a serial load."""
+    if executor == "thread":
+        return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    if executor == "process":
+        return concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    if executor == "serial":
+        return None
+    raise ValueError("Unknown executor {!r}, expected 'thread', 'process' "
+                     "or 'serial'.".format(executor))
+
+
+def load_dataframes(data_files, executor=None, max_workers=None,
+                    loader=create_pandas_dataframe):
+    """
+    Loads the dataframe of every dataFile in `data_files`.
+
+    :param data_files: A list of ISA dataFile dictionaries.
+    :param executor: 'thread', 'process' or 'serial'. Defaults to the
+        `ALBOKEH_LOAD_EXECUTOR` environment variable, or 'thread'.
+    :param max_workers: The size of the pool. Defaults to the
+        `ALBOKEH_LOAD_WORKERS` environment variable.
+    :param loader: The function that loads a dataFile dictionary. It must be
+        picklable to be used with a process pool.
+
+    :returns: A list of `LoadResult`, in the same order as `data_files`.
+    """
+    executor = executor or DEFAULT_EXECUTOR
+    if max_workers is None and DEFAULT_WORKERS:
+        max_workers = int(DEFAULT_WORKERS)
+
+    start = time.perf_counter()
+    pool = _create_executor(executor, max_workers)
+
+    if pool is None:
+        outcomes = [_timed_load(loader, data_file)
+                    for data_file in data_files]
+    else:
+        with pool:
+            futures = [pool.submit(_timed_load, loader, data_file)
+                       for data_file in data_files]
+            outcomes = [_future_outcome(future) for future in futures]
+
+    results = list()
+    for data_file, (dataframe, error, seconds) in zip(data_files, outcomes):
+        name = data_file.get("name")
+        if error is None:
+            logging.info("Loaded %s in %.3f s", name, seconds)
+        else:
+            logging.warning("Failed to load %s after %.3f s: %r",
+                            name, seconds, error)
+        results.append(LoadResult(data_file, dataframe, error, seconds))
+
+    logging.info("Loaded %d data files with the %s executor in %.3f s",
+                 len(results), executor, time.perf_counter() - start)
+    return results
@@ -5,23 +5,282 @@ Pandas CSV Reader Reference
 
 A reference of needed keyword arguments to ensure that different types of
 `.csv` files are appropriately loaded as pandas dataframes.
+
+Each reader is registered for the ISA dataFile `type` (the label of the
+`DataFile` subclass in `generateISA`) that it loads, together with the dtypes
+of its columns and the pandas parse engine it prefers. Declared dtypes save
+pandas from inferring them, and let float32 and categorical columns be used
+where they lose nothing. New formats are supported by registering a reader
+with `register_reader()`.
 """
 
+import collections
+import functools
+import hashlib
+import io
+import logging
+import os
+import re
+
+import numpy as np
 import pandas as pd
 
 
-def maxime_rdf_csv(path):
+# Fortran double precision exponents, such as `0.34D-05`.
+FORTRAN_D_EXPONENT = re.compile(r'(?<=[0-9.])[dD](?=[+-]?[0-9])')
+
+# The name of the sub-directory of the cache directory that holds the
+# spectrum sidecars.
+SIDECAR_DIRNAME = "sidecars"
+
+ReaderSpec = collections.namedtuple(
+    "ReaderSpec", ["reader", "dtypes", "engine"])
+ReaderSpec.__doc__ = """
+A registered reader. `reader` is called as `reader(path=..., dtype=dtypes,
+engine=engine)` and returns a dataframe. `dtypes` is a single dtype for every
+column, or a dictionary of column name to dtype, or None to let pandas infer
+them. `engine` is the pandas parse engine.
+"""
+
+READER_REGISTRY = dict()
+
+
+def register_reader(isa_type, reader, dtypes=None, engine='c'):
     """
-    Creates pandas dataframes from Maxime's RDF files.
-    Maxime-RDF
+    Registers `reader` as the reader of ISA dataFiles of `isa_type`,
+    replacing any reader already registered for it.
+
+    :param isa_type: The ISA dataFile type, such as "Maxime-RDF".
+    :param reader: A function taking `path`, `dtype` and `engine` keyword
+        arguments that returns a pandas dataframe.
+    :param dtypes: The dtype, or dictionary of dtypes, of the columns.
+    :param engine: The preferred pandas parse engine.
+    """
+    READER_REGISTRY[isa_type] = ReaderSpec(reader, dtypes, engine)
+
+
+def reader_key(spec):
+    """
+    Returns a string describing a `ReaderSpec` that is the same in every
+    process, for use in cache keys.
+    """
+    reader = spec.reader
+    keywords = dict()
+    if isinstance(reader, functools.partial):
+        keywords = reader.keywords
+        reader = reader.func
+    dtypes = spec.dtypes
+    if isinstance(dtypes, dict):
+        dtypes = sorted(
+            (name, dtype if dtype == "category" else str(np.dtype(dtype)))
+            for name, dtype in dtypes.items())
+    elif dtypes is not None:
+        dtypes = str(np.dtype(dtypes))
+    return repr((reader.__module__, reader.__qualname__,
+                 sorted(keywords.items()), dtypes, spec.engine))
+
+
+def get_reader(isa_type):
+    """
+    Returns the `ReaderSpec` registered for `isa_type`.
+
+    :raises ValueError: If no reader is registered for `isa_type`.
+    """
+    try:
+        return READER_REGISTRY[isa_type]
+    except KeyError:
+        raise ValueError(
+            "No reader is registered for the ISA dataFile type {!r}. "
+            "Registered types are: {}.".format(
+                isa_type, ", ".join(sorted(READER_REGISTRY))))
+
+
+def read_hash_header(path):
+    """
+    Reads the column names from the first line of a whitespace delimited file
+    whose header line starts with a hash-tag, such as:
+
+        # r           RDF_Al-Ob    RDF_Al-Oh  RCN_Al-Ob   RCN_Al-Oh
+
+    :param path: The path of the file.
+
+    :returns: A list of the column names.
     """
-    df = pd.read_csv(
-        filepath_or_buffer=path,
+    with open(path, "r") as data_file:
+        header = data_file.readline()
+    return header.lstrip().lstrip("#").split()
+
+
+def read_hash_header_table(path, dtype=np.float64, engine='c'):
+    """
+    Creates a pandas dataframe from a whitespace delimited file with a leading
+    hash-tag header line. The header is parsed once, and the body is parsed by
+    the C tokenizer straight into correctly named columns. Data columns beyond
+    those named in the header are not read.
+
+    :param path: The path of the file.
+    :param dtype: The dtype of every column.
+    :param engine: The pandas parse engine, 'c' or 'python'.
+    """
+    return _read_named_table(path, read_hash_header(path), dtype, engine)
+
+
+def _read_named_table(source, names, dtype, engine='c'):
+    """Parses the body of a hash-tag header table into the named columns."""
+    return pd.read_csv(
+        filepath_or_buffer=source,
+        sep=r'\s+',  # Split by whitespace, handled by the C engine.
+        engine=engine,
+        header=None,
+        skiprows=1,
+        names=names,
+        usecols=range(len(names)),
         index_col=False,
-        sep='\s+'  # Split by whitespace
+        dtype=dtype,
     )
-    # Move the columns to deal with the leading hash-tag
-    df_mod = df[df.columns[:-1]]
-    df_mod.columns = df.columns[1:]
 
-    return df_mod
+
+def maxime_rdf_csv(path, dtype=np.float64, engine='c'):
+    """
+    Creates pandas dataframes from Maxime's RDF files.
+    Maxime-RDF
+
+    :param path: The path of the `d*.RDF` file.
+    :param dtype: The dtype of the columns, `np.float32` may be used to halve
+        the memory used.
+    :param engine: The pandas parse engine.
+    """
+    return read_hash_header_table(path, dtype=dtype, engine=engine)
+
+
+def plot_csv_extract(path, dtype=None, engine='c'):
+    """
+    Creates pandas dataframes from the comma separated values extracted from
+    the plots and tables of publications.
+    Plot-csv-extract
+
+    :param path: The path of the `.csv` file.
+    :param dtype: A dictionary of column name to dtype. Columns that are not
+        present in the file are ignored.
+    :param engine: The pandas parse engine.
+    """
+    return pd.read_csv(filepath_or_buffer=path, dtype=dtype, engine=engine)
+
+
+def _read_fortran_table(path, dtype=np.float64, engine='c'):
+    """
+    Reads a hash-tag header table, as `read_hash_header_table()`, that may
+    contain Fortran `D` exponents. `E` exponents are read directly by the C
+    parser, the `D` exponents are only rewritten if the fast parse fails.
+    """
+    try:
+        return read_hash_header_table(path, dtype=dtype, engine=engine)
+    except ValueError:
+        with open(path, "r") as data_file:
+            text = FORTRAN_D_EXPONENT.sub("E", data_file.read())
+        return _read_named_table(
+            io.StringIO(text), read_hash_header(path), dtype, engine)
+
+
+def _frame_from_block(block, names):
+    """
+    Wraps a two dimensional, column-major array in a dataframe without
+    copying it. Each column of the dataframe is a contiguous view of the
+    array.
+    """
+    return pd.DataFrame(block, columns=names, copy=False)
+
+
+def sidecar_path(path):
+    """
+    Returns the path of the sidecar of a data file. Sidecars are kept in the
+    cache directory of the data directory, see `md_cache.cache_dir`, and
+    never beside the data file. The name starts with a digest of the path,
+    so data files of the same name in other directories do not collide in a
+    shared cache directory.
+
+    :param path: The path of the source data file.
+    """
+    # Imported here, md_cache imports this module through isa_registrar.
+    from md_cache import cache_dir
+
+    path = os.path.abspath(path)
+    return os.path.join(
+        cache_dir(os.path.dirname(path)), SIDECAR_DIRNAME, "{}-{}.npy".format(
+            hashlib.sha1(path.encode("utf-8")).hexdigest()[:16],
+            os.path.basename(path)))
+
+
+def _sidecar_is_fresh(sidecar_path, path):
+    """Returns True if the sidecar exists and is newer than its source."""
+    try:
+        return os.stat(sidecar_path).st_mtime_ns >= os.stat(path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def maxime_pws_csv(path, sidecar=True, dtype=np.float64, engine='c'):
+    """
+    Creates pandas dataframes from Maxime's vibrational power spectrum files.
+    Maxime Vibrational Spectrum
+
+    The `d*.el.PWS` files contain trailing columns that are not named in the
+    header, these are not read.
+
+    The first parse writes the values to a `.npy` sidecar in the cache
+    directory, see `sidecar_path()`, in column-major order. Later loads
+    memory-map the sidecar, so no text is parsed, no data is copied, and the
+    pages are shared by every process that loads the same file. The sidecar
+    is replaced when the source file is newer than it.
+
+    :param path: The path of the `d*.PWS` file.
+    :param sidecar: If False the sidecar is neither read nor written.
+    :param dtype: The dtype of the columns.
+    :param engine: The pandas parse engine.
+    """
+    names = read_hash_header(path)
+    block_path = sidecar_path(path)
+
+    if sidecar and _sidecar_is_fresh(block_path, path):
+        block = np.load(block_path, mmap_mode='r')
+        if (block.ndim == 2 and block.shape[1] == len(names)
+                and block.dtype == np.dtype(dtype)):
+            return _frame_from_block(block, names)
+
+    df = _read_fortran_table(path, dtype=dtype, engine=engine)
+    if not sidecar:
+        return df
+
+    tmp_path = "{}.{}.tmp.npy".format(block_path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(block_path), exist_ok=True)
+        np.save(tmp_path, np.asfortranarray(df.to_numpy(dtype=dtype)))
+        os.replace(tmp_path, block_path)
+    except OSError as err:
+        logging.warning("Unable to write the sidecar %s: %s", block_path, err)
+        return df
+
+    return _frame_from_block(np.load(block_path, mmap_mode='r'), names)
+
+
+# The columns of the extracted publication data. Measured values are stored
+# to at most four significant figures, so float32 loses nothing.
+PLOT_CSV_DTYPES = {
+    "Al_concentration": np.float32,
+    "OH_concentration": np.float32,
+    "CI_concentration": np.float32,
+    "Al_ppm": np.float32,
+    "wavelength": np.float32,
+    "temperature": np.float32,
+    "counter_ion": "category",
+}
+
+# The RDF files hold four decimal places, well within float32 precision. The
+# power spectra hold nine significant figures, and must remain float64. The
+# frame cache takes the place of the spectrum sidecar.
+register_reader("Maxime-RDF", maxime_rdf_csv, dtypes=np.float32)
+register_reader(
+    "Maxime Vibrational Spectrum",
+    functools.partial(maxime_pws_csv, sidecar=False),
+    dtypes=np.float64)
+register_reader("Plot-csv-extract", plot_csv_extract, dtypes=PLOT_CSV_DTYPES)
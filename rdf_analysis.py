@@ -0,0 +1,196 @@
+"""
+==================
+RDF Shell Analysis
+==================
+
+Finds the coordination shells of radial distribution functions (RDF): the
+first peak, the first minimum after it, the highest peak beyond that
+minimum, and the running coordination number (RCN) at the first minimum.
+
+Every curve of every sample is analysed in one vectorized pass. The curves
+are stacked into a matrix, padded with NaN where their lengths differ, so
+no Python loop runs over the points.
+
+The RCN is read from the `RCN_<bond>` column of a file, and is NaN for
+files without one. It is not integrated from the RDF, which would need the
+number density of the second atom of the pair, and the metadata does not
+describe the simulation box.
+
+Results are cached per sample and data file version, so a file is only
+analysed again once it has changed.
+"""
+
+import collections
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils import data_file_version
+
+
+# The first peak is the first local maximum at least this fraction of the
+# curve's highest value, so that noise on its rising edge is skipped.
+FIRST_PEAK_FRACTION = 0.1
+
+# The number of analysed samples held in the cache.
+ANALYSIS_CACHE_SIZE = 1024
+
+RESULT_COLUMNS = [
+    "sample", "bond",
+    "peak_r", "peak_g",
+    "min_r", "min_g",
+    "second_peak_r", "second_peak_g",
+    "rcn_min",
+]
+
+_CACHE = collections.OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def stack_curves(curves):
+    """
+    Stacks one dimensional arrays of differing lengths into a matrix with a
+    row per array, padding the end of shorter rows with NaN.
+
+    :param curves: A list of one dimensional arrays.
+    """
+    length = max((len(curve) for curve in curves), default=0)
+    matrix = np.full((len(curves), length), np.nan)
+    for row, curve in enumerate(curves):
+        matrix[row, :len(curve)] = curve
+    return matrix
+
+
+def _take(matrix, indices, found):
+    """Returns matrix[row, indices[row]], or NaN where nothing was found."""
+    values = np.take_along_axis(matrix, indices[:, None], axis=1)[:, 0]
+    return np.where(found, values, np.nan)
+
+
+def analyze_rdfs(r, g, rcn=None):
+    """
+    Finds the shells of every RDF curve at once.
+
+    :param r: A matrix of the `r` values of each curve, NaN padded.
+    :param g: A matrix of the RDF values of each curve, NaN padded.
+    :param rcn: A matrix of the RCN values of each curve, with rows of NaN
+        for curves without them, or None if no curve has them.
+
+    :returns: A dictionary of arrays with a value per curve, keyed by the
+        columns of RESULT_COLUMNS after "bond".
+    """
+    rows = np.arange(len(g))
+    n_points = g.shape[1]
+    positions = np.arange(n_points)
+
+    # Interior local maxima and minima. Comparisons with NaN are False, so
+    # padding is never selected.
+    left, mid, right = g[:, :-2], g[:, 1:-1], g[:, 2:]
+    is_max = np.zeros(g.shape, dtype=bool)
+    is_min = np.zeros(g.shape, dtype=bool)
+    is_max[:, 1:-1] = (mid > left) & (mid >= right)
+    is_min[:, 1:-1] = (mid < left) & (mid <= right)
+
+    highest = np.nanmax(np.where(np.isnan(g), -np.inf, g), axis=1)
+    is_max &= g >= FIRST_PEAK_FRACTION * highest[:, None]
+    has_peak = is_max.any(axis=1)
+    peak_idx = np.argmax(is_max, axis=1)
+
+    is_min &= positions[None, :] > peak_idx[:, None]
+    has_min = has_peak & is_min.any(axis=1)
+    min_idx = np.argmax(is_min, axis=1)
+
+    beyond = np.where(positions[None, :] > min_idx[:, None], g, -np.inf)
+    beyond = np.where(np.isnan(beyond), -np.inf, beyond)
+    second_idx = np.argmax(beyond, axis=1)
+    # The second peak must rise above the minimum, curves that stay at zero
+    # beyond the first shell have none.
+    has_second = has_min & (beyond[rows, second_idx] > g[rows, min_idx])
+
+    if rcn is None:
+        rcn = np.full(g.shape, np.nan)
+
+    return dict(
+        peak_r=_take(r, peak_idx, has_peak),
+        peak_g=_take(g, peak_idx, has_peak),
+        min_r=_take(r, min_idx, has_min),
+        min_g=_take(g, min_idx, has_min),
+        second_peak_r=_take(r, second_idx, has_second),
+        second_peak_g=_take(g, second_idx, has_second),
+        rcn_min=_take(rcn, min_idx, has_min),
+    )
+
+
+def analyze_frames(frames):
+    """
+    Analyses every `RDF_<bond>` column of every frame in one pass.
+
+    :param frames: A dictionary of sample name to RDF dataframe, each with
+        an `r` column.
+
+    :returns: A dataframe with the columns of RESULT_COLUMNS and a row per
+        sample and bond.
+    """
+    samples, bonds, rs, gs, rcns = list(), list(), list(), list(), list()
+    for sample, frame in frames.items():
+        r = frame["r"].to_numpy(dtype=np.float64)
+        for column in frame.columns:
+            if not column.startswith("RDF_"):
+                continue
+            bond = column[len("RDF_"):]
+            samples.append(sample)
+            bonds.append(bond)
+            rs.append(r)
+            gs.append(frame[column].to_numpy(dtype=np.float64))
+            rcn_column = "RCN_" + bond
+            rcns.append(frame[rcn_column].to_numpy(dtype=np.float64)
+                        if rcn_column in frame.columns
+                        else np.full(len(r), np.nan))
+
+    if not gs:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    results = analyze_rdfs(
+        stack_curves(rs), stack_curves(gs), stack_curves(rcns))
+    return pd.DataFrame(
+        dict(sample=samples, bond=bonds, **results), columns=RESULT_COLUMNS)
+
+
+def analyze_samples(store, samples):
+    """
+    Returns the shell analysis of `samples`, analysing the samples whose
+    data files have changed, or were never analysed, in one pass.
+
+    :param store: The `shared_store.SharedDataStore` holding the samples.
+    :param samples: A list of sample names.
+
+    :returns: A dataframe with the columns of RESULT_COLUMNS, in the order
+        of `samples`.
+    """
+    keys = {sample: (sample, data_file_version(
+        store.sample_metadata[sample]["dataFile"]["name"]))
+        for sample in samples}
+
+    cached = dict()
+    with _CACHE_LOCK:
+        for sample in samples:
+            if keys[sample] in _CACHE:
+                _CACHE.move_to_end(keys[sample])
+                cached[sample] = _CACHE[keys[sample]]
+
+    missing = [sample for sample in samples if sample not in cached]
+    if missing:
+        analysed = analyze_frames(
+            {sample: store.frame(sample) for sample in missing})
+        with _CACHE_LOCK:
+            for sample, rows in analysed.groupby("sample", sort=False):
+                rows = rows.reset_index(drop=True)
+                _CACHE[keys[sample]] = cached[sample] = rows
+            while len(_CACHE) > ANALYSIS_CACHE_SIZE:
+                _CACHE.popitem(last=False)
+
+    parts = [cached[sample] for sample in samples if sample in cached]
+    if not parts:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.concat(parts, ignore_index=True)
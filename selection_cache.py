@@ -0,0 +1,192 @@
+"""
+=====================
+Selection Memoization
+=====================
+
+Users flip back and forth between the same few selections of samples and
+bonds. What a selection builds is therefore kept here and shared by every
+session of the process, so that a selection made again, in this or another
+session, is not assembled again:
+
+- The renderer specs of a selection, the (sample, bond, label) of each pair
+  of its samples and bonds that has a curve.
+- The data of the multi_line and circle sources of each bond of a selection
+  in 'batched' mode, with the curves of every sample packed together.
+
+The columns of each sample are not held here, they are views of the frames
+held by the shared store. Curves downsampled to the x-range of a session's
+figure are cut from the held data for each session.
+
+A selection is normalized before it is built: its samples are put in the
+order of the store and its bonds in the order of the bond vocabulary, so the
+same selection made in another order builds the same figure.
+
+The keys hold the versions of the data files of the selected samples, so
+that an entry is not served once a file has changed. The entries of a sample
+are also dropped as soon as the store reloads it.
+
+The entries are bounded in number and in size, and the least recently used
+are evicted first. The arrays they hold are shared, and must be treated as
+read-only.
+"""
+
+import os
+
+import numpy as np
+
+import instrument
+from frame_store import LRUFrameStore
+from utils import data_file_version
+
+
+# The bounds of the memoized selections.
+SELECTION_CACHE_SIZE = int(os.environ.get(
+    "ALBOKEH_SELECTION_CACHE_SIZE", 256))
+SELECTION_CACHE_BYTES = int(os.environ.get(
+    "ALBOKEH_SELECTION_CACHE_BYTES", 64 * 1024 * 1024))
+
+# The columns of the lines and points data of a bond in 'batched' mode.
+LINE_COLUMNS = ("xs", "ys", "sample", "sample_idx")
+POINT_COLUMNS = ("x", "y", "sample_idx")
+
+# The selections built by every session of this process. Each entry is a
+# dictionary of columns, and is loaded by the function that builds it.
+SELECTION_CACHE = LRUFrameStore(
+    None, max_items=SELECTION_CACHE_SIZE, max_bytes=SELECTION_CACHE_BYTES,
+    sizeof=instrument.column_data_nbytes)
+
+
+def normalize_selection(store, samples, bonds):
+    """
+    Returns the samples and bonds of a selection as tuples without
+    duplicates, in the order of the store and of its bond vocabulary.
+
+    :param store: The `shared_store.SharedDataStore` holding the samples.
+    :param samples: A sequence of sample names.
+    :param bonds: A sequence of bond names.
+    """
+    bond_order = {bond: idx for idx, bond in enumerate(store.bond_vocabulary)}
+    samples = tuple(sorted(set(samples), key=store.sample_rows.__getitem__))
+    bonds = tuple(sorted(
+        set(bonds), key=lambda bond: (bond_order.get(bond, len(bond_order)),
+                                      bond)))
+    return samples, bonds
+
+
+def selection_versions(store, samples):
+    """
+    Returns the versions of the data files of `samples`, which are part of
+    the key of every entry built from them.
+
+    :param store: The `shared_store.SharedDataStore` holding the samples.
+    :param samples: A normalized tuple of sample names.
+    """
+    return tuple(
+        data_file_version(store.sample_metadata[sample]["dataFile"]["name"])
+        for sample in samples)
+
+
+def sample_columns(store, sample):
+    """
+    Returns the `r` and `RDF_*` columns of a sample, which are views of the
+    frame held by the store.
+
+    :param store: The `shared_store.SharedDataStore` holding the sample.
+    :param sample: The sample name.
+    """
+    frame = store.frame(sample)
+    return {col: frame[col].to_numpy() for col in frame.columns
+            if col == 'r' or col.startswith('RDF_')}
+
+
+def renderer_label(sample, bond):
+    """Returns the label of the renderers of a (sample, bond) pair. Samples
+    are named by their key in the store's sample metadata, so no frame is
+    loaded to label them."""
+    return "{} ({})".format(sample, bond)
+
+
+def renderer_specs(store, samples, bonds):
+    """
+    Returns the (sample, bond, label) specs of the renderers of a selection,
+    one for each pair of its samples and bonds that has a curve.
+
+    :param store: The `shared_store.SharedDataStore` holding the samples.
+    :param samples: A normalized tuple of sample names.
+    :param bonds: A normalized tuple of bond names.
+    """
+    def build(key):
+        specs = dict(sample=list(), bond=list(), label=list())
+        for sample in samples:
+            columns = sample_columns(store, sample)
+            for bond in bonds:
+                if 'RDF_' + bond in columns:
+                    specs["sample"].append(sample)
+                    specs["bond"].append(bond)
+                    specs["label"].append(renderer_label(sample, bond))
+        return specs
+
+    specs = SELECTION_CACHE.get(
+        ("specs", samples, bonds, selection_versions(store, samples)), build)
+    return list(zip(specs["sample"], specs["bond"], specs["label"]))
+
+
+def bond_data(store, samples, bond):
+    """
+    Returns the whole curves of `bond` for every one of `samples` that has
+    it, packed into the data of the multi_line and circle sources of the
+    bond. Each sample is drawn with its row in the store as `sample_idx`.
+
+    :param store: The `shared_store.SharedDataStore` holding the samples.
+    :param samples: A normalized tuple of sample names.
+    :param bond: The bond name.
+
+    :returns: A tuple of the lines and points data dictionaries. The lists
+        of the lines are copies, the arrays are shared.
+    """
+    def build(key):
+        active_bond = 'RDF_' + bond
+        data = {name: list() for name in LINE_COLUMNS}
+        for sample in samples:
+            columns = sample_columns(store, sample)
+            if active_bond in columns:
+                data["xs"].append(columns['r'])
+                data["ys"].append(columns[active_bond])
+                data["sample"].append(sample)
+                data["sample_idx"].append(store.sample_rows[sample])
+        data.update(("point_" + name, values)
+                    for name, values in pack_points(
+                        data["xs"], data["ys"], data["sample_idx"]).items())
+        return data
+
+    data = SELECTION_CACHE.get(
+        ("bond", samples, bond, selection_versions(store, samples)), build)
+    lines = {name: list(data[name]) for name in LINE_COLUMNS}
+    points = {name: data["point_" + name] for name in POINT_COLUMNS}
+    return lines, points
+
+
+def pack_points(xs, ys, sample_idx):
+    """
+    Returns the data of the circle source of a bond, every point of the
+    curves `xs` and `ys` with the index of its sample.
+
+    :param xs: A list of the x values of each curve.
+    :param ys: A list of the y values of each curve.
+    :param sample_idx: A list of the sample index of each curve.
+    """
+    if not xs:
+        return dict(x=[], y=[], sample_idx=[])
+    return dict(
+        x=np.concatenate(xs),
+        y=np.concatenate(ys),
+        sample_idx=np.repeat(
+            np.asarray(sample_idx, dtype=np.int32), [len(x) for x in xs]))
+
+
+def invalidate_sample(sample):
+    """Drops every selection holding `sample`, for use as a store
+    listener."""
+    for key in SELECTION_CACHE.keys():
+        if sample in key[1]:
+            SELECTION_CACHE.invalidate(key)
@@ -0,0 +1,51 @@
+"""
+======================
+Server Lifecycle Hooks
+======================
+
+Bokeh calls these hooks when this directory is served as an app, for example
+with `bokeh serve albokeh`. The metadata and dataframes are loaded once, when
+the server starts, into the shared store used by every session.
+
+The time taken to import the serving modules is logged, along with whether
+isatools was imported, to track the cost of starting a server.
+"""
+
+import logging
+import os
+import sys
+import time
+
+_IMPORT_START = time.perf_counter()
+import shared_store
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
+
+
+def on_server_loaded(server_context):
+    """Loads the metadata and dataframes into the shared store."""
+    logging.info("Imported the serving modules in %.3f s (isatools: %s)",
+                 IMPORT_SECONDS, "isatools" in sys.modules)
+    start = time.perf_counter()
+    store = shared_store.init_store(
+        preload=os.environ.get("ALBOKEH_PRELOAD", "1") != "0")
+    logging.info(
+        "Loaded %d samples into the shared store in %.3f s "
+        "(isatools: %s): %s",
+        len(store.samples), time.perf_counter() - start,
+        "isatools" in sys.modules, store.frames.stats())
+
+
+def on_server_unloaded(server_context):
+    """Stops watching the data files, nothing else is held outside of the
+    process."""
+    shared_store.get_store().stop_watching()
+
+
+def on_session_created(session_context):
+    """Sessions only reference the shared store, so hold nothing here."""
+    pass
+
+
+def on_session_destroyed(session_context):
+    """Sessions only reference the shared store, so hold nothing here."""
+    pass
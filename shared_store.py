@@ -0,0 +1,305 @@
+"""
+=================
+Shared Data Store
+=================
+
+Bokeh executes `main.py` once for every new session, while imported modules
+are only executed once per server process. The metadata, the list of samples
+and the loaded dataframes are therefore held here, and are shared by every
+session of the process. Sessions only hold references to them.
+
+The store is created by `server_lifecycle.on_server_loaded()` when the app is
+served as a directory. When `main.py` is served on its own the store is
+created by the first session instead.
+
+Everything held by the store is shared, and must be treated as read-only.
+
+With `ALBOKEH_WATCH` set to 1 the data files of the samples are watched. A
+changed file has its dataframe loaded again, and the sessions listening to
+the store are told which sample changed.
+"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+import types
+import weakref
+
+import numpy as np
+
+from md_cache import load_compiled_metadata, compiled_metadata_path
+from md_stream import MetadataIndex
+from frame_store import LRUFrameStore
+from live_reload import FileWatcher
+from parallel_load import load_dataframes
+from utils import md_reader, create_pandas_dataframe, get_sample_names,\
+    retr_termSource_values
+
+
+# The data directory, which can be moved with an environment variable.
+DATA_PATH = os.environ.get(
+    "ALBOKEH_DATA_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+# A metadata document to serve in place of the one compiled from the data
+# directory, such as one written by `gen_scaled_ISA`. Like the compiled
+# metadata, it is streamed into a compact index of its assays rather than
+# loaded whole.
+METADATA_PATH = os.environ.get("ALBOKEH_METADATA_PATH")
+
+# Whether to serve the last compiled metadata as it is, rather than
+# registering the files that have changed since it was compiled.
+FAST_START = os.environ.get("ALBOKEH_FAST_START", "0") != "0"
+
+# Create the search dictionary for retr_dataframe
+SEARCH_DICT = {'annotationValue': 'Simulated RDF'}
+
+# The bounds of the loaded dataframe store. Frames beyond these are evicted,
+# least recently used first, and are loaded again when next selected.
+MAX_LOADED_FRAMES = int(os.environ.get("ALBOKEH_MAX_FRAMES", 32))
+MAX_LOADED_BYTES = os.environ.get("ALBOKEH_MAX_FRAME_BYTES")
+
+# The number of threads that build the figures of every session.
+BUILD_WORKERS = int(os.environ.get("ALBOKEH_BUILD_WORKERS", 4))
+
+# Whether the served data files are watched, and reloaded when they change.
+WATCH_FILES = os.environ.get("ALBOKEH_WATCH", "0") != "0"
+WATCH_INTERVAL = float(os.environ.get("ALBOKEH_WATCH_INTERVAL", 1.0))
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+_BUILD_EXECUTOR = None
+
+
+class SharedDataStore(object):
+    """
+    The metadata, samples and dataframes shared by every session.
+
+    :param data_path: The path to the data directory.
+    :param search_dict: The search dictionary passed to `md_reader` to find
+        the dataFiles to be served.
+    :param metadata: The ISA metadata dictionary to serve, or None to index
+        the document at METADATA_PATH, if it is set, or the compiled
+        metadata of `data_path`.
+    """
+
+    def __init__(self, data_path=DATA_PATH, search_dict=SEARCH_DICT,
+                 metadata=None):
+        self.data_path = os.path.abspath(data_path)
+
+        # An index of the assays of a large document, which holds only their
+        # summaries and fetches their full details on demand.
+        self.metadata_index = None
+        if metadata is None:
+            md_path = METADATA_PATH or compiled_metadata_path(
+                self.data_path, allow_stale=FAST_START)
+            if md_path is not None:
+                self.metadata_index = MetadataIndex(md_path)
+                metadata = self.metadata_index.to_metadata()
+            else:
+                # The compiled metadata could not be written, and is held
+                # in memory instead.
+                metadata = load_compiled_metadata(self.data_path)
+        self.metadata = metadata
+
+        # This returns a list of dictionaries with the following fields:
+        #   dataFile - the datafile dictionary
+        #   assay_md - the assay metadata dictionary
+        dfmd = md_reader(self.metadata, search_dict)
+
+        samples = list()
+        sample_metadata = dict()
+        for data_dict in dfmd:
+            # Find the sample that this dataframe represents:
+            # TODO: Fix list parsing hack
+            new_sample = get_sample_names(data_dict.get("assay_md"))[0]
+            samples.append(new_sample)
+            sample_metadata[new_sample] = types.MappingProxyType(dict(
+                dataFile=data_dict.get("dataFile"),
+                assay_md=data_dict.get("assay_md"),
+                assay_bonds=(tuple(retr_termSource_values(
+                    data_dict.get("assay_md"), "Inter-atom distances")),)
+            ))
+
+        self.samples = tuple(samples)
+        self.sample_metadata = types.MappingProxyType(sample_metadata)
+
+        # The bonds of every sample, as a vocabulary of bonds and a boolean
+        # mask with a row per sample and a column per bond.
+        bond_columns = dict()
+        for sample in self.samples:
+            for bond in sample_metadata[sample]["assay_bonds"][0]:
+                bond_columns.setdefault(bond, len(bond_columns))
+        self.bond_vocabulary = np.array(list(bond_columns), dtype=object)
+        self.sample_rows = types.MappingProxyType(
+            {sample: row for row, sample in enumerate(self.samples)})
+        self.sample_bond_mask = np.zeros(
+            (len(self.samples), len(bond_columns)), dtype=bool)
+        for sample, row in self.sample_rows.items():
+            for bond in sample_metadata[sample]["assay_bonds"][0]:
+                self.sample_bond_mask[row, bond_columns[bond]] = True
+        self.sample_bond_mask.flags.writeable = False
+
+        self.frames = LRUFrameStore(
+            self._load_sample_dataframe,
+            max_items=MAX_LOADED_FRAMES,
+            max_bytes=int(MAX_LOADED_BYTES) if MAX_LOADED_BYTES else None)
+
+        # The functions called with a sample when its data file changes. They
+        # are held weakly, so the listeners of closed sessions are dropped.
+        self._listeners = weakref.WeakSet()
+        self._watcher = None
+
+    def _load_sample_dataframe(self, sample):
+        """Constructs the dataframe of a sample."""
+        return create_pandas_dataframe(
+            self.sample_metadata[sample]["dataFile"])
+
+    def assay_details(self, sample):
+        """
+        Returns the full assay metadata of a sample. When the metadata is
+        indexed only a summary of each assay is held, and the full assay is
+        fetched from the document.
+        """
+        assay_md = self.sample_metadata[sample]["assay_md"]
+        if self.metadata_index is None:
+            return assay_md
+        try:
+            return self.metadata_index.fetch_assay(assay_md)
+        except (OSError, KeyError):
+            # The compiled metadata may since have been replaced, by another
+            # process of a changed data directory.
+            logging.warning("Unable to fetch the assay of %s from %s",
+                            sample, self.metadata_index.path)
+            return assay_md
+
+    def available_bonds(self, samples):
+        """
+        Returns the bonds found in any of `samples`, in the order of the
+        bond vocabulary.
+
+        :param samples: A list of sample names.
+        """
+        rows = [self.sample_rows[sample] for sample in samples]
+        available = self.sample_bond_mask[rows].any(axis=0)
+        return self.bond_vocabulary[available].tolist()
+
+    def frame(self, sample):
+        """Returns the dataframe of `sample`, loading it if needed."""
+        return self.frames.get(sample)
+
+    def add_listener(self, listener):
+        """
+        Calls `listener` with the name of a sample whenever its data file
+        has changed and been reloaded. It is called from the watching
+        thread, and is only held weakly.
+        """
+        self._listeners.add(listener)
+
+    def reload_sample(self, sample):
+        """
+        Drops the dataframe of a sample whose data file has changed, loading
+        it again from only that file if it was held, and notifies the
+        listeners.
+        """
+        if self.frames.invalidate(sample):
+            self.frames.get(sample)
+        for listener in list(self._listeners):
+            try:
+                listener(sample)
+            except Exception:
+                logging.exception("Failed to notify a session of %s", sample)
+
+    def watch(self, interval=WATCH_INTERVAL):
+        """Starts watching the data files of the samples, reloading each as
+        it changes."""
+        if self._watcher is None:
+            self._watcher = FileWatcher(
+                {self.sample_metadata[sample]["dataFile"]["name"]: sample
+                 for sample in self.samples},
+                self.reload_sample,
+                interval).start()
+        return self._watcher
+
+    def stop_watching(self):
+        """Stops watching the data files."""
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def preload(self, executor=None, max_workers=None):
+        """
+        Loads the dataframes of every sample, up to the number of frames the
+        store holds, in parallel. Files that fail to load are logged and
+        skipped, and are loaded again when they are first selected.
+
+        :param executor: 'thread', 'process' or 'serial', see
+            `parallel_load.load_dataframes`.
+        :param max_workers: The size of the pool.
+
+        :returns: The list of `parallel_load.LoadResult`, one per sample.
+        """
+        samples = self.samples
+        if self.frames.max_items is not None:
+            samples = samples[:self.frames.max_items]
+
+        results = load_dataframes(
+            [self.sample_metadata[sample]["dataFile"] for sample in samples],
+            executor=executor,
+            max_workers=max_workers)
+
+        for sample, result in zip(samples, results):
+            if result.error is None:
+                self.frames.put(sample, result.dataframe)
+        return results
+
+
+def init_store(data_path=DATA_PATH, preload=False, metadata=None,
+               watch=WATCH_FILES):
+    """
+    Creates the shared store of this process, replacing any existing one.
+
+    :param data_path: The path to the data directory.
+    :param preload: If True every dataframe is loaded now, rather than when
+        it is first selected.
+    :param metadata: The ISA metadata dictionary to serve, or None to load
+        the compiled metadata of `data_path`.
+    :param watch: If True the data files are watched for changes.
+    """
+    global _STORE
+    store = SharedDataStore(data_path, metadata=metadata)
+    if preload:
+        store.preload()
+    if watch:
+        store.watch()
+    with _STORE_LOCK:
+        if _STORE is not None:
+            _STORE.stop_watching()
+        _STORE = store
+    return store
+
+
+def get_store():
+    """Returns the shared store of this process, creating it if needed."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = SharedDataStore()
+            if WATCH_FILES:
+                _STORE.watch()
+        return _STORE
+
+
+def get_build_executor():
+    """
+    Returns the thread pool shared by every session for loading frames and
+    assembling figure data away from the document thread.
+    """
+    global _BUILD_EXECUTOR
+    with _STORE_LOCK:
+        if _BUILD_EXECUTOR is None:
+            _BUILD_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+                max_workers=BUILD_WORKERS,
+                thread_name_prefix="albokeh-build")
+        return _BUILD_EXECUTOR
@@ -0,0 +1,11 @@
+"""
+The application modules are imported from the repository root, as the
+bokeh server does when it serves the directory.
+"""
+
+import os
+import sys
+
+
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,123 @@
+"""Tests of the columnar on-disk cache of parsed dataframes."""
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from frame_cache import cached_frame, frame_cache_dir, frame_cache_key
+
+
+@pytest.fixture
+def data_file(tmp_path, monkeypatch):
+    monkeypatch.delenv("ALBOKEH_CACHE_DIR", raising=False)
+    path = tmp_path / "d1.RDF"
+    path.write_text("1.0 2.0\n")
+    return str(path)
+
+
+def make_frame():
+    return pd.DataFrame({
+        "r": np.linspace(0.0, 1.0, 5, dtype=np.float64),
+        "RDF_Al-Ob": np.arange(5, dtype=np.float32),
+        "count": np.arange(5, dtype=np.int64),
+        "bond": pd.Categorical(["Al-Ob", "Al-Oh", "Al-Ob", "Al-Oh", "Al-Ob"]),
+        "label": pd.Series(["a", "b", "c", "d", "e"], dtype=object),
+    })
+
+
+def assert_same_frame(cached, expected):
+    # Memory-mapped columns are compared by value, not by array class.
+    for name in expected.columns:
+        pd.testing.assert_series_equal(
+            pd.Series(cached[name].to_numpy(copy=True), name=name,
+                      dtype=cached[name].dtype), expected[name])
+
+
+class CountingReader(object):
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        return self.frame.copy()
+
+
+def test_round_trip_preserves_values_and_dtypes(data_file):
+    reader = CountingReader(make_frame())
+
+    parsed = cached_frame(data_file, "Maxime-RDF", reader)
+    cached = cached_frame(data_file, "Maxime-RDF", reader)
+
+    assert reader.calls == 1
+    assert_same_frame(parsed, make_frame())
+    assert_same_frame(cached, make_frame())
+    assert list(cached.dtypes) == list(make_frame().dtypes)
+
+
+def test_numeric_columns_are_memory_mapped(data_file):
+    reader = CountingReader(make_frame())
+    cached_frame(data_file, "Maxime-RDF", reader)
+
+    cached = cached_frame(data_file, "Maxime-RDF", reader)
+
+    assert isinstance(np.asarray(cached["r"]).base, np.memmap) \
+        or isinstance(cached["r"].values, np.memmap)
+
+
+def test_changed_file_is_parsed_again(data_file):
+    reader = CountingReader(make_frame())
+    cached_frame(data_file, "Maxime-RDF", reader)
+    old_key = frame_cache_key(data_file, "Maxime-RDF")
+
+    time.sleep(0.01)
+    with open(data_file, "a") as rdf_file:
+        rdf_file.write("3.0 4.0\n")
+    reader.frame = make_frame().iloc[:3]
+    cached = cached_frame(data_file, "Maxime-RDF", reader)
+
+    assert reader.calls == 2
+    assert len(cached) == 3
+    # The entry of the previous version of the file is removed.
+    assert os.listdir(frame_cache_dir(data_file)) \
+        == [frame_cache_key(data_file, "Maxime-RDF")]
+    assert old_key not in os.listdir(frame_cache_dir(data_file))
+
+
+def test_reader_settings_change_the_key(data_file):
+    key = frame_cache_key(data_file, "Maxime-RDF")
+
+    assert frame_cache_key(data_file, "Maxime-RDF") == key
+    assert frame_cache_key(data_file, "Maxime-RDF", "float32") != key
+    assert frame_cache_key(data_file, "Plot-CSV-Extract") != key
+    # Every version of the file shares the digest of its path.
+    assert frame_cache_key(data_file, "Maxime-RDF", "float32") \
+        .split("-")[0] == key.split("-")[0]
+
+
+def test_uncacheable_frames_are_not_stored(data_file):
+    reader = CountingReader(make_frame().set_index("label"))
+
+    cached_frame(data_file, "Maxime-RDF", reader)
+    cached_frame(data_file, "Maxime-RDF", reader)
+
+    assert reader.calls == 2
+    assert not os.path.isdir(frame_cache_dir(data_file))
+
+
+def test_corrupt_entries_are_discarded(data_file):
+    reader = CountingReader(make_frame())
+    cached_frame(data_file, "Maxime-RDF", reader)
+    entry = os.path.join(frame_cache_dir(data_file),
+                         frame_cache_key(data_file, "Maxime-RDF"))
+    with open(os.path.join(entry, "meta.json"), "w") as meta_file:
+        meta_file.write("{")
+
+    cached = cached_frame(data_file, "Maxime-RDF", reader)
+
+    assert reader.calls == 2
+    assert_same_frame(cached, make_frame())
@@ -0,0 +1,117 @@
+"""Tests of the bounded least recently used frame store."""
+
+import numpy as np
+import pandas as pd
+
+from frame_store import LRUFrameStore, frame_nbytes
+
+
+class CountingLoader(object):
+
+    def __init__(self, length=10):
+        self.length = length
+        self.loads = list()
+
+    def __call__(self, key):
+        self.loads.append(key)
+        return pd.DataFrame({"r": np.arange(self.length, dtype=np.float64)})
+
+
+def test_frames_are_loaded_once():
+    loader = CountingLoader()
+    store = LRUFrameStore(loader)
+
+    first = store.get("a")
+
+    assert store.get("a") is first
+    assert loader.loads == ["a"]
+    assert store.stats()["hits"] == 1
+    assert store.stats()["misses"] == 1
+
+
+def test_least_recently_used_frames_are_evicted_by_count():
+    loader = CountingLoader()
+    store = LRUFrameStore(loader, max_items=2)
+
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+
+    assert "a" in store and "c" in store
+    assert "b" not in store
+    assert len(store) == 2
+    assert store.stats()["evictions"] == 1
+
+
+def test_frames_are_evicted_by_size():
+    loader = CountingLoader()
+    size = frame_nbytes(loader("size"))
+    store = LRUFrameStore(loader, max_bytes=2 * size)
+
+    for key in "abc":
+        store.get(key)
+
+    assert list(store._frames) == ["b", "c"]
+    assert store.stats()["bytes"] == 2 * size
+
+
+def test_the_latest_frame_is_held_beyond_the_size_bound():
+    store = LRUFrameStore(CountingLoader(), max_bytes=1)
+
+    store.get("a")
+    store.get("b")
+
+    assert "b" in store
+    assert len(store) == 1
+
+
+def test_evicted_frames_are_loaded_again():
+    loader = CountingLoader()
+    store = LRUFrameStore(loader, max_items=1)
+
+    store.get("a")
+    store.get("b")
+    store.get("a")
+
+    assert loader.loads == ["a", "b", "a"]
+
+
+def test_put_replaces_the_held_frame():
+    loader = CountingLoader()
+    store = LRUFrameStore(loader)
+    store.get("a")
+    replacement = pd.DataFrame({"r": np.arange(3, dtype=np.float64)})
+
+    store.put("a", replacement)
+
+    assert store.get("a") is replacement
+    assert store.stats()["bytes"] == frame_nbytes(replacement)
+
+
+def test_invalidate_and_clear_keep_the_counters():
+    loader = CountingLoader()
+    store = LRUFrameStore(loader)
+    store.get("a")
+    store.get("b")
+
+    assert store.invalidate("a")
+    assert not store.invalidate("a")
+    store.get("a")
+    store.clear()
+
+    assert store.stats() == dict(
+        hits=0, misses=3, evictions=0, items=0, bytes=0)
+    assert loader.loads == ["a", "b", "a"]
+
+
+def test_a_loader_may_be_given_per_call():
+    store = LRUFrameStore(None, max_items=2)
+    loader = CountingLoader()
+
+    first = store.get("a", loader)
+
+    assert store.get("a") is first
+    assert store.get("b", loader) is not first
+    assert store.keys() == ["a", "b"]
+    assert loader.loads == ["a", "b"]
@@ -0,0 +1,194 @@
+"""Tests of the incremental registration of data files."""
+
+import json
+import os
+import shutil
+
+import pytest
+
+import md_cache
+from isa_registrar import (REGISTRY_COMMENT, read_registry,
+                           register_data_files, write_registry)
+
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def rdf_document(data_path, names):
+    """A curated document with an RDF assay for each of `names`."""
+    simulated_rdf = {"@id": "#annotation/simulated-rdf",
+                     "annotationValue": "Simulated RDF",
+                     "termAccession": "", "termSource": "Simulated Data"}
+    assays = list()
+    for name in names:
+        stem = os.path.splitext(name)[0]
+        assays.append(dict(
+            measurementType=simulated_rdf,
+            technologyType=simulated_rdf,
+            unitCategories=[],
+            characteristicCategories=[],
+            dataFiles=[{"@id": "#data/" + stem, "comments": [],
+                        "name": os.path.join(data_path, name),
+                        "type": "Maxime-RDF"}],
+            materials=dict(samples=[{"@id": "#sample/" + stem,
+                                     "name": stem}],
+                           otherMaterials=[])))
+    return dict(comments=[], studies=[dict(identifier="rdf",
+                                           assays=assays)])
+
+
+def assay_files(metadata):
+    return sorted(os.path.basename(data_file["name"])
+                  for study in metadata["studies"]
+                  for assay in study["assays"]
+                  for data_file in assay["dataFiles"])
+
+
+def no_changes():
+    return dict(added=[], changed=[], removed=[])
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """A data directory of two RDF files and a plot extract."""
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    for name in ("d1.RDF", "d2.RDF", "zhou_thesis.csv"):
+        shutil.copy(os.path.join(DATA_PATH, name), str(data_path))
+    return str(data_path)
+
+
+@pytest.fixture
+def registered(data_dir):
+    """The curated document of d1.RDF and d2.RDF, registered."""
+    metadata = write_registry(
+        rdf_document(data_dir, ["d1.RDF", "d2.RDF"]), data_dir, "v1")
+    return metadata
+
+
+def test_unregistered_documents_are_seeded_without_adding_files(data_dir):
+    curated = rdf_document(data_dir, ["d1.RDF"])
+
+    metadata, changes = register_data_files(curated, data_dir)
+
+    assert changes == no_changes()
+    assert assay_files(metadata) == ["d1.RDF"]
+    assert sorted(read_registry(metadata)["files"]) \
+        == ["d1.RDF", "d2.RDF", "zhou_thesis.csv"]
+    assert "comments" in curated and not curated["comments"]
+
+    # The files left out of the seeded document stay out.
+    again, changes = register_data_files(metadata, data_dir)
+    assert changes == no_changes()
+    assert assay_files(again) == ["d1.RDF"]
+
+
+def test_registering_again_changes_nothing(registered, data_dir):
+    metadata, changes = register_data_files(registered, data_dir)
+
+    assert changes == no_changes()
+    assert metadata == registered
+    assert read_registry(metadata)["generator"] == "v1"
+
+
+def test_new_rdf_files_are_added_as_assays(registered, data_dir):
+    shutil.copy(os.path.join(DATA_PATH, "d3.RDF"), data_dir)
+
+    metadata, changes = register_data_files(registered, data_dir)
+
+    assert changes == dict(added=["d3.RDF"], changed=[], removed=[])
+    assay = metadata["studies"][0]["assays"][-1]
+    assert assay["materials"]["samples"][0]["name"] == "d3"
+    assert assay["dataFiles"][0]["name"] == os.path.join(data_dir, "d3.RDF")
+    bonds = [category["characteristicType"]["annotationValue"]
+             for category in assay["characteristicCategories"]
+             if category["characteristicType"]["termSource"]
+             == "Inter-atom distances"]
+    assert bonds and all("-" in bond for bond in bonds)
+    # The @ids already in the document are kept.
+    assert metadata["studies"][0]["assays"][:2] \
+        == registered["studies"][0]["assays"]
+    assert register_data_files(metadata, data_dir)[1] == no_changes()
+
+
+def test_removed_files_drop_their_assays(registered, data_dir):
+    os.remove(os.path.join(data_dir, "d2.RDF"))
+
+    metadata, changes = register_data_files(registered, data_dir)
+
+    assert changes == dict(added=[], changed=[], removed=["d2.RDF"])
+    assert assay_files(metadata) == ["d1.RDF"]
+    assert len(metadata["studies"][0]["assays"]) == 1
+
+
+def test_changed_rdf_headers_patch_the_bonds(registered, data_dir):
+    path = os.path.join(data_dir, "d1.RDF")
+    with open(path) as rdf_file:
+        text = rdf_file.read()
+    with open(path, "w") as rdf_file:
+        rdf_file.write(text.replace("RDF_Al-Oh", "RDF_Al-Ow", 1) + "\n")
+
+    metadata, changes = register_data_files(registered, data_dir)
+
+    assert changes == dict(added=[], changed=["d1.RDF"], removed=[])
+    bonds = [category["characteristicType"]["annotationValue"]
+             for category in metadata["studies"][0]["assays"][0][
+                 "characteristicCategories"]]
+    assert "Al-Ow" in bonds and "Al-Oh" not in bonds
+
+
+def test_files_of_another_directory_are_moved(registered, data_dir,
+                                              tmp_path):
+    moved = str(tmp_path / "moved")
+    shutil.copytree(data_dir, moved)
+
+    metadata, changes = register_data_files(registered, moved)
+
+    assert sorted(changes["changed"]) == ["d1.RDF", "d2.RDF"]
+    assert all(data_file["name"].startswith(moved)
+               for assay in metadata["studies"][0]["assays"]
+               for data_file in assay["dataFiles"])
+    assert read_registry(metadata)["data_path"] == moved
+
+
+@pytest.fixture
+def compiled(data_dir, monkeypatch):
+    """Compiles the metadata of `data_dir` with a stand-in generator, and
+    returns the list of directories it was called for."""
+    monkeypatch.delenv("ALBOKEH_CACHE_DIR", raising=False)
+    monkeypatch.setattr(md_cache, "_MEMORY_CACHE", dict())
+    monkeypatch.setattr(md_cache, "generator_version", lambda: "v1")
+    calls = list()
+
+    def create_metadata(data_path):
+        calls.append(data_path)
+        return json.dumps(rdf_document(data_path, ["d1.RDF"]))
+
+    monkeypatch.setattr(md_cache, "create_metadata", create_metadata)
+    md_cache.load_compiled_metadata(data_dir)
+    return calls
+
+
+def test_compiled_metadata_registers_new_files(compiled, data_dir):
+    shutil.copy(os.path.join(DATA_PATH, "d3.RDF"), data_dir)
+
+    metadata = md_cache.load_compiled_metadata(data_dir)
+
+    assert compiled == [data_dir]
+    # The generator left d2.RDF out, only the new file is added.
+    assert assay_files(metadata) == ["d1.RDF", "d3.RDF"]
+
+
+def test_a_changed_generator_rebuilds_the_metadata(compiled, data_dir,
+                                                    monkeypatch):
+    monkeypatch.setattr(md_cache, "generator_version", lambda: "v2")
+    shutil.copy(os.path.join(DATA_PATH, "d3.RDF"), data_dir)
+
+    metadata = md_cache.load_compiled_metadata(data_dir)
+
+    assert compiled == [data_dir, data_dir]
+    assert assay_files(metadata) == ["d1.RDF"]
+    assert read_registry(metadata)["generator"] == "v2"
+    assert [comment["name"] for comment in metadata["comments"]] \
+        == [REGISTRY_COMMENT]
@@ -0,0 +1,116 @@
+"""Tests of the comparison and reloading of changed data files."""
+
+import os
+
+import numpy as np
+import pytest
+
+from live_reload import FileWatcher, apply_column_changes, column_changes
+
+
+def make_data(n_rows=5):
+    r = np.linspace(0.0, 1.0, n_rows)
+    return dict(r=r, RDF_Al_O=r ** 2)
+
+
+def test_unchanged_data_has_no_changes():
+    old = make_data()
+    new = {column: values.copy() for column, values in old.items()}
+    assert column_changes(old, new) == (None, None)
+
+
+def test_equal_nan_values_are_unchanged():
+    old = dict(r=np.array([0.0, np.nan]))
+    assert column_changes(old, dict(r=np.array([0.0, np.nan]))) \
+        == (None, None)
+
+
+def test_appended_rows_are_streamed():
+    old, new = make_data(5), make_data(8)
+    new = {column: np.concatenate([old[column], values[5:]])
+           for column, values in new.items()}
+
+    kind, change = column_changes(old, new)
+
+    assert kind == "stream"
+    assert set(change) == {"r", "RDF_Al_O"}
+    np.testing.assert_array_equal(change["r"], new["r"][5:])
+
+
+def test_appended_rows_with_changed_values_replace_the_data():
+    old = make_data(5)
+    new = {column: np.append(values, 2.0) for column, values in old.items()}
+    new["RDF_Al_O"][0] = -1.0
+
+    kind, change = column_changes(old, new)
+
+    assert kind == "replace"
+    assert change is new
+
+
+def test_few_changed_values_are_patched():
+    old = make_data()
+    new = {column: values.copy() for column, values in old.items()}
+    new["RDF_Al_O"][[1, 3]] = [7.0, 9.0]
+
+    assert column_changes(old, new) == (
+        "patch", {"RDF_Al_O": [(1, 7.0), (3, 9.0)]})
+
+
+def test_many_changed_values_replace_their_columns():
+    old = make_data(10)
+    new = {column: values.copy() for column, values in old.items()}
+    new["RDF_Al_O"] += 1.0
+
+    kind, change = column_changes(old, new, max_patched=4)
+
+    assert kind == "columns"
+    assert list(change) == ["RDF_Al_O"]
+
+
+@pytest.mark.parametrize("new", [
+    make_data(3),
+    dict(make_data(), RDF_Al_Oh=np.zeros(5)),
+])
+def test_shorter_data_or_other_columns_replace_the_data(new):
+    assert column_changes(make_data(5), new) == ("replace", new)
+
+
+def test_list_columns_are_only_replaced():
+    old = dict(xs=[np.arange(3.0)], sample=["a"])
+    new = dict(xs=[np.arange(3.0) + 1], sample=["a"])
+
+    kind, change = column_changes(old, new)
+
+    assert kind == "columns"
+    assert list(change) == ["xs"]
+    assert column_changes(old, dict(old)) == (None, None)
+
+
+def test_patches_do_not_modify_shared_arrays():
+    bokeh_models = pytest.importorskip("bokeh.models")
+    shared = make_data()
+    source = bokeh_models.ColumnDataSource(data=dict(shared))
+    new = {column: values.copy() for column, values in shared.items()}
+    new["RDF_Al_O"][2] = 5.0
+
+    assert apply_column_changes(source, new) == "patch"
+
+    assert source.data["RDF_Al_O"][2] == 5.0
+    assert shared["RDF_Al_O"][2] == make_data()["RDF_Al_O"][2]
+
+
+def test_watcher_reports_a_change_once_it_is_stable(tmp_path):
+    path = tmp_path / "d1.RDF"
+    path.write_text("r RDF\n")
+    reported = list()
+    watcher = FileWatcher({str(path): "d1"}, reported.append)
+
+    path.write_text("r RDF\n0.1 1.0\n")
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert watcher.poll() == []
+    assert watcher.poll() == ["d1"]
+    assert watcher.poll() == []
+    assert reported == ["d1"]
@@ -0,0 +1,99 @@
+"""Tests of the level of detail downsampling of dense curves."""
+
+import numpy as np
+import pytest
+
+from lod import LODPyramid, lttb, minmax_indices
+
+
+def make_curve(length=8000, seed=0):
+    x = np.linspace(0.0, 10.0, length)
+    y = np.random.RandomState(seed).normal(size=length)
+    return x, y
+
+
+def test_minmax_indices_keep_the_extremes_of_every_bin():
+    y = np.array([3.0, 1.0, 2.0, 5.0, 4.0, 0.0, 6.0])
+
+    np.testing.assert_array_equal(
+        minmax_indices([y], 3), [0, 1, 3, 5, 6])
+
+
+def test_minmax_indices_skip_missing_values():
+    y = np.array([np.nan, 1.0, 2.0, np.nan])
+
+    indices = minmax_indices([y], 4)
+
+    np.testing.assert_array_equal(indices, [0, 1, 2, 3])
+
+
+def test_levels_hold_the_union_of_every_column():
+    x, y = make_curve(1024)
+    other = -y[::-1]
+    pyramid = LODPyramid(x, [y, other])
+
+    assert set(minmax_indices([y], 4)) | set(minmax_indices([other], 4)) \
+        == set(pyramid.levels[2])
+
+
+@pytest.mark.parametrize("n_points,n_pixels,level", [
+    (800, 800, 0),
+    (1600, 800, 1),
+    (1601, 800, 2),
+    (8000, 800, 4),
+])
+def test_level_is_the_finest_within_one_pair_per_pixel(
+        n_points, n_pixels, level):
+    x, y = make_curve(100000)
+    pyramid = LODPyramid(x, [y])
+
+    assert pyramid._level_for(n_points, n_pixels) == level
+
+
+def test_select_without_a_range_sends_the_overview():
+    x, y = make_curve()
+    pyramid = LODPyramid(x, [y])
+
+    indices = pyramid.select(None, None, 800)
+
+    assert len(indices) <= 2 * 800
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.argmax(y) in indices and np.argmin(y) in indices
+
+
+def test_select_sends_every_point_of_a_narrow_window():
+    x, y = make_curve()
+    pyramid = LODPyramid(x, [y])
+
+    indices = pyramid.select(x[1000], x[1400], 800)
+
+    assert set(range(1000, 1401)) <= set(indices)
+    assert len(indices) <= 2 * 800 + 402
+    np.testing.assert_array_equal(indices, np.unique(indices))
+
+
+def test_select_accepts_a_reversed_range():
+    x, y = make_curve()
+    pyramid = LODPyramid(x, [y])
+
+    np.testing.assert_array_equal(
+        pyramid.select(x[4000], x[2000], 800),
+        pyramid.select(x[2000], x[4000], 800))
+
+
+def test_short_curves_are_sent_whole():
+    x, y = make_curve(200)
+    pyramid = LODPyramid(x, [y])
+
+    np.testing.assert_array_equal(pyramid.select(None, None, 800),
+                                  np.arange(200))
+
+
+def test_lttb_keeps_the_ends_and_the_number_of_points():
+    x, y = make_curve(1000)
+
+    kept = lttb(x, y, 100)
+
+    assert len(kept) == 100
+    assert kept[0] == 0 and kept[-1] == 999
+    assert np.all(np.diff(kept) > 0)
@@ -0,0 +1,122 @@
+"""Tests of the on-disk cache of compiled metadata."""
+
+import json
+import os
+import shutil
+
+import pytest
+
+import md_cache
+from isa_registrar import read_registry
+
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def rdf_document(data_path):
+    """A stand-in for `generateISA` with an assay for each RDF file."""
+    simulated_rdf = {"annotationValue": "Simulated RDF"}
+    assays = [dict(
+        measurementType=simulated_rdf,
+        technologyType=simulated_rdf,
+        unitCategories=[],
+        characteristicCategories=[],
+        dataFiles=[{"@id": "#data/" + name, "name": os.path.join(
+            data_path, name), "type": "Maxime-RDF"}],
+        materials=dict(samples=[{"@id": "#sample/" + name, "name": name}],
+                       otherMaterials=[]))
+        for name in sorted(os.listdir(data_path)) if name.endswith(".RDF")]
+    return dict(comments=[], studies=[dict(assays=assays)])
+
+
+def compiled_files(cache_path):
+    return sorted(name for name in os.listdir(cache_path)
+                  if name.startswith("metadata-"))
+
+
+@pytest.fixture
+def shared_cache(tmp_path, monkeypatch):
+    """Two data directories sharing a cache directory. Returns the paths of
+    the directories and of the cache, and the list of directories the
+    stand-in generator was called for."""
+    data_paths = list()
+    for name, files in (("a", ["d1.RDF"]), ("b", ["d2.RDF"])):
+        data_path = tmp_path / name
+        data_path.mkdir()
+        for file_name in files:
+            shutil.copy(os.path.join(DATA_PATH, file_name), str(data_path))
+        data_paths.append(str(data_path))
+
+    cache_path = str(tmp_path / "cache")
+    monkeypatch.setenv("ALBOKEH_CACHE_DIR", cache_path)
+    monkeypatch.setattr(md_cache, "_MEMORY_CACHE", dict())
+    monkeypatch.setattr(md_cache, "generator_version", lambda: "v1")
+    calls = list()
+
+    def create_metadata(data_path):
+        calls.append(data_path)
+        return json.dumps(rdf_document(data_path))
+
+    monkeypatch.setattr(md_cache, "create_metadata", create_metadata)
+    return data_paths, cache_path, calls
+
+
+def test_directories_keep_their_own_compiled_metadata(shared_cache,
+                                                      monkeypatch):
+    (data_a, data_b), cache_path, calls = shared_cache
+    md_cache.load_compiled_metadata(data_a)
+    md_cache.load_compiled_metadata(data_b)
+
+    monkeypatch.setattr(md_cache, "_MEMORY_CACHE", dict())
+    metadata_a = md_cache.load_compiled_metadata(data_a)
+    metadata_b = md_cache.load_compiled_metadata(data_b)
+
+    assert calls == [data_a, data_b]
+    assert read_registry(metadata_a)["data_path"] == data_a
+    assert read_registry(metadata_b)["data_path"] == data_b
+    assert [name[:len(md_cache.compiled_prefix(data_a))]
+            for name in compiled_files(cache_path)] \
+        == sorted([md_cache.compiled_prefix(data_a),
+                   md_cache.compiled_prefix(data_b)])
+
+
+def test_changes_are_registered_in_the_same_directory(shared_cache):
+    (data_a, data_b), cache_path, calls = shared_cache
+    md_cache.load_compiled_metadata(data_a)
+    md_cache.load_compiled_metadata(data_b)
+    shutil.copy(os.path.join(DATA_PATH, "d3.RDF"), data_a)
+
+    metadata = md_cache.load_compiled_metadata(data_a)
+
+    # The newest compiled file is that of `data_b`, which is not rebuilt
+    # from, so the new file is registered without building `data_a` again.
+    assert calls == [data_a, data_b]
+    assert read_registry(metadata)["data_path"] == data_a
+    assert sorted(os.path.basename(data_file["name"])
+                  for study in metadata["studies"]
+                  for assay in study["assays"]
+                  for data_file in assay["dataFiles"]) \
+        == ["d1.RDF", "d3.RDF"]
+    assert len(compiled_files(cache_path)) == 2
+
+
+def test_stale_metadata_is_only_served_from_the_same_directory(
+        shared_cache, monkeypatch):
+    (data_a, data_b), cache_path, calls = shared_cache
+    md_cache.load_compiled_metadata(data_a)
+
+    metadata = md_cache.load_compiled_metadata(data_b, allow_stale=True)
+
+    assert calls == [data_a, data_b]
+    assert read_registry(metadata)["data_path"] == data_b
+
+    shutil.copy(os.path.join(DATA_PATH, "d3.RDF"), data_b)
+    monkeypatch.setattr(md_cache, "_MEMORY_CACHE", dict())
+    stale = md_cache.load_compiled_metadata(data_b, allow_stale=True)
+    path = md_cache.compiled_metadata_path(data_b, allow_stale=True)
+
+    assert calls == [data_a, data_b]
+    assert stale == metadata
+    assert os.path.basename(path).startswith(
+        md_cache.compiled_prefix(data_b))
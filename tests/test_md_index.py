@@ -0,0 +1,105 @@
+"""Tests of the assay index against the recursive metadata search."""
+
+import copy
+import os
+
+import pytest
+
+from md_index import AssayIndex, get_assay_index
+from utils import md_reader, read_metadata
+
+
+METADATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "metadata.json")
+
+
+@pytest.fixture(scope="module")
+def metadata():
+    return read_metadata(METADATA_PATH)
+
+
+def field_values(node, found=None):
+    """Returns every hashable (field, value) pair found below `node`."""
+    found = set() if found is None else found
+    for key, value in node.items():
+        if isinstance(value, dict):
+            field_values(value, found)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    field_values(item, found)
+        else:
+            found.add((key, value))
+    return found
+
+
+def as_pairs(found):
+    """Returns the identities of the found dataFiles and assays, in order."""
+    return [(id(item["dataFile"]), id(item["assay_md"])) for item in found]
+
+
+def assert_same_results(metadata, search_dict):
+    indexed = md_reader(metadata, search_dict, use_index=True)
+    crawled = md_reader(metadata, search_dict, use_index=False)
+    assert as_pairs(indexed) == as_pairs(crawled)
+
+
+def test_every_single_term_matches_the_linear_scan(metadata):
+    pairs = set()
+    for study in metadata["studies"]:
+        for assay in study["assays"]:
+            field_values(assay, pairs)
+
+    assert pairs
+    for field, value in sorted(pairs, key=repr):
+        assert_same_results(metadata, {field: value})
+
+
+@pytest.mark.parametrize("search_dict", [
+    {"annotationValue": "Simulated RDF"},
+    {"annotationValue": "Al-Ob", "termSource": "Inter-atom distances"},
+    {"annotationValue": "Al-Ob", "measurementType": "missing"},
+    {"annotationValue": "not in the metadata"},
+    {"characteristicType": {"@id": "missing", "annotationValue": "Al-Ob"}},
+    {},
+])
+def test_search_dicts_match_the_linear_scan(metadata, search_dict):
+    assert_same_results(metadata, search_dict)
+
+
+def test_assays_are_repeated_once_per_matched_term(metadata):
+    found = md_reader(metadata, {
+        "annotationValue": "Simulated RDF",
+        "termSource": "Simulated Data"})
+
+    single = md_reader(metadata, {"annotationValue": "Simulated RDF"})
+    assert single
+    assert len(found) == 2 * len(single)
+
+
+def test_unhashable_values_are_compared_with_the_found_values(metadata):
+    assay = metadata["studies"][0]["assays"][0]
+    measurement = copy.deepcopy(assay["measurementType"])
+
+    index = AssayIndex(metadata)
+
+    assert 0 in index.lookup("measurementType", measurement)
+    assert_same_results(metadata, {"measurementType": measurement})
+
+
+def test_lookup_is_sorted_and_unique(metadata):
+    index = AssayIndex(metadata)
+
+    positions = index.lookup("annotationValue", "Simulated RDF")
+
+    assert positions == sorted(set(positions))
+    assert positions == [
+        position for position, assay in enumerate(index.assays)
+        if assay["measurementType"]["annotationValue"] == "Simulated RDF"]
+
+
+def test_index_is_built_once_per_metadata_dict(metadata):
+    assert get_assay_index(metadata) is get_assay_index(metadata)
+    assert get_assay_index(copy.deepcopy(metadata)) \
+        is not get_assay_index(metadata)
@@ -0,0 +1,124 @@
+"""Tests of the compound metadata queries."""
+
+import pytest
+
+from md_query import And, Match, Not, Or, collect_field_values, \
+    query_from_dict, run_query
+from utils import md_reader
+
+
+def make_assay(name, bonds, platform="LAMMPS", files=None):
+    return {
+        "characteristicCategories": [
+            {"characteristicType": {"annotationValue": bond,
+                                    "termSource": "Inter-atom distances"}}
+            for bond in bonds],
+        "measurementType": {"annotationValue": "Simulated RDF",
+                            "termSource": "Simulated Data"},
+        "technologyPlatform": platform,
+        "dataFiles": [{"@id": "#" + file_name, "name": file_name}
+                      for file_name in (files or [name + ".RDF"])],
+    }
+
+
+@pytest.fixture
+def metadata():
+    return {"studies": [
+        {"assays": [make_assay("a", ["Al-Ob", "Al-Oh"])]},
+        {"assays": [
+            make_assay("b", ["Al-Ob"], platform="Unknown"),
+            make_assay("c", ["Al-Oh"], files=["c.RDF", "a.RDF"]),
+        ]},
+    ]}
+
+
+def found_files(found):
+    return [item["dataFile"]["name"] for item in found]
+
+
+def test_and_requires_every_clause(metadata):
+    query = And(Match("annotationValue", "Al-Ob"),
+                Match("technologyPlatform", "Unknown"))
+
+    assert found_files(run_query(metadata, query)) == ["b.RDF"]
+
+
+def test_or_requires_any_clause(metadata):
+    query = Or(Match("technologyPlatform", "Unknown"),
+               Match("annotationValue", "Al-Oh"))
+
+    assert found_files(run_query(metadata, query)) \
+        == ["a.RDF", "b.RDF", "c.RDF"]
+
+
+def test_not_inverts_its_clause(metadata):
+    query = Not(Match("technologyPlatform", "Unknown"))
+
+    assert found_files(run_query(metadata, query)) == ["a.RDF", "c.RDF"]
+
+
+def test_operators_build_the_same_queries(metadata):
+    built = Match("annotationValue", "Al-Ob") \
+        & ~Match("technologyPlatform", "Unknown") \
+        | Match("dataFiles.name", "c.RDF")
+    explicit = Or(And(Match("annotationValue", "Al-Ob"),
+                      Not(Match("technologyPlatform", "Unknown"))),
+                  Match("dataFiles.name", "c.RDF"))
+
+    assert found_files(run_query(metadata, built)) \
+        == found_files(run_query(metadata, explicit)) \
+        == ["a.RDF", "c.RDF"]
+
+
+def test_match_accepts_a_set_of_values(metadata):
+    query = Match("annotationValue", {"Al-Oh", "missing"})
+
+    assert found_files(run_query(metadata, query)) == ["a.RDF", "c.RDF"]
+
+
+def test_each_data_file_is_listed_once(metadata):
+    query = Match("annotationValue", "Al-Oh") \
+        | Match("measurementType.annotationValue", "Simulated RDF")
+
+    assert found_files(run_query(metadata, query)) \
+        == ["a.RDF", "b.RDF", "c.RDF"]
+
+
+def test_dotted_paths_match_the_trailing_fields(metadata):
+    assay = metadata["studies"][0]["assays"][0]
+
+    found = collect_field_values(assay, {
+        ("measurementType", "annotationValue"),
+        ("characteristicType", "annotationValue"),
+        ("characteristicCategories", "characteristicType", "termSource"),
+        ("annotationValue",),
+    })
+
+    assert found[("measurementType", "annotationValue")] == {"Simulated RDF"}
+    assert found[("characteristicType", "annotationValue")] \
+        == {"Al-Ob", "Al-Oh"}
+    assert found[("characteristicCategories", "characteristicType",
+                  "termSource")] == {"Inter-atom distances"}
+    assert found[("annotationValue",)] == {"Simulated RDF", "Al-Ob", "Al-Oh"}
+
+
+def test_dotted_paths_do_not_match_other_parents(metadata):
+    query = Match("measurementType.annotationValue", "Al-Ob")
+
+    assert run_query(metadata, query) == []
+
+
+def test_query_from_dict_joins_the_terms(metadata):
+    search_dict = {"annotationValue": "Al-Ob",
+                   "technologyPlatform": "Unknown"}
+
+    assert found_files(run_query(metadata, query_from_dict(search_dict))) \
+        == ["a.RDF", "b.RDF"]
+    assert found_files(run_query(
+        metadata, query_from_dict(search_dict, combine=And))) == ["b.RDF"]
+
+
+def test_md_reader_runs_queries(metadata):
+    query = Match("annotationValue", "Al-Ob")
+
+    assert md_reader(metadata, query) == run_query(metadata, query)
@@ -0,0 +1,91 @@
+"""Tests of the streamed metadata index against the parsed document."""
+
+import json
+import os
+
+import pytest
+
+import md_stream
+from md_stream import SUMMARY_FIELDS, MetadataIndex
+from utils import md_reader
+
+
+METADATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "metadata.json")
+
+
+@pytest.fixture(scope="module")
+def document():
+    with open(METADATA_PATH, "r") as md_file:
+        return json.load(md_file)
+
+
+@pytest.fixture(params=["ijson", "json"])
+def index(request, monkeypatch):
+    if request.param == "ijson":
+        pytest.importorskip("ijson")
+    else:
+        monkeypatch.setattr(md_stream, "ijson", None)
+    return MetadataIndex(METADATA_PATH)
+
+
+def summary_terms(document):
+    """Returns every hashable (field, value) pair of the summarized fields
+    of the assays of `document`."""
+    terms = set()
+
+    def crawl(node):
+        for key, value in node.items():
+            if isinstance(value, dict):
+                crawl(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        crawl(item)
+            else:
+                terms.add((key, value))
+
+    for study in document["studies"]:
+        for assay in study["assays"]:
+            crawl({field: assay[field] for field in SUMMARY_FIELDS
+                   if field in assay})
+    return terms
+
+
+def found_files(found):
+    return [item["dataFile"]["name"] for item in found]
+
+
+def test_summarized_fields_match_as_in_the_document(index, document):
+    skeleton = index.to_metadata()
+
+    terms = summary_terms(document)
+    assert ("technologyPlatform", "Unknown") in terms
+    for field, value in sorted(terms, key=repr):
+        assert found_files(md_reader(skeleton, {field: value})) \
+            == found_files(md_reader(document, {field: value}))
+
+
+def test_skeleton_keeps_the_order_of_the_assays(index, document):
+    skeleton = index.to_metadata()
+
+    assert [summary["dataFiles"] for study in skeleton["studies"]
+            for summary in study["assays"]] \
+        == [assay["dataFiles"] for study in document["studies"]
+            for assay in study["assays"]]
+
+
+def test_fetched_assays_are_the_full_assays(index, document):
+    assays = [assay for study in document["studies"]
+              for assay in study["assays"]]
+
+    assert len(index) == len(assays)
+    for summary, assay in zip(index.summaries, assays):
+        assert index.fetch_assay(summary) == assay
+
+
+def test_fetched_assays_are_held(index):
+    summary = index.summaries[-1]
+
+    assert index.fetch_assay(summary) is index.fetch_assay(summary)
@@ -0,0 +1,50 @@
+"""Tests of the data file readers."""
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from pdcsvref import maxime_pws_csv, maxime_rdf_csv, sidecar_path
+
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """A copy of the bundled data files, with its own cache directory."""
+    monkeypatch.delenv("ALBOKEH_CACHE_DIR", raising=False)
+    for name in ("d1.AlO.PWS", "d1.RDF"):
+        shutil.copy(os.path.join(DATA_PATH, name), str(tmp_path))
+    return tmp_path
+
+
+def test_pws_sidecar_is_written_to_the_cache_directory(data_dir):
+    path = str(data_dir / "d1.AlO.PWS")
+
+    parsed = maxime_pws_csv(path)
+    mapped = maxime_pws_csv(path)
+
+    assert sorted(os.listdir(str(data_dir))) \
+        == [".albokeh_cache", "d1.AlO.PWS", "d1.RDF"]
+    assert os.path.exists(sidecar_path(path))
+    assert list(mapped.columns) == list(parsed.columns)
+    np.testing.assert_array_equal(mapped.to_numpy(), parsed.to_numpy())
+    assert (mapped.dtypes == np.float64).all()
+
+
+def test_pws_without_sidecar_writes_nothing(data_dir):
+    maxime_pws_csv(str(data_dir / "d1.AlO.PWS"), sidecar=False)
+
+    assert sorted(os.listdir(str(data_dir))) == ["d1.AlO.PWS", "d1.RDF"]
+
+
+def test_rdf_columns_are_named_from_the_header(data_dir):
+    frame = maxime_rdf_csv(str(data_dir / "d1.RDF"))
+
+    assert frame.columns[0] == "r"
+    assert any(column.startswith("RDF_") for column in frame.columns)
+    assert frame["r"].is_monotonic_increasing
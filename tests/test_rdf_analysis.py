@@ -0,0 +1,136 @@
+"""Tests of the vectorized RDF shell analysis."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import rdf_analysis
+from rdf_analysis import (RESULT_COLUMNS, analyze_frames, analyze_rdfs,
+                          analyze_samples, stack_curves)
+
+
+def two_shell_rdf(r, first=2.0, second=4.0):
+    """An RDF with a tall first shell and a lower second one, with a minimum
+    of zero between them."""
+    return (3.0 * np.exp(-((r - first) / 0.2) ** 2)
+            + 1.5 * np.exp(-((r - second) / 0.3) ** 2))
+
+
+def test_stack_curves_pads_shorter_curves_with_nan():
+    matrix = stack_curves([np.arange(3.0), np.arange(1.0)])
+
+    assert matrix.shape == (2, 3)
+    np.testing.assert_array_equal(matrix[1], [0.0, np.nan, np.nan])
+
+
+def test_shells_of_every_curve_are_found():
+    r = np.linspace(0.0, 6.0, 601)
+    g = np.vstack([two_shell_rdf(r), two_shell_rdf(r, 1.5, 3.5)])
+
+    shells = analyze_rdfs(np.vstack([r, r]), g)
+
+    np.testing.assert_allclose(shells["peak_r"], [2.0, 1.5])
+    np.testing.assert_allclose(shells["second_peak_r"], [4.0, 3.5])
+    assert np.all(shells["min_r"] > shells["peak_r"])
+    assert np.all(shells["min_r"] < shells["second_peak_r"])
+    np.testing.assert_allclose(shells["peak_g"], 3.0, rtol=1e-3)
+
+
+def test_noise_below_the_first_peak_fraction_is_skipped():
+    r = np.linspace(0.0, 6.0, 601)
+    g = two_shell_rdf(r)
+    g[50:53] += [0.0, 0.05, 0.0]
+
+    shells = analyze_rdfs(r[None, :], g[None, :])
+
+    assert shells["peak_r"][0] == pytest.approx(2.0)
+
+
+def test_padded_curves_are_analysed_like_whole_ones():
+    long_r = np.linspace(0.0, 6.0, 601)
+    short_r = long_r[:500]
+    rs = stack_curves([long_r, short_r])
+    gs = stack_curves([two_shell_rdf(long_r), two_shell_rdf(short_r)])
+
+    shells = analyze_rdfs(rs, gs)
+
+    assert shells["peak_r"][0] == shells["peak_r"][1]
+    assert shells["min_r"][0] == shells["min_r"][1]
+
+
+def test_curves_without_shells_are_nan():
+    r = np.linspace(0.0, 6.0, 601)
+    g = np.vstack([np.zeros_like(r), 3.0 * np.exp(-((r - 2.0) / 0.2) ** 2)])
+
+    shells = analyze_rdfs(np.vstack([r, r]), g)
+
+    assert np.isnan(shells["peak_r"][0])
+    assert np.isnan(shells["min_r"][0])
+    # A single shell that decays to a flat zero has no second peak.
+    assert shells["peak_r"][1] == pytest.approx(2.0)
+    assert np.isnan(shells["second_peak_r"][1])
+
+
+def test_rcn_is_read_at_the_first_minimum():
+    r = np.linspace(0.0, 6.0, 601)
+    g = two_shell_rdf(r)
+    rcn = np.cumsum(g) / 100.0
+
+    shells = analyze_rdfs(r[None, :], g[None, :], rcn[None, :])
+
+    min_idx = np.searchsorted(r, shells["min_r"][0])
+    assert shells["rcn_min"][0] == pytest.approx(rcn[min_idx])
+    assert np.isnan(analyze_rdfs(r[None, :], g[None, :])["rcn_min"][0])
+
+
+def test_frames_are_analysed_per_sample_and_bond():
+    r = np.linspace(0.0, 6.0, 601)
+    frames = {
+        "a": pd.DataFrame({"r": r, "RDF_Al-O": two_shell_rdf(r),
+                           "RCN_Al-O": np.cumsum(two_shell_rdf(r))}),
+        "b": pd.DataFrame({"r": r, "RDF_Al-O": two_shell_rdf(r, 1.5, 3.5),
+                           "RDF_Al-H": two_shell_rdf(r, 2.5, 4.5)}),
+    }
+
+    analysis = analyze_frames(frames)
+
+    assert list(analysis.columns) == RESULT_COLUMNS
+    assert list(zip(analysis["sample"], analysis["bond"])) \
+        == [("a", "Al-O"), ("b", "Al-O"), ("b", "Al-H")]
+    assert analysis["rcn_min"].notna().tolist() == [True, False, False]
+
+
+class FakeStore(object):
+    """The parts of the shared store used by the analysis."""
+
+    def __init__(self, paths, frames):
+        self.sample_metadata = {sample: dict(dataFile=dict(name=path))
+                                for sample, path in paths.items()}
+        self.frames = frames
+        self.loaded = list()
+
+    def frame(self, sample):
+        self.loaded.append(sample)
+        return self.frames[sample]
+
+
+def test_samples_are_only_analysed_again_once_changed(tmp_path, monkeypatch):
+    monkeypatch.setattr(rdf_analysis, "_CACHE", type(rdf_analysis._CACHE)())
+    r = np.linspace(0.0, 6.0, 601)
+    paths = dict()
+    for sample in ("a", "b"):
+        path = tmp_path / (sample + ".RDF")
+        path.write_text(sample)
+        paths[sample] = str(path)
+    store = FakeStore(paths, {
+        sample: pd.DataFrame({"r": r, "RDF_Al-O": two_shell_rdf(r)})
+        for sample in paths})
+
+    first = analyze_samples(store, ["b", "a"])
+    again = analyze_samples(store, ["a", "b"])
+    (tmp_path / "a.RDF").write_text("changed")
+    analyze_samples(store, ["a", "b"])
+
+    assert list(first["sample"]) == ["b", "a"]
+    assert list(again["sample"]) == ["a", "b"]
+    assert store.loaded == ["b", "a", "a"]
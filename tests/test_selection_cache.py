@@ -0,0 +1,142 @@
+"""Tests of the selections memoized for every session."""
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import instrument
+import selection_cache
+from frame_store import LRUFrameStore
+from selection_cache import (bond_data, invalidate_sample,
+                             normalize_selection, renderer_specs)
+
+
+class FakeStore(object):
+    """The parts of the shared store used to build selections."""
+
+    def __init__(self, paths, frames=None):
+        self.sample_rows = {sample: row for row, sample in enumerate(paths)}
+        self.sample_metadata = {sample: dict(dataFile=dict(name=path))
+                                for sample, path in paths.items()}
+        self.bond_vocabulary = np.array(["Al-Oh", "Al-Ob"])
+        self.frames = frames or dict()
+        self.loads = list()
+
+    def frame(self, sample):
+        self.loads.append(sample)
+        return self.frames[sample]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LRUFrameStore(None, max_items=16,
+                          sizeof=instrument.column_data_nbytes)
+    monkeypatch.setattr(selection_cache, "SELECTION_CACHE", cache)
+    return cache
+
+
+@pytest.fixture
+def store(tmp_path):
+    paths, frames = dict(), dict()
+    for row, (sample, bonds) in enumerate((("a", ["Al-Oh", "Al-Ob"]),
+                                           ("b", ["Al-Ob"]),
+                                           ("c", ["Al-Oh"]))):
+        path = tmp_path / (sample + ".RDF")
+        path.write_text(sample)
+        paths[sample] = str(path)
+        frame = pd.DataFrame(dict(r=np.arange(3.0) + row))
+        for bond in bonds:
+            frame['RDF_' + bond] = np.arange(3.0) * (row + 1)
+        frame['CN_Al-Ob'] = np.zeros(3)
+        frames[sample] = frame
+    return FakeStore(paths, frames)
+
+
+def test_selections_are_normalized_to_the_store_order(store):
+    samples, bonds = normalize_selection(
+        store, ["c", "b", "c"], ["Al-Hw", "Al-Ob", "Al-Oh"])
+
+    assert samples == ("b", "c")
+    assert bonds == ("Al-Oh", "Al-Ob", "Al-Hw")
+
+
+def test_renderer_specs_skip_missing_curves(cache, store):
+    specs = renderer_specs(store, ("a", "b"), ("Al-Oh", "Al-Ob"))
+
+    assert specs == [("a", "Al-Oh", "a (Al-Oh)"),
+                     ("a", "Al-Ob", "a (Al-Ob)"),
+                     ("b", "Al-Ob", "b (Al-Ob)")]
+
+
+def test_selections_are_only_built_once(cache, store):
+    specs = renderer_specs(store, ("a", "b"), ("Al-Ob",))
+    lines, points = bond_data(store, ("a", "b"), "Al-Ob")
+    loads = list(store.loads)
+
+    assert renderer_specs(store, ("a", "b"), ("Al-Ob",)) == specs
+    again_lines, again_points = bond_data(store, ("a", "b"), "Al-Ob")
+
+    assert store.loads == loads
+    assert again_points["x"] is points["x"]
+    assert again_lines["ys"][1] is lines["ys"][1]
+    assert cache.stats()["hits"] == 2
+
+
+def test_bond_data_packs_the_curves_of_every_sample(cache, store):
+    lines, points = bond_data(store, ("a", "b", "c"), "Al-Ob")
+
+    assert lines["sample"] == ["a", "b"]
+    assert lines["sample_idx"] == [0, 1]
+    np.testing.assert_array_equal(lines["ys"][1], [0.0, 2.0, 4.0])
+    np.testing.assert_array_equal(points["x"], [0, 1, 2, 1, 2, 3])
+    np.testing.assert_array_equal(points["sample_idx"], [0, 0, 0, 1, 1, 1])
+
+
+def test_bond_data_lists_are_copies(cache, store):
+    lines, _ = bond_data(store, ("a", "b"), "Al-Ob")
+    lines["xs"][0] = lines["xs"][0][:1]
+
+    again, _ = bond_data(store, ("a", "b"), "Al-Ob")
+
+    assert len(again["xs"][0]) == 3
+
+
+def test_a_bond_without_curves_has_empty_data(cache, store):
+    lines, points = bond_data(store, ("b",), "Al-Oh")
+
+    assert lines == dict(xs=[], ys=[], sample=[], sample_idx=[])
+    assert points == dict(x=[], y=[], sample_idx=[])
+
+
+def test_changed_data_files_build_the_selection_again(cache, store):
+    bond_data(store, ("a", "b"), "Al-Ob")
+
+    time.sleep(0.01)
+    with open(store.sample_metadata["b"]["dataFile"]["name"], "a") as rdf:
+        rdf.write("changed")
+    store.frames["b"] = store.frames["b"] * 2
+    lines, _ = bond_data(store, ("a", "b"), "Al-Ob")
+
+    np.testing.assert_array_equal(lines["ys"][1], [0.0, 4.0, 8.0])
+
+
+def test_reloaded_samples_drop_their_selections(cache, store):
+    bond_data(store, ("a", "b"), "Al-Ob")
+    bond_data(store, ("a",), "Al-Ob")
+    renderer_specs(store, ("b", "c"), ("Al-Oh",))
+
+    invalidate_sample("b")
+
+    assert [key[1] for key in cache.keys()] == [("a",)]
+
+
+def test_keys_hold_the_version_of_each_data_file(cache, store):
+    bond_data(store, ("a",), "Al-Ob")
+
+    (key,) = cache.keys()
+    path = store.sample_metadata["a"]["dataFile"]["name"]
+    assert key[3] == ((os.path.abspath(path), os.path.getsize(path),
+                       os.stat(path).st_mtime_ns),)
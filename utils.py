@@ -13,11 +13,16 @@ A function that takes a data frame id value, and a desired key and returns the
 key:value pair in some format to be used in Bokeh plotting.
 """
 
-# import os
+import os
 # import sys
+import functools
 import json
 # import pandas
-from pdcsvref import maxime_rdf_csv
+from pdcsvref import get_reader, reader_key
+from frame_cache import cached_frame
+from instrument import timed
+from md_index import get_assay_index
+from md_query import Query, run_query
 
 
 def read_metadata(metadata_path="metadata.json"):
@@ -33,6 +38,20 @@ def read_metadata(metadata_path="metadata.json"):
     return metadata
 
 
+def data_file_version(path):
+    """
+    Returns the version of a data file, which changes with its contents. It
+    is used to key the results derived from a file, so that they are not
+    served once the file has changed.
+
+    :param path: The path of the data file.
+
+    :returns: A tuple of the absolute path, size and mtime of the file.
+    """
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
 def fetch_dataframe_field_vals(dict_to_search, field):
     """
     A recursive function to crawl through a provided ISA dictionary.
@@ -65,16 +84,24 @@ def fetch_dataframe_field_vals(dict_to_search, field):
     return fields_found
 
 
-def md_reader(metadata_dict, search_dict):
+@timed()
+def md_reader(metadata_dict, search_dict, use_index=True):
     """
     Reads a meta-data dictionary and returns a list of pandas data frames that
     match a key:value pair. This is to be used in collecting all datasets
-    that have a desired measurement or other attribute. This is a recursive
-    function.
+    that have a desired measurement or other attribute.
 
     :param metadata_dict: A python dictionary of the metadata to be searched.
 
-    :param search_dict: A dictionary of terms to be matched.
+    :param search_dict: A dictionary of terms to be matched. An assay matches
+        if any one of the terms is found, and its dataFiles are listed once
+        for each term it matches. A `md_query.Query` may be given instead, to
+        combine terms with AND, OR and NOT and to list each dataFile once.
+
+    :param use_index: If True, the matches are looked up in the `AssayIndex`
+        of `metadata_dict`, which is built once per metadata dictionary.
+        Otherwise every assay is crawled recursively for each search term.
+        Both give the same results.
 
     :returns: A list of dictionaries with the datafile path and the assay
     metadata.
@@ -112,6 +139,12 @@ def md_reader(metadata_dict, search_dict):
         - termSource
 
     """
+    if isinstance(search_dict, Query):
+        return run_query(metadata_dict, search_dict)
+
+    if use_index:
+        return _indexed_md_reader(get_assay_index(metadata_dict), search_dict)
+
     found_dict_l = list()
 
     # Iterate through the metadata dictionary. This is done so the assay being
@@ -129,23 +162,58 @@ def md_reader(metadata_dict, search_dict):
     return found_dict_l
 
 
-def create_pandas_dataframe(data_dict):
+def _indexed_md_reader(index, search_dict):
+    """
+    The `AssayIndex` backend of `md_reader()`. The results are ordered, and
+    repeated, exactly as those of the recursive search: by assay, then once
+    for each search term that the assay matches.
+    """
+    matches = [set(index.lookup(attr, val))
+               for attr, val in search_dict.items()]
+
+    found_dict_l = list()
+    for position in sorted(set().union(*matches)):
+        assay = index.assays[position]
+        for matched in matches:
+            if position in matched:
+                for datafile in assay['dataFiles']:
+                    id_path_pair = dict(
+                        dataFile=datafile,
+                        assay_md=assay)
+                    found_dict_l.append(id_path_pair)
+    return found_dict_l
+
+
+@timed(payload=lambda df: df.memory_usage(index=True).sum())
+def create_pandas_dataframe(data_dict, use_cache=True):
     """
     Takes a dataFile entry dictionary and returns a ready to use pandas
     dataframe. The function examines the 'type' attribute of the dictionary,
-    and matches it to a dictionary to get the appropriate keyword arguments
-    that must be passed to pandas read_csv().
-    """
+    and matches it to the reader registered for that type in `pdcsvref`,
+    which is called with the dtypes and parse engine it declares.
 
-    func_ref = {
-        "Maxime-RDF": maxime_rdf_csv
-    }
+    :param data_dict: An ISA dataFile dictionary.
+    :param use_cache: If True the frame is read from, or stored in, the
+        columnar frame cache, and the text file is only parsed when it has
+        changed. See `frame_cache`.
 
+    :raises ValueError: If no reader is registered for the dataFile type.
+    """
     file_isa_type = data_dict.get("type")
     df_path = data_dict.get("name")
 
-    df_creation_func = func_ref.get(file_isa_type)
-    pd_dataframe = df_creation_func(path=df_path)
+    reader_spec = get_reader(file_isa_type)
+    df_creation_func = functools.partial(
+        reader_spec.reader,
+        dtype=reader_spec.dtypes,
+        engine=reader_spec.engine)
+
+    if use_cache:
+        pd_dataframe = cached_frame(
+            df_path, file_isa_type, df_creation_func,
+            reader_key=reader_key(reader_spec))
+    else:
+        pd_dataframe = df_creation_func(path=df_path)
 
     return pd_dataframe
 